@@ -24,6 +24,9 @@ from observability.metrics import RUNS_TOTAL
 # Import Agents
 from agents.data_ingestor import DataIngestorAgent
 from agents.anomaly_stats_agent import AnomalyStatAgent
+from agents.anomaly_writer import AnomalyArtifactWriter
+from agents.anomaly_ranking import DEFAULT_TOP_K, ScoreCalibration, TopKRanker
+from agents.detector_registry import DEFAULT_DETECTORS, DetectorRunner
 from agents.anomaly_llm_agent import AnomalyExplainerAgent
 from agents.action_agent import ActionAgent
 
@@ -193,24 +196,60 @@ class A2ACoordinator:
         return self._execute_task(logic, ctx, csv_path)
 
     @timeit_span("coordinator.detect")
-    def run_detect(self, snapshot_path: str) -> List[Dict]:
+    def run_detect(
+        self,
+        snapshot_path: str,
+        detectors: Optional[List[Dict]] = None,
+        top_k: int = DEFAULT_TOP_K,
+    ) -> List[Dict]:
         ctx = TaskContext(self.run_id, self.run_id, "Detector", timeout_seconds=60)
+        calibration_file = self.output_dir / "score_calibration.json"
 
         def logic(path):
             import pandas as pd
 
             df = pd.read_parquet(path)
             detector = AnomalyStatAgent(df)
-            detector.detect_global_zscore()
-            detector.detect_grouped_iqr(group_col="Region")
+            # Scores are rated against every earlier run's scores per detector
+            calibration = ScoreCalibration.load(calibration_file)
+
             out_file = self.run_dir / "anomalies.json"
+            detector.stream_to(
+                str(out_file), ranker=TopKRanker(top_k, calibration=calibration)
+            )
+            # Tasks already run on a worker thread: forking a process pool
+            # from here could copy locks held by other threads
+            DetectorRunner(detector, executor="thread").run(
+                detectors or DEFAULT_DETECTORS
+            )
             detector.save_payload(str(out_file))
             self._add_artifact("anomalies", str(out_file))
-
-            with open(out_file) as f:
-                return json.load(f).get("top_anomalies", [])
-
-        return self._execute_task(logic, ctx, snapshot_path)
+            self._add_artifact("anomalies_jsonl", str(out_file.with_suffix(".jsonl")))
+            self._add_artifact(
+                "anomalies_parquet", str(out_file.with_suffix(".parquet"))
+            )
+
+            # One record per episode goes on to explanation and action: the
+            # top_k episodes by calibrated severity, one per entity
+            episodes_file = self.run_dir / "episodes.json"
+            ranker = TopKRanker(top_k)
+            with AnomalyArtifactWriter(str(episodes_file), ranker=ranker) as writer:
+                detector.consolidate_anomalies(calibration=calibration).attach(writer)
+            self._add_artifact("episodes", str(episodes_file))
+
+            hits = detector.anomalies.to_frame(with_context=False)
+            return ranker.top(), hits, calibration
+
+        result = self._execute_task(logic, ctx, snapshot_path)
+        if result is None:
+            return None
+        # Only the attempt whose result was accepted feeds the calibration: a
+        # timed-out attempt keeps running in its thread but never gets here.
+        # update() skips hits it has merged before (a re-run of the snapshot)
+        episodes, hits, calibration = result
+        if calibration.update(hits):
+            calibration.save(calibration_file)
+        return episodes
 
     @timeit_span("coordinator.explain")
     def run_explain(self, anomalies: List[Dict], workers: int) -> List[Dict]:
@@ -219,18 +258,10 @@ class A2ACoordinator:
         def logic(anoms):
             if not anoms:
                 return []
-            results = []
-
-            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-                futures = {
-                    executor.submit(self.explainer.batch_explain, [a]): a for a in anoms
-                }
-                for future in concurrent.futures.as_completed(futures):
-                    try:
-                        res = future.result()
-                        results.extend(res)
-                    except Exception as e:
-                        logger.error(f"Partial Explain Failure: {e}")
+            # One event loop; `workers` bounds the requests in flight
+            results = self.explainer.explain_concurrently(
+                anoms, max_concurrency=workers
+            )
 
             out_file = self.run_dir / "enriched_anomalies.json"
             with open(out_file, "w") as f:
@@ -274,8 +305,12 @@ class A2ACoordinator:
             workers = flow_config.get("parallelism", 3)
 
             snap = self.run_ingest(csv_path)
-            anoms = self.run_detect(snap)
-            enriched = self.run_explain(anoms[:5], workers)
+            anoms = self.run_detect(
+                snap,
+                flow_config.get("detectors"),
+                flow_config.get("top_k", DEFAULT_TOP_K),
+            )
+            enriched = self.run_explain(anoms, workers)
 
             if flow_config.get("confirm_actions", True) and not self.dry_run:
                 self.run_act(enriched)
@@ -0,0 +1,127 @@
+"""
+agents/anomaly_consolidation.py
+Cross-detector deduplication and episode clustering.
+
+Raw detector hits are keyed on (entity_id, metric). Within a key,
+hits whose periods overlap or lie within `gap_days` of each other form one
+episode, so the same spike flagged by zscore, iqr and pct_spike (or a run of
+adjacent days) becomes a single record. Severity is normalised per detector
+(percentile rank of the raw score among that detector's hits) and combined
+across detectors as a noisy-OR, so corroborated episodes rank higher.
+Everything runs as sorts and groupbys over the hit table.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Level is left out: detectors label the same entity's level differently
+# (e.g. pct_* hits are always "category")
+KEY_COLUMNS = ["entity_id", "metric"]
+
+
+def detector_percentiles(frame: pd.DataFrame) -> np.ndarray:
+    """
+    Percentile of each hit's score among its detector's hits, as rank/(n+1)
+    (ties share their average rank), so it stays inside (0, 1).
+    """
+    by_detector = frame.groupby("detector", sort=False)["score"]
+    rank = by_detector.rank(method="average")
+    return (rank / (by_detector.transform("count") + 1)).fillna(0.0).to_numpy()
+
+
+def assign_episodes(frame: pd.DataFrame, gap_days: int = 1) -> np.ndarray:
+    """
+    Episode number per hit (0..n_episodes-1, in chronological key order).
+    A hit starts a new episode when its key changes or its period starts more
+    than `gap_days` after every earlier period of the same key has ended.
+    """
+    key = frame.groupby(KEY_COLUMNS, sort=False).ngroup().to_numpy()
+    start = pd.to_datetime(frame["period_start"], format="%Y-%m-%d").to_numpy()
+    end = pd.to_datetime(frame["period_end"], format="%Y-%m-%d").to_numpy()
+    order = np.lexsort((start, key))
+    key, start, end = key[order], start[order], end[order]
+
+    reach = pd.Series(end).groupby(key).cummax().to_numpy()
+    prev_reach = np.r_[np.datetime64("NaT"), reach[:-1]]
+    gap = np.timedelta64(gap_days, "D")
+    new = np.r_[True, key[1:] != key[:-1]] | (start > prev_reach + gap)
+
+    episode = np.empty(len(frame), dtype=np.int64)
+    episode[order] = np.cumsum(new) - 1
+    return episode
+
+
+def consolidate(
+    frame: pd.DataFrame,
+    gap_days: int = 1,
+    percentiles: Optional[np.ndarray] = None,
+) -> Tuple[pd.DataFrame, Dict[str, List[Any]]]:
+    """
+    Merges raw hits (an AnomalyTable.to_frame()) into episodes.
+    `percentiles` overrides the per-hit detector percentiles (e.g. calibrated
+    against earlier runs); by default they are ranks within `frame`.
+    Returns the episode columns (RECORD_COLUMNS minus anomaly_id, plus
+    `severity` and `hits`) and the per-episode context columns.
+    """
+    if frame.empty:
+        return pd.DataFrame(), {}
+    hits = frame.reset_index(drop=True).copy()
+    for col in ("period_start", "period_end"):
+        hits[col] = pd.to_datetime(hits[col], format="%Y-%m-%d")
+    hits["percentile"] = (
+        detector_percentiles(hits) if percentiles is None else np.asarray(percentiles)
+    )
+    hits["episode"] = assign_episodes(hits, gap_days)
+
+    # Noisy-OR of each detector's strongest hit in the episode
+    best = hits.groupby(["episode", "detector"], sort=False).agg(
+        percentile=("percentile", "max"), score=("score", "max")
+    )
+    miss = np.log(np.clip(1.0 - best["percentile"].to_numpy(), 1e-12, None))
+    severity = 1.0 - np.exp(
+        pd.Series(miss).groupby(best.index.get_level_values(0)).sum().sort_index()
+    )
+
+    grouped = hits.groupby("episode", sort=True)
+    strongest = hits.loc[grouped["percentile"].idxmax().to_numpy()]
+    episodes = pd.DataFrame(
+        {
+            "level": strongest["level"].to_numpy(),
+            "entity_id": strongest["entity_id"].to_numpy(),
+            "metric": strongest["metric"].to_numpy(),
+            "period_start": grouped["period_start"].min().dt.strftime("%Y-%m-%d"),
+            "period_end": grouped["period_end"].max().dt.strftime("%Y-%m-%d"),
+            "value": strongest["value"].to_numpy(),
+            "expected": strongest["expected"].to_numpy(),
+            "severity": severity.to_numpy(),
+            "hits": grouped.size().to_numpy(),
+        }
+    )
+
+    # Evidence: member ids in detection order, strongest raw score per detector
+    members = np.argsort(hits["episode"].to_numpy(), kind="stable")
+    member_ids = hits["anomaly_id"].to_numpy()[members].tolist()
+    bounds = np.r_[0, np.cumsum(episodes["hits"].to_numpy())].tolist()
+    ids = [member_ids[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+    per_detector: List[Dict[str, float]] = [{} for _ in range(len(episodes))]
+    for (ep, det), score in best["score"].sort_index().items():
+        per_detector[ep][det] = score
+    episodes["detector"] = ["+".join(sorted(d)) for d in per_detector]
+    episodes["reason"] = [
+        f"{n} hit(s) from {len(d)} detector(s); strongest: {r}"
+        for n, d, r in zip(
+            episodes["hits"].tolist(), per_detector, strongest["reason"].tolist()
+        )
+    ]
+
+    span = (grouped["period_end"].max() - grouped["period_start"].min()).dt.days + 1
+    context = {
+        "severity": np.round(episodes["severity"].to_numpy(), 4),
+        "hits": episodes["hits"].to_numpy(),
+        "days": span.to_numpy(),
+        "detector_scores": per_detector,
+        "anomaly_ids": ids,
+    }
+    return episodes, context
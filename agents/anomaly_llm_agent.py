@@ -6,6 +6,8 @@ Features:
 - RAG (Retrieval Augmented Generation) using Memory Bank
 - Strict JSON Schema Validation
 - Robust Error Handling (Retries, Backoff, Circuit Breaker)
+- Async Batch Path (Semaphore-bounded, Shared Rate Limit, Per-request Timeouts)
+- Response Cache (anomaly facts + model + version, TTL, LRU eviction)
 - Full Observability (Audit Logs + Raw Responses + Token Est.)
 - Cost/Rate Limiting
 - PII Redaction
@@ -13,10 +15,12 @@ Features:
 
 import os
 import time
+import asyncio
 import json
 import random
 import hashlib
 import logging
+import threading
 from pathlib import Path
 from datetime import datetime, timezone
 from typing import Dict, Any, List, Tuple, Optional
@@ -28,14 +32,33 @@ from google.genai import types
 
 # RAG Import
 from agents.memory_agent import MemoryAgent
+from agents.llm_response_cache import ResponseCache
 
 # Observability
 from observability.logger import timeit_span, get_logger
-from observability.metrics import LLM_CALLS, LLM_LATENCY
+from observability.metrics import LLM_CACHE, LLM_CALLS, LLM_LATENCY
 
 logger = get_logger("AnomalyExplainerAgent")
 
 
+class AsyncRateLimiter:
+    """
+    Spaces request starts at least 1/rate seconds apart across every task on
+    the event loop (slots are handed out in arrival order).
+    """
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
 class AnomalyExplainerAgent:
 
     MAX_RETRIES = 3
@@ -43,8 +66,61 @@ class AnomalyExplainerAgent:
     MAX_DELAY = 30.0
     CIRCUIT_BREAKER_THRESHOLD = 5
     BATCH_DELAY = 1.0
+    MAX_CONCURRENCY = 16
+    REQUESTS_PER_SECOND = 5.0
+    REQUEST_TIMEOUT = 30.0
     MAX_PROMPT_CHARS = 7777
     EXPLANATION_VERSION = "1.1"
+    CACHE_TTL_SECONDS = 7 * 24 * 3600
+    CACHE_MAX_ENTRIES = 5000
+    # Raw facts an explanation is cached under. The score (calibrated for
+    # episodes) and context["severity"] move with the score history between
+    # runs over the same data, so they stay out of the key
+    CACHE_KEY_FIELDS = (
+        "level",
+        "entity_id",
+        "metric",
+        "period_start",
+        "period_end",
+        "value",
+        "expected",
+        "detector",
+        "reason",
+    )
+    CACHE_KEY_EXCLUDED_CONTEXT = ("severity",)
+
+    # Any edit changes the cache key (see _cache_key), so no version to bump
+    PROMPT_TEMPLATE = """
+You are a Senior SalesOps Analyst. Analyze this sales anomaly.
+
+DATA CONTEXT:
+- Entity: {entity} ({level})
+- Metric: {metric}
+- Value: {value:,.2f}
+- Expected: {expected:,.2f}
+- Score: {score:.2f}
+
+STATISTICAL CONTEXT:
+{context}
+
+HISTORICAL CONTEXT (From Memory Bank):
+{history}
+
+OUTPUT FORMAT:
+Return valid JSON with these exact keys:
+{{
+    "explanation_short": "1 sentence summary",
+    "explanation_full": "2-3 sentence detailed analysis. Reference history if relevant.",
+    "suggested_actions": ["Action 1", "Action 2"],
+    "confidence": "High/Medium/Low",
+    "needs_human_review": boolean
+}}
+
+CONSTRAINT:
+- Rely ONLY on provided numbers and history.
+- Do NOT invent external events.
+- Output pure JSON (no markdown).
+"""
 
     REQUIRED_KEYS = [
         "explanation_short",
@@ -58,6 +134,8 @@ class AnomalyExplainerAgent:
         self,
         model_name: str = "gemini-2.5-flash-lite",
         dry_run: bool = False,
+        use_cache: bool = True,
+        cache_dir: Optional[str] = None,
     ):
         load_dotenv()
         if "GOOGLE_API_KEY" not in os.environ and not dry_run:
@@ -79,7 +157,10 @@ class AnomalyExplainerAgent:
 
         # Find project root relative to this file (agents/anomaly_llm_agent.py -> ../.. -> root)
         project_root = Path(__file__).resolve().parent.parent
-        self.audit_dir = project_root / "outputs" / "observability"
+        # OBSERVABILITY_DIR overrides it, as for the JSON logs and traces
+        self.audit_dir = Path(
+            os.getenv("OBSERVABILITY_DIR", project_root / "outputs" / "observability")
+        )
 
         self.response_dir = self.audit_dir / "responses"
         self.audit_file = self.audit_dir / "llm_calls.jsonl"
@@ -87,6 +168,17 @@ class AnomalyExplainerAgent:
         # Ensure directories exist immediately
         self.audit_dir.mkdir(parents=True, exist_ok=True)
         self.response_dir.mkdir(parents=True, exist_ok=True)
+        # The async path writes audit records from worker threads
+        self._audit_lock = threading.Lock()
+
+        # Dry runs never reach the model, so there is nothing to cache
+        self.cache = None
+        if use_cache and not self.dry_run:
+            self.cache = ResponseCache(
+                cache_dir or self.audit_dir / "response_cache",
+                ttl_seconds=self.CACHE_TTL_SECONDS,
+                max_entries=self.CACHE_MAX_ENTRIES,
+            )
 
     def _redact_pii(self, text: str) -> str:
         if not text:
@@ -107,72 +199,65 @@ class AnomalyExplainerAgent:
             return full_str[:2000] + "...(truncated)"
         return full_str
 
-    def _construct_prompt(self, record: Dict[str, Any]) -> str:
-        entity = self._redact_pii(record.get("entity_id", "Unknown"))
-        context_str = self._truncate_context(record.get("context", {}))
-
-        historical_context = "No history available."
-        if self.memory:
-            try:
-                historical_context = self.memory.retrieve_relevant_history(record)
-            except Exception as e:
-                logger.warning(f"RAG Retrieval Failed: {e}")
-
-        prompt = f"""
-You are a Senior SalesOps Analyst. Analyze this sales anomaly.
-
-DATA CONTEXT:
-- Entity: {entity} ({record.get('level', 'global')})
-- Metric: {record.get('metric', 'Sales')}
-- Value: {record.get('value', 0):,.2f}
-- Expected: {record.get('expected', 0):,.2f}
-- Score: {record.get('score', 0):.2f}
-
-STATISTICAL CONTEXT:
-{context_str}
-
-HISTORICAL CONTEXT (From Memory Bank):
-{historical_context}
-
-OUTPUT FORMAT:
-Return valid JSON with these exact keys:
-{{
-    "explanation_short": "1 sentence summary",
-    "explanation_full": "2-3 sentence detailed analysis. Reference history if relevant.",
-    "suggested_actions": ["Action 1", "Action 2"],
-    "confidence": "High/Medium/Low",
-    "needs_human_review": boolean
-}}
-
-CONSTRAINT:
-- Rely ONLY on provided numbers and history.
-- Do NOT invent external events.
-- Output pure JSON (no markdown).
-"""
+    def _retrieve_history(self, record: Dict[str, Any]) -> str:
+        """Memory-bank context for the prompt (also part of the cache key)."""
+        if not self.memory:
+            return "No history available."
+        try:
+            return self.memory.retrieve_relevant_history(record)
+        except Exception as e:
+            logger.warning(f"RAG Retrieval Failed: {e}")
+            return "No history available."
+
+    def _construct_prompt(
+        self, record: Dict[str, Any], history: Optional[str] = None
+    ) -> str:
+        if history is None:
+            history = self._retrieve_history(record)
+        prompt = self.PROMPT_TEMPLATE.format(
+            entity=self._redact_pii(record.get("entity_id", "Unknown")),
+            level=record.get("level", "global"),
+            metric=record.get("metric", "Sales"),
+            value=record.get("value", 0),
+            expected=record.get("expected", 0),
+            score=record.get("score", 0),
+            context=self._truncate_context(record.get("context", {})),
+            history=history,
+        )
         return prompt.strip()[: self.MAX_PROMPT_CHARS]
 
     def _save_audit(self, record_id, prompt, response_obj, latency, status, error=None):
+        with self._audit_lock:
+            self._write_audit(
+                record_id, prompt, response_obj, latency, status, error=error
+            )
+
+    def _write_audit(
+        self, record_id, prompt, response_obj, latency, status, error=None
+    ):
         ts = datetime.now(timezone.utc).isoformat()
         prompt_hash = hashlib.md5(prompt.encode()).hexdigest()
         est_tokens = len(prompt) // 4
 
-        # 1. Save Raw Response
+        # 1. Save Raw Response (a cache hit's response is already on disk)
+        cache_hit = status == "CACHE_HIT"
         raw_file = self.response_dir / f"{prompt_hash}.json"
-        try:
-            with open(raw_file, "w") as f:
-                json.dump(
-                    {
-                        "id": record_id,
-                        "timestamp": ts,
-                        "prompt": prompt,
-                        "response": response_obj,
-                        "error": str(error) if error else None,
-                    },
-                    f,
-                    indent=2,
-                )
-        except Exception as e:
-            logger.error(f"Failed to save raw response: {e}")
+        if not cache_hit:
+            try:
+                with open(raw_file, "w") as f:
+                    json.dump(
+                        {
+                            "id": record_id,
+                            "timestamp": ts,
+                            "prompt": prompt,
+                            "response": response_obj,
+                            "error": str(error) if error else None,
+                        },
+                        f,
+                        indent=2,
+                    )
+            except Exception as e:
+                logger.error(f"Failed to save raw response: {e}")
 
         # 2. Append to JSONL Audit Log
         entry = {
@@ -182,7 +267,8 @@ CONSTRAINT:
             "model": self.model_name,
             "latency_ms": round(latency * 1000, 2),
             "status": status,
-            "est_tokens": est_tokens,
+            "cache_hit": cache_hit,
+            "est_tokens": 0 if cache_hit else est_tokens,
             "error_type": type(error).__name__ if error else None,
         }
         try:
@@ -217,16 +303,48 @@ CONSTRAINT:
             validated["schema_error"] = f"Missing: {','.join(missing)}"
         return validated
 
+    def _parse_response(self, response) -> Dict[str, Any]:
+        if hasattr(response, "text"):
+            text_resp = response.text
+        elif hasattr(response, "output"):
+            text_resp = str(response.output)
+        else:
+            text_resp = str(response)
+
+        clean_text = text_resp.strip()
+        if clean_text.startswith("```"):
+            lines = clean_text.splitlines()
+            if lines[0].startswith("```"):
+                lines = lines[1:]
+            if lines and lines[-1].strip() == "```":
+                lines = lines[:-1]
+            clean_text = "\n".join(lines)
+
+        parsed = json.loads(clean_text)
+        return self._validate_response_schema(parsed)
+
+    def _dry_run_response(self) -> Dict[str, Any]:
+        return {
+            "explanation_short": "[DRY RUN]",
+            "explanation_full": "Mock explanation.",
+            "suggested_actions": ["Mock Action"],
+            "confidence": "High",
+            "needs_human_review": False,
+        }
+
+    @staticmethod
+    def _is_fatal(error: Exception) -> bool:
+        err_str = str(error)
+        return "400" in err_str or "401" in err_str or "403" in err_str
+
+    def _backoff(self, attempts: int) -> float:
+        wait = min(self.MAX_DELAY, self.BASE_DELAY * (2 ** (attempts - 1)))
+        return wait + random.uniform(0, 0.5)
+
     @timeit_span("llm.call")
     def _call_llm_safe(self, prompt: str) -> Tuple[Dict[str, Any], float]:
         if self.dry_run:
-            return {
-                "explanation_short": "[DRY RUN]",
-                "explanation_full": "Mock explanation.",
-                "suggested_actions": ["Mock Action"],
-                "confidence": "High",
-                "needs_human_review": False,
-            }, 0.0
+            return self._dry_run_response(), 0.0
 
         attempts = 0
         last_error = None
@@ -245,42 +363,138 @@ CONSTRAINT:
 
                 LLM_CALLS.labels(model=self.model_name, status="success").inc()
                 LLM_LATENCY.labels(model=self.model_name).observe(latency * 1000)
+                return self._parse_response(response), latency
 
-                if hasattr(response, "text"):
-                    text_resp = response.text
-                elif hasattr(response, "output"):
-                    text_resp = str(response.output)
-                else:
-                    text_resp = str(response)
+            except Exception as e:
+                attempts += 1
+                last_error = e
+                LLM_CALLS.labels(model=self.model_name, status="error").inc()
 
-                clean_text = text_resp.strip()
-                if clean_text.startswith("```"):
-                    lines = clean_text.splitlines()
-                    if lines[0].startswith("```"):
-                        lines = lines[1:]
-                    if lines and lines[-1].strip() == "```":
-                        lines = lines[:-1]
-                    clean_text = "\n".join(lines)
+                if self._is_fatal(e):
+                    logger.error(f"Fatal Error: {e}")
+                    raise e
+
+                time.sleep(self._backoff(attempts))
+
+        raise last_error or Exception("Max retries exceeded")
 
-                parsed = json.loads(clean_text)
-                validated = self._validate_response_schema(parsed)
-                return validated, latency
+    async def _call_llm_async(
+        self, prompt: str, limiter: AsyncRateLimiter
+    ) -> Tuple[Dict[str, Any], float]:
+        """
+        _call_llm_safe on the async client: every attempt waits for a rate
+        limit slot and is cancelled after REQUEST_TIMEOUT seconds.
+        """
+        if self.dry_run:
+            return self._dry_run_response(), 0.0
+
+        attempts = 0
+        last_error = None
+
+        while attempts < self.MAX_RETRIES:
+            try:
+                await limiter.acquire()
+                start_time = time.time()
+                LLM_CALLS.labels(model=self.model_name, status="attempt").inc()
+
+                response = await asyncio.wait_for(
+                    self.model.api_client.aio.models.generate_content(
+                        model=self.model_name,
+                        contents=prompt,
+                        config={"response_mime_type": "application/json"},
+                    ),
+                    timeout=self.REQUEST_TIMEOUT,
+                )
+                latency = time.time() - start_time
+
+                LLM_CALLS.labels(model=self.model_name, status="success").inc()
+                LLM_LATENCY.labels(model=self.model_name).observe(latency * 1000)
+                return self._parse_response(response), latency
 
             except Exception as e:
                 attempts += 1
                 last_error = e
                 LLM_CALLS.labels(model=self.model_name, status="error").inc()
 
-                err_str = str(e)
-                if "400" in err_str or "401" in err_str or "403" in err_str:
+                if self._is_fatal(e):
                     logger.error(f"Fatal Error: {e}")
                     raise e
 
-                wait = min(self.MAX_DELAY, self.BASE_DELAY * (2 ** (attempts - 1)))
-                time.sleep(wait + random.uniform(0, 0.5))
+                await asyncio.sleep(self._backoff(attempts))
 
         raise last_error or Exception("Max retries exceeded")
 
+    def _cache_key(self, record: Dict[str, Any], history: str) -> str:
+        """
+        Hash of what the prompt is built from: the anomaly's raw facts
+        (CACHE_KEY_FIELDS plus its context minus calibrated values), the
+        prompt template and the retrieved memory-bank history; plus model and
+        version. New history or a template edit is a miss, not a replay.
+        """
+        context = record.get("context") or {}
+        facts = {k: record.get(k) for k in self.CACHE_KEY_FIELDS}
+        facts["context"] = {
+            k: v for k, v in context.items() if k not in self.CACHE_KEY_EXCLUDED_CONTEXT
+        }
+        facts["template"] = hashlib.sha256(self.PROMPT_TEMPLATE.encode()).hexdigest()
+        facts["history"] = hashlib.sha256(history.encode()).hexdigest()
+        content = json.dumps(facts, sort_keys=True, default=str)
+        return ResponseCache.key(content, self.model_name, self.EXPLANATION_VERSION)
+
+    def _cached_response(
+        self, record: Dict[str, Any], history: str
+    ) -> Optional[Dict[str, Any]]:
+        """Earlier validated response for the same prompt inputs, model and version."""
+        if self.cache is None:
+            return None
+        data = self.cache.get(self._cache_key(record, history))
+        result = "hit" if data is not None else "miss"
+        LLM_CACHE.labels(model=self.model_name, result=result).inc()
+        return data
+
+    def _cache_response(self, record: Dict[str, Any], history: str, data: Dict):
+        # Schema-repaired responses are not worth replaying
+        if self.cache is None or "schema_error" in data:
+            return
+        self.cache.put(
+            self._cache_key(record, history),
+            data,
+            model=self.model_name,
+            version=self.EXPLANATION_VERSION,
+        )
+
+    def _record_success(self, rec, history, anomaly_id, prompt, data, latency):
+        self._save_audit(anomaly_id, prompt, data, latency, "SUCCESS")
+        self._cache_response(rec, history, data)
+
+    def _enrich(
+        self, rec: Dict, data: Dict, latency: float, cached: bool = False
+    ) -> Dict[str, Any]:
+        enriched = rec.copy()
+        enriched.update(data)
+        enriched["meta"] = {
+            "model": self.model_name,
+            "latency_ms": int(latency * 1000),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "version": self.EXPLANATION_VERSION,
+            "cached": cached,
+        }
+        return enriched
+
+    @staticmethod
+    def _failed(rec: Dict, error: Exception) -> Dict[str, Any]:
+        err_rec = rec.copy()
+        err_rec["error"] = str(error)
+        return err_rec
+
+    @staticmethod
+    def _skipped(rec: Dict) -> Dict[str, Any]:
+        skipped_rec = rec.copy()
+        skipped_rec["error"] = "SKIPPED"
+        skipped_rec["skipped"] = True
+        skipped_rec["skipped_reason"] = "Circuit Breaker Tripped"
+        return skipped_rec
+
     @timeit_span("explainer.batch")
     def batch_explain(self, anomalies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         results = []
@@ -289,43 +503,111 @@ CONSTRAINT:
 
         for i, rec in enumerate(anomalies):
             if circuit_open:
-                skipped_rec = rec.copy()
-                skipped_rec["error"] = "SKIPPED"
-                skipped_rec["skipped"] = True
-                skipped_rec["skipped_reason"] = "Circuit Breaker Tripped"
-                results.append(skipped_rec)
+                results.append(self._skipped(rec))
                 continue
 
             anomaly_id = rec.get("anomaly_id", f"row_{i}")
-            prompt = self._construct_prompt(rec)
+            history = self._retrieve_history(rec)
+            prompt = self._construct_prompt(rec, history)
+
+            cached = self._cached_response(rec, history)
+            if cached is not None:
+                self._save_audit(anomaly_id, prompt, cached, 0.0, "CACHE_HIT")
+                results.append(self._enrich(rec, cached, 0.0, cached=True))
+                failures = 0
+                continue
 
             try:
                 if not self.dry_run:
                     time.sleep(self.BATCH_DELAY)
 
                 data, latency = self._call_llm_safe(prompt)
-                self._save_audit(anomaly_id, prompt, data, latency, "SUCCESS")
-
-                enriched = rec.copy()
-                enriched.update(data)
-                enriched["meta"] = {
-                    "model": self.model_name,
-                    "latency_ms": int(latency * 1000),
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                    "version": self.EXPLANATION_VERSION,
-                }
-                results.append(enriched)
+                self._record_success(rec, history, anomaly_id, prompt, data, latency)
+                results.append(self._enrich(rec, data, latency))
                 failures = 0
 
             except Exception as e:
                 logger.error(f"Failed {anomaly_id}: {e}")
                 self._save_audit(anomaly_id, prompt, None, 0, "FAILED", error=e)
-                err_rec = rec.copy()
-                err_rec["error"] = str(e)
-                results.append(err_rec)
+                results.append(self._failed(rec, e))
                 failures += 1
                 if failures >= self.CIRCUIT_BREAKER_THRESHOLD:
                     logger.critical("Circuit Breaker Tripped!")
                     circuit_open = True
 
         return results
+
+    async def explain_async(
+        self,
+        anomalies: List[Dict[str, Any]],
+        max_concurrency: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Explains every anomaly concurrently on the running event loop.
+        At most `max_concurrency` requests are in flight and all of them share
+        one REQUESTS_PER_SECOND limit. The circuit breaker trips after
+        CIRCUIT_BREAKER_THRESHOLD consecutive failures (a cache hit ends a
+        streak); anomalies not yet started are then skipped. Results keep the
+        input order. Cache reads and writes and audit records are file I/O and
+        run in worker threads (asyncio.to_thread), so they never block the
+        event loop.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.MAX_CONCURRENCY)
+        limiter = AsyncRateLimiter(self.REQUESTS_PER_SECOND)
+        breaker = {"failures": 0, "open": False}
+
+        async def explain_one(i: int, rec: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                if breaker["open"]:
+                    return self._skipped(rec)
+
+                anomaly_id = rec.get("anomaly_id", f"row_{i}")
+                history = self._retrieve_history(rec)
+                prompt = self._construct_prompt(rec, history)
+                cached = await asyncio.to_thread(self._cached_response, rec, history)
+                if cached is not None:
+                    # A served answer breaks a failure streak, as in batch_explain
+                    breaker["failures"] = 0
+                    await asyncio.to_thread(
+                        self._save_audit, anomaly_id, prompt, cached, 0.0, "CACHE_HIT"
+                    )
+                    return self._enrich(rec, cached, 0.0, cached=True)
+
+                try:
+                    data, latency = await self._call_llm_async(prompt, limiter)
+                except Exception as e:
+                    logger.error(f"Failed {anomaly_id}: {e}")
+                    breaker["failures"] += 1
+                    if breaker["failures"] >= self.CIRCUIT_BREAKER_THRESHOLD:
+                        if not breaker["open"]:
+                            logger.critical("Circuit Breaker Tripped!")
+                        breaker["open"] = True
+                    await asyncio.to_thread(
+                        self._save_audit, anomaly_id, prompt, None, 0, "FAILED", e
+                    )
+                    return self._failed(rec, e)
+
+                breaker["failures"] = 0
+                await asyncio.to_thread(
+                    self._record_success,
+                    rec,
+                    history,
+                    anomaly_id,
+                    prompt,
+                    data,
+                    latency,
+                )
+                return self._enrich(rec, data, latency)
+
+        return await asyncio.gather(
+            *(explain_one(i, rec) for i, rec in enumerate(anomalies))
+        )
+
+    @timeit_span("explainer.async_batch")
+    def explain_concurrently(
+        self,
+        anomalies: List[Dict[str, Any]],
+        max_concurrency: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Blocking entry point for explain_async (runs its own event loop)."""
+        return asyncio.run(self.explain_async(anomalies, max_concurrency))
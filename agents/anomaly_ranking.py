@@ -0,0 +1,239 @@
+"""
+agents/anomaly_ranking.py
+Calibrated, bounded top-K anomaly ranking.
+
+Raw scores are not comparable across detectors (z-scores, IQR multiples,
+capped or scaled percentage changes). ScoreCalibration maps every score to
+its percentile among the same detector's scores from earlier runs, kept as a
+fixed-size quantile sketch per detector and persisted as JSON. Detectors with
+no history fall back to ranks within the current run. Each merged run is
+remembered by a fingerprint of its hits, so re-running the same snapshot does
+not count the same scores twice.
+
+TopKRanker consumes record batches as they stream (same write_batch() as
+AnomalyArtifactWriter) and keeps the best K under a per-entity cap in a heap
+of at most K entries, so the full record list is never sorted.
+"""
+
+import os
+import json
+import heapq
+import hashlib
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from agents.anomaly_consolidation import detector_percentiles
+
+DEFAULT_TOP_K = 5
+N_QUANTILES = 101
+# Fingerprints of merged runs kept for de-duplication (oldest dropped first)
+MAX_RUNS = 1000
+
+
+class ScoreCalibration:
+    """
+    Per-detector score distributions from historical runs.
+
+    Usage:
+        calibration = ScoreCalibration.load("outputs/score_calibration.json")
+        pct = calibration.percentiles(frame)  # frame has detector + score
+        if calibration.update(frame):  # False if this run was merged before
+            calibration.save("outputs/score_calibration.json")
+    """
+
+    def __init__(
+        self,
+        sketches: Optional[Dict[str, Dict[str, Any]]] = None,
+        n_quantiles: int = N_QUANTILES,
+        runs: Optional[List[str]] = None,
+    ):
+        # detector -> {"count": n, "quantiles": n_quantiles sorted scores}
+        self.sketches = sketches or {}
+        self.grid = np.linspace(0.0, 1.0, n_quantiles)
+        # Fingerprints of the runs merged so far, oldest first
+        self.runs: List[str] = list(runs or [])
+
+    @classmethod
+    def load(cls, path) -> "ScoreCalibration":
+        """Reads a saved calibration; a missing file gives an empty one."""
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        with open(path) as f:
+            data = json.load(f)
+        return cls(
+            data["detectors"], n_quantiles=data["n_quantiles"], runs=data.get("runs")
+        )
+
+    def save(self, path):
+        path = Path(path)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "n_quantiles": len(self.grid),
+                    "detectors": self.sketches,
+                    "runs": self.runs,
+                },
+                f,
+                indent=2,
+            )
+        os.replace(tmp, path)
+
+    def percentile(self, detector: str, scores) -> Optional[np.ndarray]:
+        """
+        Historical percentile of `scores` for `detector`, kept inside (0, 1)
+        like rank/(n+1); None when the detector has no history.
+        """
+        sketch = self.sketches.get(detector)
+        if not sketch:
+            return None
+        n = sketch["count"]
+        cdf = np.interp(np.asarray(scores, dtype=float), sketch["quantiles"], self.grid)
+        return (cdf * n + 0.5) / (n + 1)
+
+    def percentiles(self, frame: pd.DataFrame) -> np.ndarray:
+        """Per-row percentile of `score` within its detector's distribution."""
+        out = np.empty(len(frame))
+        missing = np.zeros(len(frame), dtype=bool)
+        detectors = frame["detector"].to_numpy()
+        scores = frame["score"].to_numpy(dtype=float)
+        for detector in pd.unique(detectors):
+            rows = detectors == detector
+            pct = self.percentile(detector, scores[rows])
+            if pct is None:
+                missing |= rows
+            else:
+                out[rows] = pct
+        if missing.any():
+            out[missing] = detector_percentiles(frame[missing])
+        return out
+
+    @staticmethod
+    def fingerprint(frame: pd.DataFrame) -> str:
+        """Content hash of a run's hits (ids when present, detectors, scores)."""
+        cols = [c for c in ("anomaly_id", "detector", "score") if c in frame]
+        rows = pd.util.hash_pandas_object(frame[cols], index=False)
+        return hashlib.sha256(rows.to_numpy().tobytes()).hexdigest()
+
+    def update(self, frame: pd.DataFrame) -> bool:
+        """
+        Merges a run's scores into each detector's sketch. Returns False (and
+        changes nothing) when the same hits were merged before.
+        """
+        run = self.fingerprint(frame)
+        if run in self.runs:
+            return False
+        self.runs = (self.runs + [run])[-MAX_RUNS:]
+        for detector, scores in frame.groupby("detector", sort=False)["score"]:
+            scores = scores.to_numpy(dtype=float)
+            scores = scores[~np.isnan(scores)]
+            if len(scores) == 0:
+                continue
+            new = np.quantile(scores, self.grid)
+            sketch = self.sketches.get(detector)
+            if sketch:
+                # Invert the count-weighted mixture of both CDFs on the grid
+                old, n_old, n_new = sketch["quantiles"], sketch["count"], len(scores)
+                points = np.union1d(old, new)
+                cdf = (
+                    n_old * np.interp(points, old, self.grid)
+                    + n_new * np.interp(points, new, self.grid)
+                ) / (n_old + n_new)
+                new = np.interp(self.grid, cdf, points)
+                count = n_old + n_new
+            else:
+                count = len(scores)
+            self.sketches[detector] = {
+                "count": int(count),
+                "quantiles": np.round(new, 6).tolist(),
+            }
+        return True
+
+
+class TopKRanker:
+    """
+    Streaming top-K with at most `max_per_entity` picks per entity_id.
+    Records are ranked by calibrated percentile when a calibration is given,
+    else by raw score; ties go to the higher raw score, then the earlier record.
+
+    Usage:
+        ranker = TopKRanker(k=5, calibration=calibration)
+        ranker.write_batch(frame, contexts)
+        ranker.top()
+    """
+
+    def __init__(
+        self,
+        k: int = DEFAULT_TOP_K,
+        max_per_entity: int = 1,
+        calibration: Optional[ScoreCalibration] = None,
+    ):
+        self.k = k
+        self.max_per_entity = max_per_entity
+        self.calibration = calibration
+        # Min-heap of (rank key, score, -sequence, entity): root is the weakest
+        self._heap: List[tuple] = []
+        self._per_entity: Counter = Counter()
+        self._records: Dict[int, Optional[Dict[str, Any]]] = {}
+        self._count = 0
+
+    def write_batch(self, frame: pd.DataFrame, contexts: List[Dict[str, Any]]):
+        n = len(frame)
+        if n == 0 or self.k <= 0:
+            return
+        scores = frame["score"].to_numpy(dtype=float)
+        keys = (
+            scores if self.calibration is None else self.calibration.percentiles(frame)
+        )
+        keys = np.where(np.isnan(keys), -np.inf, keys)
+        scores = np.where(np.isnan(scores), -np.inf, scores)
+        entities = frame["entity_id"].to_numpy()
+
+        accepted = []
+        for i in np.lexsort((-scores, -keys)).tolist():
+            entry = (keys[i], scores[i], -(self._count + i), entities[i])
+            if self._offer(entry):
+                accepted.append(i)
+            elif len(self._heap) >= self.k and entry[:3] < self._heap[0][:3]:
+                break  # the rest of the batch ranks lower still
+
+        # Records are only built for the picks still held after the batch
+        live = [i for i in accepted if (self._count + i) in self._records]
+        records = frame.iloc[live].to_dict("records")
+        for i, rec in zip(live, records):
+            rec["context"] = contexts[i]
+            self._records[self._count + i] = rec
+        self._count += n
+
+    def _offer(self, entry: tuple) -> bool:
+        entity = entry[3]
+        if self._per_entity[entity] >= self.max_per_entity:
+            worst = min(e for e in self._heap if e[3] == entity)
+            if entry[:3] <= worst[:3]:
+                return False
+            self._remove(worst)
+        elif len(self._heap) >= self.k:
+            if entry[:3] <= self._heap[0][:3]:
+                return False
+            self._remove(self._heap[0])
+        heapq.heappush(self._heap, entry)
+        self._per_entity[entity] += 1
+        self._records[-entry[2]] = None
+        return True
+
+    def _remove(self, entry: tuple):
+        # K is small: a linear removal and re-heapify is cheaper than lazy deletes
+        self._heap.remove(entry)
+        heapq.heapify(self._heap)
+        self._per_entity[entry[3]] -= 1
+        del self._records[-entry[2]]
+
+    def top(self) -> List[Dict[str, Any]]:
+        """Picks so far, best first."""
+        ranked = sorted(self._heap, key=lambda e: (-e[0], -e[1], -e[2]))
+        return [self._records[-e[2]] for e in ranked]
@@ -8,11 +8,21 @@ import sys
 import json
 import logging
 import argparse
+import warnings
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Any
-from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from dataclasses import dataclass, asdict, fields
+
+from agents.anomaly_consolidation import consolidate
+from agents.anomaly_writer import DEFAULT_TOP_N, AnomalyArtifactWriter
+from agents.forecast_baselines import exponential_smoothing
+from agents.rolling_quantiles import (
+    rolling_quantiles,
+    rolling_quantiles_2d,
+    segment_offsets,
+)
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -36,6 +46,232 @@ class AnomalyRecord:
     context: Dict[str, Any]
 
 
+RECORD_COLUMNS = [f.name for f in fields(AnomalyRecord) if f.name != "context"]
+
+
+DEFAULT_METRIC = "Sales"
+CALENDAR_FILLS = {"zero": 0.0, "nan": np.nan}
+SEASONAL_MODELS = ("multiplicative", "additive")
+HIERARCHY_SEP = "/"
+HIERARCHY_DETECTORS = ("iqr", "pct")
+
+
+def _join_levels(frame: pd.DataFrame, cols: List[str]) -> pd.Series:
+    """Entity path per row, e.g. "East/Furniture" (a single level is left as is)."""
+    if len(cols) == 1:
+        return frame[cols[0]]
+    path = frame[cols[0]].astype(str)
+    for col in cols[1:]:
+        path = path + HIERARCHY_SEP + frame[col].astype(str)
+    return path
+
+
+def _calendar_fill(name: str) -> float:
+    if name not in CALENDAR_FILLS:
+        raise ValueError(
+            f"calendar_fill must be one of {sorted(CALENDAR_FILLS)}, got {name!r}"
+        )
+    return CALENDAR_FILLS[name]
+
+
+def _seasonal_profile(values: np.ndarray, keys: np.ndarray, n_keys: int, neutral):
+    """
+    Mean of `values` per key (month, weekday) for every column at once: one
+    masked mean per key value, broadcast back onto the rows. Keys without
+    finite values get `neutral`.
+    """
+    effect = np.full(values.shape, neutral)
+    for key in range(n_keys):
+        rows = keys == key
+        if not rows.any():
+            continue
+        block = values[rows]
+        finite = np.isfinite(block)
+        count = finite.sum(axis=0)
+        total = np.where(finite, block, 0.0).sum(axis=0)
+        effect[rows] = np.divide(
+            total, count, out=np.full(total.shape, float(neutral)), where=count > 0
+        )
+    return effect
+
+
+def _round2(values) -> np.ndarray:
+    """Python round(x, 2) per hit, so scores stay identical to the scalar code."""
+    return np.array([round(v, 2) for v in np.asarray(values, dtype=float).tolist()])
+
+
+class AnomalyTable:
+    """
+    Columnar (struct-of-arrays) anomaly store.
+    Detectors append whole batches of typed columns; per-record dicts and
+    AnomalyRecord objects are only materialised when asked for. An attached
+    AnomalyArtifactWriter receives every batch as it is appended.
+    """
+
+    def __init__(self):
+        self._frames: List[pd.DataFrame] = []
+        self._contexts: List[Dict[str, Any]] = []
+        self._length = 0
+        self.writer: Optional[AnomalyArtifactWriter] = None
+
+    def attach(self, writer: AnomalyArtifactWriter):
+        """Streams the batches held so far, then every new batch, to `writer`."""
+        for i, frame in enumerate(self._frames):
+            writer.write_batch(frame, self._context_dicts(i, len(frame)))
+        self.writer = writer
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append_batch(self, columns: Dict[str, Any], context: Dict[str, Any] = None):
+        """
+        Adds one detector batch. `columns` holds every RECORD_COLUMNS entry as an
+        array or a scalar broadcast over the batch; `context` maps context keys
+        to arrays or scalars in the same way.
+        """
+        lengths = [len(v) for v in columns.values() if np.ndim(v) == 1]
+        n = lengths[0] if lengths else 1
+        if n == 0:
+            return
+        frame = pd.DataFrame(
+            {c: columns[c] for c in RECORD_COLUMNS}, index=pd.RangeIndex(n)
+        )
+        frame = frame.astype({"value": float, "expected": float, "score": float})
+        self._frames.append(frame)
+        self._contexts.append(context or {})
+        self._length += n
+        if self.writer is not None:
+            self.writer.write_batch(frame, self._context_dicts(-1, n))
+
+    def extend(self, other: "AnomalyTable"):
+        """Appends every batch of `other`, in order (streamed if attached)."""
+        for i, frame in enumerate(other._frames):
+            self._frames.append(frame)
+            self._contexts.append(other._contexts[i])
+            self._length += len(frame)
+            if self.writer is not None:
+                self.writer.write_batch(frame, self._context_dicts(-1, len(frame)))
+
+    def append(self, record: AnomalyRecord):
+        """Single-record append, kept for callers that build AnomalyRecords."""
+        data = asdict(record)
+        context = {k: [v] for k, v in data.pop("context").items()}
+        self.append_batch({k: [v] for k, v in data.items()}, context)
+
+    def _context_dicts(self, index: int, n: int) -> List[Dict[str, Any]]:
+        context = self._contexts[index]
+        if not context:
+            return [{} for _ in range(n)]
+        keys = list(context)
+        cols = []
+        for k in keys:
+            v = context[k]
+            if isinstance(v, list):
+                cols.append(v)  # per-record Python objects (lists, dicts)
+            elif np.ndim(v) == 0:
+                cols.append([v] * n)  # scalar broadcast (e.g. threshold)
+            else:
+                cols.append(np.asarray(v).tolist())
+        return [dict(zip(keys, vals)) for vals in zip(*cols)]
+
+    def to_frame(self, with_context: bool = True) -> pd.DataFrame:
+        """All records as one typed DataFrame (context dicts built on demand)."""
+        if not self._frames:
+            return pd.DataFrame()
+        frame = pd.concat(self._frames, ignore_index=True)
+        if with_context:
+            contexts = []
+            for i, part in enumerate(self._frames):
+                contexts.extend(self._context_dicts(i, len(part)))
+            frame["context"] = contexts
+        return frame
+
+    def to_records(self, sort_by_score: bool = False) -> List[Dict[str, Any]]:
+        """JSON-ready dicts (native Python types), optionally sorted by score desc."""
+        frame = self.to_frame()
+        if frame.empty:
+            return []
+        if sort_by_score:
+            order = np.argsort(-frame["score"].to_numpy(), kind="stable")
+            frame = frame.iloc[order]
+        return frame.to_dict("records")
+
+    def __iter__(self) -> Iterator[AnomalyRecord]:
+        for rec in self.to_records():
+            yield AnomalyRecord(**rec)
+
+
+@dataclass
+class DailyAggregate:
+    """
+    Daily sums of one metric per entity, built once from the raw order rows.
+    `frame` holds [Order Date, group_col, target_col] sorted by (entity, date);
+    its index labels are the row positions of the date-major groupby, which is
+    what the detectors have always returned. `starts` marks where each
+    entity's segment begins. group_col=None is the global (single series) view.
+    Hierarchy levels also carry each entity's `parent` path.
+    """
+
+    group_col: Optional[str]
+    target_col: str
+    frame: pd.DataFrame
+    starts: np.ndarray
+    entities: np.ndarray
+    dates: pd.DatetimeIndex
+    parent: Optional[np.ndarray] = None
+
+    @property
+    def values(self) -> np.ndarray:
+        return self.frame[self.target_col].to_numpy(dtype=float)
+
+    def calendar(self) -> pd.DatetimeIndex:
+        """Every day from the first to the last aggregated date."""
+        if len(self.dates) == 0:
+            return self.dates
+        return pd.date_range(self.dates[0], self.dates[-1], freq="D")
+
+    def dense(self, fill=np.nan, calendar=False) -> np.ndarray:
+        """
+        Dates x entities matrix view (cells without orders get `fill`).
+        calendar=True has one row per calendar day (see calendar()); days
+        before an entity's first order stay NaN whatever the fill.
+        """
+        if self.group_col is None and not calendar:
+            return self.values.reshape(-1, 1)
+        dates = self.calendar() if calendar else self.dates
+        row = dates.get_indexer(self.frame["Order Date"])
+        col = np.repeat(
+            np.arange(len(self.starts)), np.diff(np.r_[self.starts, len(self.frame)])
+        )
+        out = np.full((len(dates), len(self.starts)), fill, dtype=float)
+        if calendar:
+            out[np.arange(len(dates))[:, None] < row[self.starts]] = np.nan
+        out[row, col] = self.values
+        return out
+
+    def dense_hits(
+        self, matrix: np.ndarray, mask: np.ndarray, stats: Dict[str, np.ndarray]
+    ) -> pd.DataFrame:
+        """
+        Frame of the flagged cells of a calendar dense() matrix, laid out like
+        `frame` (entity-major, then date) with the given per-cell stats added.
+        """
+        col, row = np.nonzero(mask.T)
+        days = self.calendar()
+        keys = self.frame.iloc[self.starts]
+        out = {}
+        for c in self.frame.columns:
+            if c == "Order Date":
+                out[c] = days[row]
+            elif c == self.target_col:
+                out[c] = matrix[row, col]
+            else:
+                out[c] = keys[c].to_numpy()[col]
+        for name, stat in stats.items():
+            out[name] = stat[row, col]
+        return pd.DataFrame(out)
+
+
 class AnomalyStatAgent:
 
     def __init__(self, df: pd.DataFrame):
@@ -43,20 +279,209 @@ class AnomalyStatAgent:
         if "Order Date" in self.df.columns:
             self.df["Order Date"] = pd.to_datetime(self.df["Order Date"])
             self.df = self.df.sort_values("Order Date")
-        self.anomalies: List[AnomalyRecord] = []
+        self.anomalies = AnomalyTable()
+        self._aggregates: Dict[Tuple[Optional[str], str], DailyAggregate] = {}
+
+    def aggregate(self, group_col: Optional[str], target_col: str) -> DailyAggregate:
+        """
+        Cached daily aggregate shared by every detector.
+        Raw order rows are grouped once per (group_col, target_col) per agent.
+        """
+        key = (group_col, target_col)
+        if key in self._aggregates:
+            return self._aggregates[key]
+
+        if group_col is None:
+            frame = self.df.groupby("Order Date")[target_col].sum().reset_index()
+            agg = DailyAggregate(
+                group_col=None,
+                target_col=target_col,
+                frame=frame,
+                starts=np.array([0] if len(frame) else [], dtype=np.int64),
+                entities=np.array(["All_Regions"] * min(len(frame), 1), dtype=object),
+                dates=pd.DatetimeIndex(np.unique(frame["Order Date"].to_numpy())),
+            )
+        else:
+            frame = (
+                self.df.groupby(["Order Date", group_col])[target_col]
+                .sum()
+                .reset_index()
+            )
+            agg = self._segmented(frame, group_col, target_col)
+        self._aggregates[key] = agg
+        return agg
+
+    @staticmethod
+    def _segmented(frame, group_col, target_col, parent=None) -> DailyAggregate:
+        """Sorts a date-major daily frame into one segment per entity."""
+        order = np.argsort(frame[group_col].to_numpy(), kind="stable")
+        frame = frame.iloc[order]
+        codes = frame[group_col].to_numpy()
+        # No rows (empty snapshot, or every group key missing): no segments
+        starts = np.flatnonzero(np.r_[len(codes) > 0, codes[1:] != codes[:-1]])
+        return DailyAggregate(
+            group_col=group_col,
+            target_col=target_col,
+            frame=frame,
+            starts=starts,
+            entities=codes[starts],
+            dates=pd.DatetimeIndex(np.unique(frame["Order Date"].to_numpy())),
+            parent=None if parent is None else np.asarray(parent)[order][starts],
+        )
 
-    def _generate_id(self, date_str, entity, detector, score):
+    def aggregate_hierarchy(self, levels, target_col: str) -> List[DailyAggregate]:
+        """
+        Cached daily aggregates for every prefix of `levels`, top level first.
+        Raw order rows are grouped once at the leaf level and each parent level
+        is rolled up from that leaf aggregate. A level is keyed by its joined
+        column names (e.g. "Region/Category") and its entities are joined paths
+        (e.g. "East/Furniture"); the top level is the plain group_col view.
+        """
+        levels = list(levels)
+        names = [HIERARCHY_SEP.join(levels[:d]) for d in range(1, len(levels) + 1)]
+        if all((name, target_col) in self._aggregates for name in names):
+            return [self._aggregates[(name, target_col)] for name in names]
+
+        leaf = self.df.groupby(["Order Date", *levels])[target_col].sum().reset_index()
+        aggs = []
+        for depth, name in enumerate(names, 1):
+            key = (name, target_col)
+            if key not in self._aggregates:
+                cols = levels[:depth]
+                rolled = leaf
+                if depth < len(levels):
+                    rolled = (
+                        leaf.groupby(["Order Date", *cols])[target_col]
+                        .sum()
+                        .reset_index()
+                    )
+                frame = pd.DataFrame(
+                    {
+                        "Order Date": rolled["Order Date"],
+                        name: _join_levels(rolled, cols),
+                        target_col: rolled[target_col],
+                    }
+                )
+                parent = _join_levels(rolled, cols[:-1]) if depth > 1 else None
+                self._aggregates[key] = self._segmented(frame, name, target_col, parent)
+            aggs.append(self._aggregates[key])
+        return aggs
+
+    def aggregate_metrics(
+        self, group_col: Optional[str], target_cols
+    ) -> DailyAggregate:
+        """
+        Cached daily aggregate of several metrics from a single groupby.
+        The metrics are stacked into one long frame [Order Date, group_col,
+        metric, value]: metric-major, then entity, then date. Every (metric,
+        entity) pair is its own segment, so the segment kernels score all
+        metrics in one vectorized pass.
+        """
+        target_cols = list(target_cols)
+        key = (group_col, tuple(target_cols))
+        if key in self._aggregates:
+            return self._aggregates[key]
+
+        keys = ["Order Date"] if group_col is None else ["Order Date", group_col]
+        wide = self.df.groupby(keys)[target_cols].sum().reset_index()
+        if group_col is None:
+            starts = np.array([0])
+            entities = np.array(["All_Regions"], dtype=object)
+        else:
+            base = self._segmented(
+                wide[keys + target_cols[:1]], group_col, target_cols[0]
+            )
+            wide = wide.loc[base.frame.index]
+            starts, entities = base.starts, base.entities
+
+        n = len(wide)
+        frame = pd.concat(
+            [
+                wide[keys].assign(
+                    metric=metric, value=wide[metric].to_numpy(dtype=float)
+                )
+                for metric in target_cols
+            ]
+        )
+        agg = DailyAggregate(
+            group_col=group_col,
+            target_col="value",
+            frame=frame,
+            starts=np.concatenate([starts + i * n for i in range(len(target_cols))]),
+            entities=np.tile(entities, len(target_cols)),
+            dates=pd.DatetimeIndex(np.unique(wide["Order Date"].to_numpy())),
+        )
+        self._aggregates[key] = agg
+        return agg
+
+    @staticmethod
+    def _by_metric(detected: pd.DataFrame, metrics):
+        """Splits long multi-metric hits into per-metric frames (value -> metric)."""
+        if detected.empty:
+            return
+        for metric in metrics:
+            part = detected[detected["metric"].to_numpy() == metric]
+            if not part.empty:
+                yield metric, part.rename(columns={"value": metric})
+
+    @staticmethod
+    def _id_prefix(detector, metric=None) -> str:
+        # Sales keeps the original id format; other metrics are qualified so
+        # hits on the same entity and day stay distinct across metrics
+        if metric is None or metric == DEFAULT_METRIC:
+            return detector
+        return f"{detector}_{str(metric).replace(' ', '_')}"
+
+    def _generate_id(self, date_str, entity, detector, score, metric=None):
         clean_entity = str(entity).replace(" ", "_")
-        return f"{detector}_{clean_entity}_{date_str}_s{int(score)}"
+        return f"{self._id_prefix(detector, metric)}_{clean_entity}_{date_str}_s{int(score)}"
+
+    def _generate_ids(
+        self, date_strs, entities, detector, scores, metric=None
+    ) -> List[str]:
+        """Vectorized _generate_id over a batch of hits."""
+        prefix = self._id_prefix(detector, metric)
+        clean = pd.Series(entities, dtype=object).astype(str).str.replace(" ", "_")
+        whole = np.trunc(np.asarray(scores, dtype=float)).astype(np.int64)
+        return [
+            f"{prefix}_{e}_{d}_s{w}"
+            for e, d, w in zip(clean.tolist(), date_strs, whole.tolist())
+        ]
 
     def detect_global_zscore(
         self, target_col="Sales", window=30, threshold=3.0
     ) -> pd.DataFrame:
+        """
+        Rolling z-score on the global daily series.
+        target_col may be a list of metrics: they are aggregated in one groupby
+        and scored together (see aggregate_metrics); the returned frame is then
+        long, with `metric` and `value` columns.
+        """
         logger.info(
             f"Running Global Z-Score Detector on {target_col} (w={window}, t={threshold})"
         )
 
-        daily = self.df.groupby("Order Date")[target_col].sum().reset_index()
+        if not isinstance(target_col, str):
+            agg = self.aggregate_metrics(None, target_col)
+            daily = agg.frame.copy()
+
+            # Every metric covers the same dates, so the stack is a dates x metrics
+            # matrix and one 2D rolling pass scores all of them
+            n_dates = len(agg.dates)
+            wide = pd.DataFrame(agg.values.reshape(len(target_col), n_dates).T)
+            rolling = wide.rolling(window=window, min_periods=1)
+            daily["mean"] = rolling.mean().to_numpy().T.ravel()
+            daily["std"] = rolling.std().to_numpy().T.ravel()
+            daily["zscore"] = (daily["value"] - daily["mean"]) / (
+                daily["std"].replace(0, 1)
+            )
+
+            outliers = daily[np.abs(daily["zscore"]) > threshold].copy()
+            for metric, part in self._by_metric(outliers, target_col):
+                self._emit_zscore_batch(part, metric, threshold)
+            return outliers
+
+        daily = self.aggregate(None, target_col).frame.copy()
 
         # Global is dense (daily), so min_periods=5 is usually fine, but 1 is safer
         daily["mean"] = daily[target_col].rolling(window=window, min_periods=1).mean()
@@ -67,267 +492,1086 @@ class AnomalyStatAgent:
         )
 
         outliers = daily[np.abs(daily["zscore"]) > threshold].copy()
+        if outliers.empty:
+            return outliers
 
-        for _, row in outliers.iterrows():
-            date_str = row["Order Date"].strftime("%Y-%m-%d")
-            score = round(abs(row["zscore"]), 2)
-
-            rec = AnomalyRecord(
-                anomaly_id=self._generate_id(date_str, "Global", "zscore", score),
-                level="global",
-                entity_id="All_Regions",
-                period_start=date_str,
-                period_end=date_str,
-                metric=target_col,
-                value=float(row[target_col]),
-                expected=float(round(row["mean"], 2)),
-                score=score,
-                detector="zscore",
-                reason=f"Spike detected (Z={score})",
-                context={
-                    "window_mean": float(round(row["mean"], 2)),
-                    "window_std": float(round(row["std"], 2)),
-                    "threshold": threshold,
-                },
-            )
-            self.anomalies.append(rec)
-
+        self._emit_zscore_batch(outliers, target_col, threshold)
         return outliers
 
+    def _emit_zscore_batch(self, outliers, target_col, threshold):
+        """Builds zscore records for all hits in one batch."""
+        dates = outliers["Order Date"].dt.strftime("%Y-%m-%d").tolist()
+        scores = _round2(np.abs(outliers["zscore"]))
+        means = _round2(outliers["mean"])
+
+        self.anomalies.append_batch(
+            {
+                "anomaly_id": self._generate_ids(
+                    dates, ["Global"] * len(dates), "zscore", scores, target_col
+                ),
+                "level": "global",
+                "entity_id": "All_Regions",
+                "period_start": dates,
+                "period_end": dates,
+                "metric": target_col,
+                "value": outliers[target_col].to_numpy(dtype=float),
+                "expected": means,
+                "score": scores,
+                "detector": "zscore",
+                "reason": [f"Spike detected (Z={z})" for z in scores.tolist()],
+            },
+            context={
+                "window_mean": means,
+                "window_std": _round2(outliers["std"]),
+                "threshold": threshold,
+            },
+        )
+
+    def detect_robust_zscore(
+        self,
+        group_col: Optional[str] = None,
+        target_col="Sales",
+        window=30,
+        threshold=3.5,
+        min_periods=7,
+    ) -> pd.DataFrame:
+        """
+        Rolling median / MAD z-score: spikes inside the window barely move the
+        baseline, unlike the mean and std of detect_global_zscore.
+        Every entity is scored in the same two rolling-median passes: the
+        median of the values, then the median of each row's absolute deviation
+        from its own window median (MAD). sigma = 1.4826 * MAD; windows whose
+        MAD is 0 (mostly flat) fall back to 1.2533 * mean absolute deviation.
+        Rows with fewer than `min_periods` rows of history are not scored.
+        """
+        logger.info(
+            f"Running Robust Z-Score Detector on {group_col or 'Global'} "
+            f"(w={window}, t={threshold})"
+        )
+
+        agg = self.aggregate(group_col, target_col)
+        detected = agg.frame.copy()
+        values = agg.values
+        offset = segment_offsets(agg.starts, len(values))
+
+        median = rolling_quantiles(values, offset, window, (0.5,))[:, 0]
+        deviation = np.abs(values - median)
+        mad = rolling_quantiles(deviation, offset, window, (0.5,))[:, 0]
+        mean_dev = (
+            pd.Series(deviation)
+            .groupby(np.cumsum(offset == 0), sort=False)
+            .rolling(window=window, min_periods=1)
+            .mean()
+            .to_numpy()
+        )
+        sigma = np.where(mad > 0, 1.4826 * mad, 1.2533 * mean_dev)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            robust_z = np.where(sigma > 0, (values - median) / sigma, np.nan)
+        robust_z[offset + 1 < min_periods] = np.nan
+
+        detected["median"] = median
+        detected["mad"] = mad
+        detected["sigma"] = sigma
+        detected["robust_z"] = robust_z
+        detected = detected[np.abs(robust_z) > threshold].copy()
+        if detected.empty:
+            return detected
+
+        dates = detected["Order Date"].dt.strftime("%Y-%m-%d").tolist()
+        if group_col is None:
+            entities = np.full(len(detected), "All_Regions", dtype=object)
+            id_entities = ["Global"] * len(detected)
+        else:
+            entities = detected[group_col].astype(str).to_numpy()
+            id_entities = detected[group_col].to_numpy()
+        scores = _round2(np.abs(detected["robust_z"]))
+        medians = _round2(detected["median"])
+
+        self.anomalies.append_batch(
+            {
+                "anomaly_id": self._generate_ids(
+                    dates, id_entities, "robust_zscore", scores, target_col
+                ),
+                "level": "global" if group_col is None else group_col.lower(),
+                "entity_id": entities,
+                "period_start": dates,
+                "period_end": dates,
+                "metric": target_col,
+                "value": detected[target_col].to_numpy(dtype=float),
+                "expected": medians,
+                "score": scores,
+                "detector": "robust_zscore",
+                "reason": [
+                    f"{'Spike' if z > 0 else 'Drop'} vs rolling median (Robust Z={s})"
+                    for z, s in zip(detected["robust_z"].tolist(), scores.tolist())
+                ],
+            },
+            context={
+                "window_median": medians,
+                "window_mad": _round2(detected["mad"]),
+                "threshold": threshold,
+            },
+        )
+        return detected
+
     def detect_grouped_iqr(
-        self, group_col="Region", target_col="Sales", window=14, k=1.5
+        self,
+        group_col="Region",
+        target_col="Sales",
+        window=14,
+        k=1.5,
+        quantile_method="exact",
+        calendar_fill: Optional[str] = None,
     ) -> pd.DataFrame:
+        """
+        Tukey fences on a trailing window per entity.
+        quantile_method="approx" thins long windows before sorting (see
+        agents.rolling_quantiles; no error bound); the default matches pandas
+        exactly.
+        A list of metrics is scored in one pass (one segment per metric and
+        entity) and returns a long frame with `metric` and `value` columns.
+        calendar_fill ("zero" or "nan") scores a calendar-aligned dates x
+        entities matrix instead of the order rows, so `window` counts days and
+        days without orders are zeros or skipped.
+        """
         logger.info(f"Running Grouped IQR Detector on {group_col} (w={window}, k={k})")
 
-        grouped = (
-            self.df.groupby(["Order Date", group_col])[target_col].sum().reset_index()
+        if not isinstance(target_col, str):
+            agg = self.aggregate_metrics(group_col, target_col)
+            detected = self._iqr_hits(agg, window, k, quantile_method, calendar_fill)
+            for metric, part in self._by_metric(detected, target_col):
+                self._emit_iqr_batch(part, group_col, metric)
+            return detected
+
+        agg = self.aggregate(group_col, target_col)
+        detected = self._iqr_hits(agg, window, k, quantile_method, calendar_fill)
+        if detected.empty:
+            return pd.DataFrame()
+        self._emit_iqr_batch(detected, group_col, target_col)
+        return detected
+
+    @staticmethod
+    def _iqr_hits(
+        agg: DailyAggregate, window, k, quantile_method="exact", calendar_fill=None
+    ):
+        """Rows of `agg` outside the trailing-window Tukey fences."""
+        target_col = agg.target_col
+        if calendar_fill is not None:
+            return AnomalyStatAgent._dense_iqr_hits(
+                agg, window, k, quantile_method, calendar_fill
+            )
+
+        # Every entity is one contiguous, date-ordered segment of the aggregate
+        grouped = agg.frame.copy()
+
+        # Both quartiles come out of one rolling pass over all entities.
+        # This ensures we get stats even if recent history is gappy
+        quartiles = rolling_quantiles(
+            agg.values,
+            segment_offsets(agg.starts, len(grouped)),
+            window,
+            (0.25, 0.75),
+            method=quantile_method,
         )
+        grouped["Q1"] = quartiles[:, 0]
+        grouped["Q3"] = quartiles[:, 1]
+        grouped["IQR"] = grouped["Q3"] - grouped["Q1"]
 
-        outlier_frames = []
+        raw_lower = grouped["Q1"] - (k * grouped["IQR"])
 
-        for entity, group_df in grouped.groupby(group_col):
-            group_df = group_df.sort_values("Order Date").copy()
+        # Ensure lower bound catches drops to near-zero even if variance is high
+        grouped["lower"] = np.maximum(raw_lower, grouped["Q1"] * 0.25)
 
-            # This ensures we get stats even if recent history is gappy
-            group_df["Q1"] = (
-                group_df[target_col]
-                .rolling(window=window, min_periods=1)
-                .quantile(0.25)
-            )
-            group_df["Q3"] = (
-                group_df[target_col]
-                .rolling(window=window, min_periods=1)
-                .quantile(0.75)
-            )
-            group_df["IQR"] = group_df["Q3"] - group_df["Q1"]
+        grouped["upper"] = grouped["Q3"] + (k * grouped["IQR"])
 
-            raw_lower = group_df["Q1"] - (k * group_df["IQR"])
+        mask = (grouped[target_col] < grouped["lower"]) | (
+            grouped[target_col] > grouped["upper"]
+        )
 
-            # Ensure lower bound catches drops to near-zero even if variance is high
-            group_df["lower"] = np.maximum(raw_lower, group_df["Q1"] * 0.25)
+        # Allow very small positive values (like our 99% drop) to be detected
+        # Only ignore 0 or negatives if they aren't anomalies
+        mask = mask & (grouped[target_col] >= 0)
 
-            group_df["upper"] = group_df["Q3"] + (k * group_df["IQR"])
+        return grouped[mask].copy()
 
-            mask = (group_df[target_col] < group_df["lower"]) | (
-                group_df[target_col] > group_df["upper"]
-            )
+    @staticmethod
+    def _dense_iqr_hits(agg, window, k, quantile_method, calendar_fill):
+        """_iqr_hits on the calendar matrix: 2D kernels down the time axis."""
+        matrix = agg.dense(_calendar_fill(calendar_fill), calendar=True)
+        quartiles = rolling_quantiles_2d(
+            matrix, window, (0.25, 0.75), method=quantile_method
+        )
+        q1, q3 = quartiles[..., 0], quartiles[..., 1]
+        iqr = q3 - q1
+        lower = np.maximum(q1 - k * iqr, q1 * 0.25)
+        upper = q3 + k * iqr
+        mask = ((matrix < lower) | (matrix > upper)) & (matrix >= 0)
+        return agg.dense_hits(
+            matrix,
+            mask,
+            {"Q1": q1, "Q3": q3, "IQR": iqr, "lower": lower, "upper": upper},
+        )
 
-            # Allow very small positive values (like our 99% drop) to be detected
-            # Only ignore 0 or negatives if they aren't anomalies
-            mask = mask & (group_df[target_col] >= 0)
+    @staticmethod
+    def _iqr_expected(detected: pd.DataFrame, target_col: str):
+        """(scores, expected) for IQR hits: distance to the nearest quartile."""
+        value = detected[target_col].to_numpy(dtype=float)
+        q1 = detected["Q1"].to_numpy()
+        q3 = detected["Q3"].to_numpy()
+        iqr_raw = detected["IQR"].to_numpy()
 
-            detected = group_df[mask].copy()
+        # Handle IQR Score calculation (avoid div/0)
+        iqr = np.where(iqr_raw > 0, iqr_raw, 1.0)
+        above = value > q3
+        dist = np.where(above, value - q3, q1 - value)
+        return np.abs(dist) / iqr, np.where(above, q3, q1)
 
-            if not detected.empty:
-                outlier_frames.append(detected)
-
-                for _, row in detected.iterrows():
-                    date_str = row["Order Date"].strftime("%Y-%m-%d")
-
-                    # Handle IQR Score calculation (avoid div/0)
-                    iqr = row["IQR"] if row["IQR"] > 0 else 1.0
-                    if row[target_col] > row["Q3"]:
-                        dist = row[target_col] - row["Q3"]
-                    else:
-                        dist = row["Q1"] - row[target_col]
-
-                    iqr_score = round(abs(dist) / iqr, 2)
-
-                    rec = AnomalyRecord(
-                        anomaly_id=self._generate_id(
-                            date_str, entity, "iqr", iqr_score
-                        ),
-                        level=group_col.lower(),
-                        entity_id=str(entity),
-                        period_start=date_str,
-                        period_end=date_str,
-                        metric=target_col,
-                        value=float(row[target_col]),
-                        expected=(
-                            float(round(row["Q3"], 2))
-                            if row[target_col] > row["Q3"]
-                            else float(round(row["Q1"], 2))
-                        ),
-                        score=iqr_score,
-                        detector="iqr",
-                        reason=f"Outside Tukey Fence (Score={iqr_score})",
-                        context={
-                            "Q1": float(round(row["Q1"], 2)),
-                            "Q3": float(round(row["Q3"], 2)),
-                            "IQR": float(round(row["IQR"], 2)),
-                        },
-                    )
-                    self.anomalies.append(rec)
+    def _emit_iqr_batch(
+        self, detected, group_col, target_col, level=None, extra_context=None
+    ):
+        """Builds iqr records for all hits in one batch."""
+        value = detected[target_col].to_numpy(dtype=float)
+        iqr_scores, expected = self._iqr_expected(detected, target_col)
 
-        return pd.concat(outlier_frames) if outlier_frames else pd.DataFrame()
+        dates = detected["Order Date"].dt.strftime("%Y-%m-%d").tolist()
+        entities = detected[group_col].to_numpy()
+        scores = _round2(iqr_scores)
 
-    def detect_percentage_drop(
-        self, target_col="Sales", group_col="Category", threshold=0.5, window=3
+        self.anomalies.append_batch(
+            {
+                "anomaly_id": self._generate_ids(
+                    dates, entities, "iqr", scores, target_col
+                ),
+                "level": level or group_col.lower(),
+                "entity_id": pd.Series(entities, dtype=object).astype(str).to_numpy(),
+                "period_start": dates,
+                "period_end": dates,
+                "metric": target_col,
+                "value": value,
+                "expected": _round2(expected),
+                "score": scores,
+                "detector": "iqr",
+                "reason": [f"Outside Tukey Fence (Score={v})" for v in scores.tolist()],
+            },
+            context={
+                "Q1": _round2(detected["Q1"]),
+                "Q3": _round2(detected["Q3"]),
+                "IQR": _round2(detected["IQR"]),
+                **(extra_context or {}),
+            },
+        )
+
+    def detect_percentage_change(
+        self,
+        target_col="Sales",
+        group_col="Category",
+        drop_threshold: Optional[float] = 0.5,
+        spike_threshold: Optional[float] = 0.5,
+        calendar_fill: Optional[str] = None,
     ) -> pd.DataFrame:
-        """Detect extreme percentage drops (e.g., 50% or more) within a group."""
+        """
+        Fused percentage drop/spike detector.
+        Day-over-day pct change is computed once for every entity series (a
+        shift inside each aggregate segment), then tested against both
+        thresholds. Pass None for a threshold to skip that side.
+        Returns all hits with a `detector` column (pct_drop / pct_spike).
+        A list of metrics is scored in one pass, as in detect_grouped_iqr.
+        With calendar_fill the previous value is the previous calendar day
+        (see detect_grouped_iqr).
+        """
         logger.info(
-            f"Running Percentage Drop Detector on {group_col} (threshold={threshold*100}%)"
+            f"Running Percentage Change Detector on {group_col} "
+            f"(drop={drop_threshold}, spike={spike_threshold})"
         )
 
-        grouped = (
-            self.df.groupby(["Order Date", group_col])[target_col].sum().reset_index()
-        )
+        multi = not isinstance(target_col, str)
+        if multi:
+            agg = self.aggregate_metrics(group_col, target_col)
+        else:
+            agg = self.aggregate(group_col, target_col)
 
-        outlier_frames = []
+        outputs = []
+        for detector, detected in self._pct_hits(
+            agg, drop_threshold, spike_threshold, calendar_fill
+        ):
+            if multi:
+                for metric, part in self._by_metric(detected, target_col):
+                    self._emit_pct_batch(part, group_col, metric, detector)
+            else:
+                self._emit_pct_batch(detected, group_col, target_col, detector)
+            outputs.append(detected.assign(detector=detector))
 
-        for entity, group_df in grouped.groupby(group_col):
-            group_df = group_df.sort_values("Order Date").copy()
+        return pd.concat(outputs) if outputs else pd.DataFrame()
 
-            # Calculate previous day's value
-            group_df["prev_value"] = group_df[target_col].shift(1)
+    @staticmethod
+    def _pct_hits(
+        agg: DailyAggregate, drop_threshold, spike_threshold, calendar_fill=None
+    ):
+        """[(detector, hits)] for the day-over-day drop and spike tests."""
+        if calendar_fill is None:
+            values = agg.values
 
-            # Calculate percentage change
-            group_df["pct_change"] = (
-                group_df[target_col] - group_df["prev_value"]
-            ) / group_df["prev_value"]
+            # Calculate previous day's value within each entity series
+            prev = np.empty(len(values))
+            prev[1:] = values[:-1]
+            prev[agg.starts] = np.nan
+        else:
+            # Calendar matrix: the previous row is always the previous day
+            values = agg.dense(_calendar_fill(calendar_fill), calendar=True)
+            prev = np.full(values.shape, np.nan)
+            prev[1:] = values[:-1]
 
-            # Detect extreme drops (negative percentage change beyond threshold)
-            mask = group_df["pct_change"] < -threshold
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pct = (values - prev) / prev
 
-            detected = group_df[mask].copy()
+        if calendar_fill is None:
+            frame = agg.frame.copy()
+            frame["prev_value"] = prev
+            frame["pct_change"] = pct
 
+        hits = []
+        for detector, threshold, mask in (
+            ("pct_drop", drop_threshold, lambda t: pct < -t),
+            ("pct_spike", spike_threshold, lambda t: pct > t),
+        ):
+            if threshold is None:
+                continue
+            if calendar_fill is None:
+                detected = frame[mask(threshold)]
+            else:
+                detected = agg.dense_hits(
+                    values, mask(threshold), {"prev_value": prev, "pct_change": pct}
+                )
             if not detected.empty:
-                outlier_frames.append(detected)
-
-                for _, row in detected.iterrows():
-                    date_str = row["Order Date"].strftime("%Y-%m-%d")
-                    pct_drop = abs(row["pct_change"]) * 100
-                    score = min(10.0, pct_drop / 10)
-
-                    rec = AnomalyRecord(
-                        anomaly_id=self._generate_id(
-                            date_str, entity, "pct_drop", score
-                        ),
-                        level="category",
-                        entity_id=entity,
-                        period_start=date_str,
-                        period_end=date_str,
-                        metric=target_col,
-                        value=float(row[target_col]),
-                        expected=float(row["prev_value"]),
-                        score=score,
-                        detector="pct_drop",
-                        reason=f"Extreme drop: {pct_drop:.1f}% from {row['prev_value']:.0f} to {row[target_col]:.0f}",
-                        context={"pct_change": float(row["pct_change"])},
-                    )
+                hits.append((detector, detected))
+        return hits
 
-                    self.anomalies.append(rec)
-
-        return pd.concat(outlier_frames) if outlier_frames else pd.DataFrame()
+    def detect_percentage_drop(
+        self, target_col="Sales", group_col="Category", threshold=0.5, window=3
+    ) -> pd.DataFrame:
+        """Detect extreme percentage drops (e.g., 50% or more) within a group."""
+        hits = self.detect_percentage_change(
+            target_col, group_col, drop_threshold=threshold, spike_threshold=None
+        )
+        return hits.drop(columns="detector") if not hits.empty else hits
 
     def detect_percentage_spike(
         self, target_col="Sales", group_col="Category", threshold=0.5, window=3
     ) -> pd.DataFrame:
         """Detect extreme percentage spikes (e.g., 50% or more) within a group."""
+        hits = self.detect_percentage_change(
+            target_col, group_col, drop_threshold=None, spike_threshold=threshold
+        )
+        return hits.drop(columns="detector") if not hits.empty else hits
+
+    def _emit_pct_batch(
+        self,
+        outliers,
+        group_col,
+        target_col,
+        detector,
+        level="category",
+        extra_context=None,
+    ):
+        """Builds pct_drop / pct_spike records for all hits in one batch."""
+        dates = outliers["Order Date"].dt.strftime("%Y-%m-%d").tolist()
+        entities = outliers[group_col].to_numpy()
+        pct = outliers["pct_change"].to_numpy(dtype=float)
+        prev = outliers["prev_value"].to_numpy(dtype=float)
+        value = outliers[target_col].to_numpy(dtype=float)
+
+        if detector == "pct_drop":
+            pct_move = np.abs(pct) * 100
+            scores = np.minimum(10.0, pct_move / 10)
+            reasons = [
+                f"Extreme drop: {m:.1f}% from {p:.0f} to {v:.0f}"
+                for m, p, v in zip(pct_move.tolist(), prev.tolist(), value.tolist())
+            ]
+        else:
+            pct_move = pct * 100
+            scores = np.minimum(10.0, pct_move / 20)
+            reasons = [
+                f"Extreme spike: +{m:.1f}% from {p:.0f} to {v:.0f}"
+                for m, p, v in zip(pct_move.tolist(), prev.tolist(), value.tolist())
+            ]
+
+        self.anomalies.append_batch(
+            {
+                "anomaly_id": self._generate_ids(
+                    dates, entities, detector, scores, target_col
+                ),
+                "level": level,
+                "entity_id": entities,
+                "period_start": dates,
+                "period_end": dates,
+                "metric": target_col,
+                "value": value,
+                "expected": prev,
+                "score": scores,
+                "detector": detector,
+                "reason": reasons,
+            },
+            context={"pct_change": pct, **(extra_context or {})},
+        )
+
+    def detect_seasonal(
+        self,
+        group_col: Optional[str] = None,
+        target_col="Sales",
+        threshold=5.0,
+        trend_window=91,
+        calendar_fill="nan",
+        min_coverage=0.5,
+        model="multiplicative",
+    ) -> pd.DataFrame:
+        """
+        Seasonal-baseline detector: scores each day against trend x month-of-year
+        x day-of-week profiles instead of a plain trailing mean, so regular
+        weekly and holiday patterns are not flagged.
+        Every entity series is decomposed at once on the calendar matrix:
+        - trend: centered rolling mean over `trend_window` days
+        - month / weekday effects: mean detrended ratio per month and weekday
+        model="additive" uses differences instead (e.g. for Profit, which can
+        be negative). Residuals are scaled by the entity's MAD (std when the
+        MAD is 0), so a few extreme days do not inflate the scale the way a
+        rolling std does; robust z-scores run larger, hence the higher default
+        threshold.
+        Entities with orders on fewer than `min_coverage` of their days are
+        skipped: sparse series have no stable profile (use the IQR / pct
+        detectors there). group_col=None scores the global daily series.
+        """
+        if model not in SEASONAL_MODELS:
+            raise ValueError(f"model must be one of {SEASONAL_MODELS}, got {model!r}")
         logger.info(
-            f"Running Percentage Spike Detector on {group_col} (threshold={threshold*100}%)"
+            f"Running Seasonal Baseline Detector on {group_col or 'Global'} "
+            f"(t={threshold}, trend={trend_window}d, {model})"
         )
 
-        grouped = (
-            self.df.groupby(["Order Date", group_col])[target_col].sum().reset_index()
+        agg = self.aggregate(group_col, target_col)
+        matrix = agg.dense(_calendar_fill(calendar_fill), calendar=True)
+        days = agg.calendar()
+        # No weekday profile to score against before one full week
+        if matrix.size == 0 or len(days) < 7:
+            return pd.DataFrame()
+
+        # Share of each entity's days (since its first order) that had orders
+        active = (~np.isnan(agg.dense(calendar=True))).sum(axis=0)
+        span = (~np.isnan(agg.dense(0.0, calendar=True))).sum(axis=0)
+        coverage = active / np.maximum(span, 1)
+        observed = ~np.isnan(matrix) & (coverage >= min_coverage)
+
+        if model == "multiplicative":
+            combine, remove, neutral = np.multiply, np.divide, 1.0
+        else:
+            combine, remove, neutral = np.add, np.subtract, 0.0
+        months = days.month.to_numpy() - 1
+        weekdays = days.dayofweek.to_numpy()
+
+        # STL-style: the second pass re-estimates the trend on the
+        # deseasonalized series so strong seasons do not leak into it
+        seasonal = np.full(matrix.shape, neutral)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for _ in range(2):
+                trend = (
+                    pd.DataFrame(remove(matrix, seasonal))
+                    .rolling(window=trend_window, center=True, min_periods=1)
+                    .mean()
+                    .to_numpy()
+                )
+                detrended = remove(matrix, trend)
+                month = _seasonal_profile(detrended, months, 12, neutral)
+                weekday = _seasonal_profile(
+                    remove(detrended, month), weekdays, 7, neutral
+                )
+                seasonal = combine(month, weekday)
+
+            expected = combine(trend, seasonal)
+            # Relative residuals for the multiplicative model keep busy and
+            # quiet days on the same scale
+            resid = remove(matrix, expected) - neutral
+        resid = np.where(observed & np.isfinite(resid), resid, np.nan)
+
+        with warnings.catch_warnings():
+            # Entities with no observed days give all-NaN columns
+            warnings.simplefilter("ignore", RuntimeWarning)
+            center = np.nanmedian(resid, axis=0)
+            scale = 1.4826 * np.nanmedian(np.abs(resid - center), axis=0)
+            scale = np.where(scale > 0, scale, np.nanstd(resid, axis=0))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.where(scale > 0, resid / scale, np.nan)
+        mask = observed & (np.abs(z) > threshold)
+
+        detected = agg.dense_hits(
+            matrix,
+            mask,
+            {
+                "expected": expected,
+                "trend": trend,
+                "month_effect": month,
+                "weekday_effect": weekday,
+                "zscore": z,
+            },
+        )
+        if detected.empty:
+            return detected
+
+        dates = detected["Order Date"].dt.strftime("%Y-%m-%d").tolist()
+        if group_col is None:
+            entities = np.full(len(detected), "All_Regions", dtype=object)
+            id_entities = ["Global"] * len(detected)
+        else:
+            entities = (
+                pd.Series(detected[group_col], dtype=object).astype(str).to_numpy()
+            )
+            id_entities = detected[group_col].to_numpy()
+        scores = _round2(np.abs(detected["zscore"]))
+        self.anomalies.append_batch(
+            {
+                "anomaly_id": self._generate_ids(
+                    dates, id_entities, "seasonal", scores, target_col
+                ),
+                "level": "global" if group_col is None else group_col.lower(),
+                "entity_id": entities,
+                "period_start": dates,
+                "period_end": dates,
+                "metric": target_col,
+                "value": detected[target_col].to_numpy(dtype=float),
+                "expected": _round2(detected["expected"]),
+                "score": scores,
+                "detector": "seasonal",
+                "reason": [
+                    f"Deviates from seasonal baseline (Z={v})" for v in scores.tolist()
+                ],
+            },
+            context={
+                "trend": _round2(detected["trend"]),
+                "month_effect": _round2(detected["month_effect"]),
+                "weekday_effect": _round2(detected["weekday_effect"]),
+            },
+        )
+        return detected
+
+    def detect_level_shifts(
+        self,
+        group_col: Optional[str] = None,
+        target_col="Sales",
+        k=0.5,
+        h=8.0,
+        clip=3.0,
+        min_segment=7,
+        min_shift=1.5,
+        calendar_fill="zero",
+    ) -> pd.DataFrame:
+        """
+        Two-sided CUSUM change-point detector for sustained level shifts.
+        Runs on the calendar matrix, one time step at a time for all entities
+        together (O(n) per series). Values are first winsorized to +-`clip`
+        noise units around a centered rolling median; each day's deviation
+        from the current segment mean is scaled by the entity's noise level
+        and clipped to +-`clip`, so a single-day spike cannot raise an alarm
+        on its own. An alarm fires when either sum exceeds `h`; the change is
+        then located at the split of the current segment that best separates
+        the two means, and the next segment starts there. Changes smaller
+        than `min_shift` noise units, or reverted within `min_segment` days,
+        are merged away. Emits one record per remaining shift, its period
+        covering the new segment.
+        """
+        logger.info(
+            f"Running Level Shift Detector on {group_col or 'Global'} (k={k}, h={h})"
         )
 
-        outlier_frames = []
+        agg = self.aggregate(group_col, target_col)
+        matrix = agg.dense(_calendar_fill(calendar_fill), calendar=True)
+        days = agg.calendar()
+        n_days, n_entities = matrix.shape
+        # The CUSUM only arms once a segment has min_segment days
+        if n_days <= min_segment:
+            return pd.DataFrame()
 
-        for entity, group_df in grouped.groupby(group_col):
-            group_df = group_df.sort_values("Order Date").copy()
+        # Noise level from day-to-day differences is insensitive to the shifts
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            diffs = np.diff(matrix, axis=0) / np.sqrt(2)
+            sigma = 1.4826 * np.nanmedian(np.abs(diffs), axis=0)
+            sigma = np.where(sigma > 0, sigma, np.nanstd(diffs, axis=0))
+        sigma = np.where(np.isfinite(sigma) & (sigma > 0), sigma, np.nan)
 
-            # Calculate previous day's value
-            group_df["prev_value"] = group_df[target_col].shift(1)
+        # Winsorize around a centered rolling median so isolated spikes do not
+        # drag the segment means (a step moves the centered median with it)
+        half = min_segment
+        median = rolling_quantiles_2d(matrix, 2 * half + 1, (0.5,))[:, :, 0]
+        median = np.vstack([median[half:], np.repeat(median[-1:], half, axis=0)])
+        matrix = np.clip(matrix, median - clip * sigma, median + clip * sigma)
 
-            # Calculate percentage change
-            group_df["pct_change"] = (
-                group_df[target_col] - group_df["prev_value"]
-            ) / group_df["prev_value"]
+        valid = ~np.isnan(matrix)
+        csum = np.vstack(
+            [np.zeros(n_entities), np.cumsum(np.where(valid, matrix, 0.0), axis=0)]
+        )
+        ccnt = np.vstack([np.zeros(n_entities), np.cumsum(valid, axis=0)])
 
-            # Detect extreme spikes (positive percentage change beyond threshold)
-            mask = group_df["pct_change"] > threshold
+        def locate(e, lo, t):
+            # Most likely single change in [lo, t]: the split maximising the
+            # standardised difference between the two sub-segment means
+            tau = np.arange(lo + 1, t + 1)
+            n1 = ccnt[tau, e] - ccnt[lo, e]
+            n2 = ccnt[t + 1, e] - ccnt[tau, e]
+            m1 = (csum[tau, e] - csum[lo, e]) / np.maximum(n1, 1)
+            m2 = (csum[t + 1, e] - csum[tau, e]) / np.maximum(n2, 1)
+            stat = np.abs(m2 - m1) * np.sqrt(n1 * n2 / np.maximum(n1 + n2, 1))
+            return tau[np.argmax(stat)]
 
-            detected = group_df[mask].copy()
+        cols = np.arange(n_entities)
+        seg_start = np.zeros(n_entities, dtype=np.int64)
+        s_hi = np.zeros(n_entities)
+        s_lo = np.zeros(n_entities)
+        changes = []  # (entity, change day, alarm day)
 
-            if not detected.empty:
-                outlier_frames.append(detected)
-
-                for _, row in detected.iterrows():
-                    date_str = row["Order Date"].strftime("%Y-%m-%d")
-                    pct_rise = row["pct_change"] * 100
-                    score = min(10.0, pct_rise / 20)
-
-                    rec = AnomalyRecord(
-                        anomaly_id=self._generate_id(
-                            date_str, entity, "pct_spike", score
-                        ),
-                        level="category",
-                        entity_id=entity,
-                        period_start=date_str,
-                        period_end=date_str,
-                        metric=target_col,
-                        value=float(row[target_col]),
-                        expected=float(row["prev_value"]),
-                        score=score,
-                        detector="pct_spike",
-                        reason=f"Extreme spike: +{pct_rise:.1f}% from {row['prev_value']:.0f} to {row[target_col]:.0f}",
-                        context={"pct_change": float(row["pct_change"])},
+        for t in range(n_days):
+            seg_n = ccnt[t, cols] - ccnt[seg_start, cols]
+            seg_mean = (csum[t, cols] - csum[seg_start, cols]) / np.maximum(seg_n, 1)
+            live = valid[t] & (seg_n >= min_segment) & ~np.isnan(sigma)
+            if not live.any():
+                continue
+            z = np.clip((matrix[t] - seg_mean) / sigma, -clip, clip)
+            s_hi = np.where(live, np.maximum(0.0, s_hi + z - k), s_hi)
+            s_lo = np.where(live, np.maximum(0.0, s_lo - z - k), s_lo)
+
+            alarm = np.flatnonzero((s_hi > h) | (s_lo > h))
+            for e in alarm:
+                seg_start[e] = locate(e, seg_start[e], t)
+                changes.append((e, seg_start[e], t))
+            s_hi[alarm] = 0.0
+            s_lo[alarm] = 0.0
+
+        if not changes:
+            return pd.DataFrame()
+
+        entity, start, alarm_day = (np.array(c) for c in zip(*changes))
+        order = np.lexsort((start, entity))
+        entity, start, alarm_day = entity[order], start[order], alarm_day[order]
+
+        first_day = np.argmax(valid, axis=0)
+
+        def segments(entity, start):
+            # Bounds run from the previous change (or series start) to the next
+            same_prev = np.r_[False, entity[1:] == entity[:-1]]
+            same_next = np.r_[entity[1:] == entity[:-1], False]
+            prev_start = np.where(same_prev, np.r_[0, start[:-1]], first_day[entity])
+            end = np.where(same_next, np.r_[start[1:], 0], n_days)
+
+            def mean(lo, hi):
+                count = ccnt[hi, entity] - ccnt[lo, entity]
+                return (csum[hi, entity] - csum[lo, entity]) / np.maximum(count, 1)
+
+            before, after = mean(prev_start, start), mean(start, end)
+            return end, before, after, (after - before) / sigma[entity]
+
+        # Merge away changes smaller than `min_shift` noise units and blips
+        # that revert within `min_segment` days (the neighbouring segments
+        # then grow, so re-check until stable)
+        while True:
+            end, before, after, shift = segments(entity, start)
+            transient = (end - start < min_segment) & (end < n_days)
+            keep = (np.abs(shift) >= min_shift) & ~transient
+            if keep.all():
+                break
+            entity, start, alarm_day = entity[keep], start[keep], alarm_day[keep]
+        if len(entity) == 0:
+            return pd.DataFrame()
+
+        keys = agg.frame.iloc[agg.starts]
+        labels = (
+            keys[group_col].to_numpy()[entity]
+            if group_col is not None
+            else np.full(len(entity), "All_Regions", dtype=object)
+        )
+        detected = pd.DataFrame(
+            {
+                group_col or "entity": labels,
+                "period_start": days[start],
+                "period_end": days[end - 1],
+                "detected_on": days[alarm_day],
+                "prior_mean": before,
+                "segment_mean": after,
+                "shift_sigma": shift,
+            }
+        )
+
+        starts = detected["period_start"].dt.strftime("%Y-%m-%d").tolist()
+        ends = detected["period_end"].dt.strftime("%Y-%m-%d").tolist()
+        id_entities = labels if group_col is not None else ["Global"] * len(labels)
+        scores = _round2(np.abs(shift))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pct = (after - before) / np.abs(before) * 100
+        reasons = [
+            f"Level shift {'up' if p > 0 else 'down'} {abs(p):.1f}%: "
+            f"{b:.0f} -> {a:.0f} per day"
+            for p, b, a in zip(pct.tolist(), before.tolist(), after.tolist())
+        ]
+        self.anomalies.append_batch(
+            {
+                "anomaly_id": self._generate_ids(
+                    starts, id_entities, "level_shift", scores, target_col
+                ),
+                "level": "global" if group_col is None else group_col.lower(),
+                "entity_id": pd.Series(labels, dtype=object).astype(str).to_numpy(),
+                "period_start": starts,
+                "period_end": ends,
+                "metric": target_col,
+                "value": _round2(after),
+                "expected": _round2(before),
+                "score": scores,
+                "detector": "level_shift",
+                "reason": reasons,
+            },
+            context={
+                "detected_on": detected["detected_on"].dt.strftime("%Y-%m-%d").tolist(),
+                "segment_days": (end - start).tolist(),
+                "sigma": _round2(sigma[entity]),
+            },
+        )
+        return detected
+
+    def detect_forecast(
+        self,
+        group_col: Optional[str] = None,
+        target_col="Sales",
+        model="holt_winters",
+        threshold=4.0,
+        season=7,
+        calendar_fill="zero",
+        min_periods=28,
+    ) -> pd.DataFrame:
+        """
+        Forecast-baseline detector: each day is compared with its one-step-
+        ahead exponential smoothing forecast (see agents.forecast_baselines),
+        which becomes the record's `expected`; the score is the forecast error
+        in units of the prediction interval sigma. All entity series are
+        fitted at once on the calendar matrix. model is "ses", "holt" or
+        "holt_winters" (weekly season by default).
+        """
+        logger.info(
+            f"Running Forecast Baseline Detector on {group_col or 'Global'} "
+            f"({model}, t={threshold})"
+        )
+
+        agg = self.aggregate(group_col, target_col)
+        matrix = agg.dense(_calendar_fill(calendar_fill), calendar=True)
+        if matrix.size == 0:
+            return pd.DataFrame()
+        fit = exponential_smoothing(
+            matrix, model=model, season=season, min_periods=min_periods
+        )
+        z = fit.score(matrix)
+        lower, upper = fit.interval(threshold)
+        mask = np.abs(np.nan_to_num(z)) > threshold
+
+        detected = agg.dense_hits(
+            matrix,
+            mask,
+            {
+                "forecast": fit.forecast,
+                "sigma": fit.sigma,
+                "lower": lower,
+                "upper": upper,
+                "alpha": np.broadcast_to(fit.alpha, matrix.shape),
+                "zscore": z,
+            },
+        )
+        if detected.empty:
+            return detected
+
+        dates = detected["Order Date"].dt.strftime("%Y-%m-%d").tolist()
+        if group_col is None:
+            entities = np.full(len(detected), "All_Regions", dtype=object)
+            id_entities = ["Global"] * len(detected)
+        else:
+            entities = (
+                pd.Series(detected[group_col], dtype=object).astype(str).to_numpy()
+            )
+            id_entities = detected[group_col].to_numpy()
+        scores = _round2(np.abs(detected["zscore"]))
+        self.anomalies.append_batch(
+            {
+                "anomaly_id": self._generate_ids(
+                    dates, id_entities, "forecast", scores, target_col
+                ),
+                "level": "global" if group_col is None else group_col.lower(),
+                "entity_id": entities,
+                "period_start": dates,
+                "period_end": dates,
+                "metric": target_col,
+                "value": detected[target_col].to_numpy(dtype=float),
+                "expected": _round2(detected["forecast"]),
+                "score": scores,
+                "detector": "forecast",
+                "reason": [
+                    f"{'Above' if z > 0 else 'Below'} {model} forecast (Z={s})"
+                    for z, s in zip(detected["zscore"].tolist(), scores.tolist())
+                ],
+            },
+            context={
+                "lower": _round2(detected["lower"]),
+                "upper": _round2(detected["upper"]),
+                "alpha": detected["alpha"].to_numpy(),
+                "model": model,
+            },
+        )
+        return detected
+
+    def detect_hierarchical(
+        self,
+        levels=("Region", "Category", "Sub-Category"),
+        target_col="Sales",
+        detectors=HIERARCHY_DETECTORS,
+        window=14,
+        k=1.5,
+        drop_threshold: Optional[float] = 0.5,
+        spike_threshold: Optional[float] = 0.5,
+    ) -> pd.DataFrame:
+        """
+        Drill-down detection over a hierarchy such as Region > Category >
+        Sub-Category. The leaf level is aggregated once and rolled up (see
+        aggregate_hierarchy); the chosen detectors then run vectorized over
+        all entities of every level.
+        Each hit is attributed to the deepest level that also flags it on the
+        same day: `explained_by` names that level and `driver` the descendant
+        with the largest deviation there. A parent flagged with no flagged
+        children is explained by its own level (a diffuse, aggregate-only move).
+        Returns one row per hit; records carry the same fields in `context`.
+        """
+        unknown = set(detectors) - set(HIERARCHY_DETECTORS)
+        if unknown:
+            raise ValueError(f"Unknown hierarchical detectors: {sorted(unknown)}")
+        logger.info(
+            f"Running Hierarchical Detector on {' > '.join(levels)} ({', '.join(detectors)})"
+        )
+
+        parts = []
+        for depth, agg in enumerate(self.aggregate_hierarchy(levels, target_col), 1):
+            found = []
+            if "iqr" in detectors:
+                detected = self._iqr_hits(agg, window, k)
+                if not detected.empty:
+                    found.append(
+                        ("iqr", detected, self._iqr_expected(detected, target_col)[1])
+                    )
+            if "pct" in detectors:
+                for detector, detected in self._pct_hits(
+                    agg, drop_threshold, spike_threshold
+                ):
+                    found.append(
+                        (detector, detected, detected["prev_value"].to_numpy())
                     )
+            for detector, detected, expected in found:
+                parts.append((agg, detector, detected, expected, depth))
+
+        if not parts:
+            return pd.DataFrame()
+
+        hits = pd.concat(
+            [
+                self._hierarchy_rows(agg, detector, detected, expected, depth)
+                for agg, detector, detected, expected, depth in parts
+            ],
+            ignore_index=True,
+        )
+        hits = self._attribute_hits(hits, len(levels))
+
+        start = 0
+        for agg, detector, detected, _, _ in parts:
+            rows = hits.iloc[start : start + len(detected)]
+            start += len(detected)
+            context = {
+                c: rows[c].to_numpy()
+                for c in ("depth", "parent", "explained_by", "driver")
+            }
+            level = agg.group_col.lower()
+            if detector == "iqr":
+                self._emit_iqr_batch(
+                    detected, agg.group_col, target_col, extra_context=context
+                )
+            else:
+                self._emit_pct_batch(
+                    detected,
+                    agg.group_col,
+                    target_col,
+                    detector,
+                    level=level,
+                    extra_context=context,
+                )
+
+        return hits
+
+    @staticmethod
+    def _hierarchy_rows(agg, detector, detected, expected, depth) -> pd.DataFrame:
+        value = detected[agg.target_col].to_numpy(dtype=float)
+        entities = pd.Series(detected[agg.group_col].to_numpy(), dtype=object)
+        if agg.parent is None:
+            parent = np.full(len(detected), "", dtype=object)
+        else:
+            parent = agg.parent[pd.Index(agg.entities).get_indexer(entities)]
+        return pd.DataFrame(
+            {
+                "Order Date": detected["Order Date"].to_numpy(),
+                "depth": depth,
+                "level": agg.group_col,
+                "entity_id": entities.astype(str).to_numpy(),
+                "parent": pd.Series(parent, dtype=object).astype(str).to_numpy(),
+                "detector": detector,
+                "value": value,
+                "expected": expected,
+                "deviation": np.abs(value - expected),
+            }
+        )
+
+    @staticmethod
+    def _attribute_hits(hits: pd.DataFrame, n_levels: int) -> pd.DataFrame:
+        """Fills explained_by / driver bottom-up, one merge per level."""
+        hits = hits.copy()
+        hits["explained_depth"] = hits["depth"]
+        hits["explained_by"] = hits["level"]
+        hits["driver"] = hits["entity_id"]
+        hits["driver_deviation"] = hits["deviation"]
+        carried = ["explained_depth", "explained_by", "driver", "driver_deviation"]
+
+        for depth in range(n_levels - 1, 0, -1):
+            children = hits[hits["depth"] == depth + 1]
+            if children.empty:
+                continue
+            # Deepest explanation first, then the largest deviation
+            best = children.sort_values(
+                ["explained_depth", "driver_deviation"],
+                ascending=False,
+                kind="stable",
+            ).drop_duplicates(["Order Date", "parent"])
 
-                    self.anomalies.append(rec)
+            is_parent = (hits["depth"] == depth).to_numpy()
+            merged = hits.loc[is_parent, ["Order Date", "entity_id"]].merge(
+                best[["Order Date", "parent", *carried]],
+                left_on=["Order Date", "entity_id"],
+                right_on=["Order Date", "parent"],
+                how="left",
+            )
+            has_child = merged["explained_depth"].notna().to_numpy()
+            target = hits.index[is_parent][has_child]
+            for col in carried:
+                hits.loc[target, col] = merged.loc[has_child, col].to_numpy()
 
-        return pd.concat(outlier_frames) if outlier_frames else pd.DataFrame()
+        hits["explained_depth"] = hits["explained_depth"].astype(int)
+        return hits.drop(columns="driver_deviation")
 
     def get_anomalies_df(self) -> pd.DataFrame:
-        return pd.DataFrame([asdict(r) for r in self.anomalies])
-
-    def save_payload(self, output_path: str):
-        data = [asdict(r) for r in self.anomalies]
-        data.sort(key=lambda x: x["score"], reverse=True)
-        payload = {
-            "count": len(data),
-            "top_anomalies": data[:50],
-            "all_anomalies": data,
-        }
-        path = Path(output_path)
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with open(path, "w") as f:
-            json.dump(payload, f, indent=2)
-        logger.info(f"Saved {len(data)} anomalies to {output_path}")
+        return self.anomalies.to_frame()
+
+    def consolidate_anomalies(
+        self, gap_days: int = 1, calibration=None
+    ) -> AnomalyTable:
+        """
+        Merges the raw hits of every detector into one record per episode
+        (same entity and metric; periods within `gap_days` of each other).
+        The score is the combined severity on a 0-100 scale; the context
+        lists the member anomaly ids and each detector's top score. Ids are
+        built from metric, entity and period only, so they are stable across
+        re-runs.
+        A ScoreCalibration (agents.anomaly_ranking) rates hits against earlier
+        runs instead of only this run's hits.
+        """
+        hits = self.anomalies.to_frame(with_context=False)
+        percentiles = None
+        if calibration is not None and not hits.empty:
+            percentiles = calibration.percentiles(hits)
+        episodes, context = consolidate(hits, gap_days, percentiles)
+        table = AnomalyTable()
+        if episodes.empty:
+            return table
+        scores = _round2(episodes["severity"].to_numpy() * 100)
+        # Episode ids carry no score: severity moves with the calibration, and
+        # downstream idempotency keys need the same id for the same episode
+        entities = episodes["entity_id"].astype(str).str.replace(" ", "_")
+        starts = episodes["period_start"].astype(str)
+        ends = episodes["period_end"].astype(str)
+        ids = np.empty(len(episodes), dtype=object)
+        for metric, rows in episodes.groupby("metric", sort=False).indices.items():
+            prefix = self._id_prefix("episode", metric)
+            ids[rows] = [
+                f"{prefix}_{e}_{s}_{t}"
+                for e, s, t in zip(
+                    entities.iloc[rows], starts.iloc[rows], ends.iloc[rows]
+                )
+            ]
+        table.append_batch(
+            {
+                **{c: episodes[c].to_numpy() for c in RECORD_COLUMNS if c in episodes},
+                "anomaly_id": ids,
+                "score": scores,
+            },
+            context=context,
+        )
+        logger.info(
+            f"Consolidated {len(self.anomalies)} hits into {len(table)} episodes"
+        )
+        return table
+
+    def stream_to(self, output_path: str, top_n: int = DEFAULT_TOP_N, ranker=None):
+        """
+        Starts streaming anomalies to `output_path` (summary JSON) and its
+        .jsonl/.parquet siblings; records already detected are written first.
+        An optional TopKRanker (agents.anomaly_ranking) sees every record too.
+        """
+        self.anomalies.attach(
+            AnomalyArtifactWriter(output_path, top_n=top_n, ranker=ranker)
+        )
+
+    def save_payload(self, output_path: str, top_n: int = DEFAULT_TOP_N) -> Dict:
+        """
+        Finishes the anomaly artifacts and returns the summary (counts and
+        top_anomalies). Without a prior stream_to(output_path), every record
+        is written now.
+        """
+        writer = self.anomalies.writer
+        if writer is None or writer.summary_path != Path(output_path):
+            if writer is not None:
+                writer.close()
+            self.stream_to(output_path, top_n=top_n)
+        summary = self.anomalies.writer.close()
+        self.anomalies.writer = None
+        return summary
 
 
 if __name__ == "__main__":
-    # ... (CLI remains the same)
+    from agents.detector_registry import EXECUTORS, DetectorRunner
+
     parser = argparse.ArgumentParser(description="Run Anomaly Detection")
     parser.add_argument("--snapshot", required=True)
     parser.add_argument("--out", required=True)
+    parser.add_argument(
+        "--detectors",
+        help="Detector config: JSON list or path to a JSON file (see detector_registry)",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--executor",
+        choices=EXECUTORS,
+        default="thread",
+        help="Detector pool; 'process' forks worker processes",
+    )
     args = parser.parse_args()
     if not Path(args.snapshot).exists():
         sys.exit(1)
+
+    config = [
+        {"detector": "zscore", "window": 30, "threshold": 3.0},
+        {"detector": "iqr", "group_col": "Region", "window": 14, "k": 1.5},
+        {"detector": "iqr", "group_col": "Category", "window": 14, "k": 1.5},
+    ]
+    if args.detectors:
+        source = Path(args.detectors)
+        config = json.loads(source.read_text() if source.exists() else args.detectors)
+
     df = pd.read_parquet(args.snapshot)
     agent = AnomalyStatAgent(df)
-    agent.detect_global_zscore(30, 3.0)
-    agent.detect_grouped_iqr("Region", "Sales", 14, 1.5)
-    agent.detect_grouped_iqr("Category", "Sales", 14, 1.5)
+    DetectorRunner(agent, max_workers=args.workers, executor=args.executor).run(config)
     agent.save_payload(args.out)
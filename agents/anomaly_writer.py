@@ -0,0 +1,202 @@
+"""
+agents/anomaly_writer.py
+Streaming anomaly artifacts.
+
+Detector batches are written as they are produced to:
+- <name>.jsonl: one JSON record per line, in detection order. Non-finite
+  floats (NaN, +-inf) are written as null, as in the Parquet file.
+- <name>.parquet: the same records with a typed schema (dates as date32,
+  scores as float64, context as a JSON string column).
+- <name>.json: a small summary (counts plus the top-N records by score),
+  kept with a bounded heap so the full record list is never re-sorted.
+  With a ranker (see agents.anomaly_ranking) the summary also holds its
+  calibrated, entity-diverse picks as `ranked_anomalies`.
+"""
+
+import json
+import math
+import heapq
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_SCHEMA = pa.schema(
+    [
+        ("anomaly_id", pa.string()),
+        ("level", pa.string()),
+        ("entity_id", pa.string()),
+        ("period_start", pa.date32()),
+        ("period_end", pa.date32()),
+        ("metric", pa.string()),
+        ("value", pa.float64()),
+        ("expected", pa.float64()),
+        ("score", pa.float64()),
+        ("detector", pa.string()),
+        ("reason", pa.string()),
+        ("context", pa.string()),
+    ]
+)
+
+DEFAULT_TOP_N = 50
+
+
+def _json_safe(value):
+    """Copy of `value` with non-finite floats replaced by None (JSON null)."""
+    if isinstance(value, (float, np.floating)):
+        return float(value) if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    return value
+
+
+def _dumps(value, **kwargs) -> str:
+    return json.dumps(_json_safe(value), allow_nan=False, **kwargs)
+
+
+class AnomalyArtifactWriter:
+    """
+    Writes anomaly batches to JSONL and Parquet as they arrive and keeps the
+    top-N by score. Ties keep detection order, matching a stable sort of the
+    full list.
+
+    Usage:
+        with AnomalyArtifactWriter("run/anomalies.json") as writer:
+            writer.write_batch(frame, contexts)
+        writer.summary  # counts + top_anomalies
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        top_n: int = DEFAULT_TOP_N,
+        row_group_size: int = 65536,
+        ranker=None,
+    ):
+        path = Path(output_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.summary_path = path
+        self.jsonl_path = path.with_suffix(".jsonl")
+        self.parquet_path = path.with_suffix(".parquet")
+        self.top_n = top_n
+        self.row_group_size = row_group_size
+        self.ranker = ranker
+
+        self._jsonl = open(self.jsonl_path, "w")
+        self._parquet = pq.ParquetWriter(str(self.parquet_path), ANOMALY_SCHEMA)
+        self._pending: List[pa.Table] = []
+        self._pending_rows = 0
+        # Min-heap of (score, -sequence, record): the root is the weakest entry
+        self._heap: List[tuple] = []
+        self._count = 0
+        self._by_detector: Counter = Counter()
+        self._by_level: Counter = Counter()
+        self.summary: Optional[Dict[str, Any]] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_batch(self, frame: pd.DataFrame, contexts: List[Dict[str, Any]]):
+        """Appends one detector batch (record columns plus per-row context)."""
+        n = len(frame)
+        if n == 0:
+            return
+        records = frame.to_dict("records")
+        for rec, ctx in zip(records, contexts):
+            rec["context"] = ctx
+            self._jsonl.write(_dumps(rec) + "\n")
+
+        self._pending.append(self._to_arrow(frame, contexts))
+        self._pending_rows += n
+        if self._pending_rows >= self.row_group_size:
+            self._flush()
+
+        self._push_top(frame["score"].to_numpy(dtype=float), records)
+        if self.ranker is not None:
+            self.ranker.write_batch(frame, contexts)
+        self._by_detector.update(frame["detector"].tolist())
+        self._by_level.update(frame["level"].tolist())
+        self._count += n
+
+    @staticmethod
+    def _to_arrow(frame: pd.DataFrame, contexts: List[Dict[str, Any]]) -> pa.Table:
+        arrays = []
+        for field in ANOMALY_SCHEMA:
+            if field.name == "context":
+                arrays.append(pa.array([_dumps(c) for c in contexts], pa.string()))
+            elif pa.types.is_date32(field.type):
+                arrays.append(pa.array(frame[field.name], pa.string()).cast(field.type))
+            elif pa.types.is_floating(field.type):
+                values = frame[field.name].to_numpy(dtype=float)
+                arrays.append(pa.array(values, mask=~np.isfinite(values)))
+            else:
+                arrays.append(pa.array(frame[field.name].astype(str), pa.string()))
+        return pa.Table.from_arrays(arrays, schema=ANOMALY_SCHEMA)
+
+    def _flush(self):
+        if self._pending:
+            self._parquet.write_table(pa.concat_tables(self._pending))
+            self._pending, self._pending_rows = [], 0
+
+    def _push_top(self, scores: np.ndarray, records: List[Dict[str, Any]]):
+        if self.top_n <= 0:
+            return
+        # Only the batch's own top-N can make it into the overall top-N
+        keys = np.where(np.isnan(scores), -np.inf, scores)
+        order = np.argsort(-keys, kind="stable")[: self.top_n]
+        for i in order.tolist():
+            entry = (keys[i], -(self._count + i), records[i])
+            if len(self._heap) < self.top_n:
+                heapq.heappush(self._heap, entry)
+            elif entry[:2] > self._heap[0][:2]:
+                heapq.heapreplace(self._heap, entry)
+            else:
+                break  # the rest of the batch scores lower still
+
+    def top(self) -> List[Dict[str, Any]]:
+        """Top-N records so far, highest score first."""
+        ranked = sorted(self._heap, key=lambda e: (-e[0], -e[1]))
+        return [rec for _, _, rec in ranked]
+
+    def close(self) -> Dict[str, Any]:
+        """Finishes both record files and writes the summary JSON."""
+        if self.summary is not None:
+            return self.summary
+        self._flush()
+        self._parquet.close()
+        self._jsonl.close()
+        self.summary = {
+            "count": self._count,
+            "by_detector": dict(self._by_detector),
+            "by_level": dict(self._by_level),
+            "top_anomalies": self.top(),
+            "files": {
+                "jsonl": self.jsonl_path.name,
+                "parquet": self.parquet_path.name,
+            },
+        }
+        if self.ranker is not None:
+            self.summary["ranked_anomalies"] = self.ranker.top()
+        with open(self.summary_path, "w") as f:
+            f.write(_dumps(self.summary, indent=2))
+        logger.info(f"Saved {self._count} anomalies to {self.summary_path}")
+        return self.summary
+
+
+def read_anomalies(path: str) -> pd.DataFrame:
+    """Loads an anomalies.parquet artifact, decoding the context column."""
+    frame = pq.read_table(path).to_pandas()
+    frame["context"] = [json.loads(c) if c else {} for c in frame["context"]]
+    return frame
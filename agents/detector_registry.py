@@ -0,0 +1,223 @@
+"""
+agents/detector_registry.py
+Detector plugin registry and concurrent runner.
+
+A detector registers under a short name with the callable that runs it and
+the parameters that select its daily aggregate (group column and metric).
+DetectorRunner takes a config such as
+
+    [{"detector": "zscore", "threshold": 2.0},
+     {"detector": "iqr", "group_col": "Region", "k": 1.5}]
+
+builds every aggregate the config needs once, then runs the detectors
+concurrently. Each task records into its own AnomalyTable over the shared
+aggregate cache; tables are merged in config order, so the anomaly table is
+identical to calling the detectors one after another.
+"""
+
+import os
+import copy
+import inspect
+import logging
+import concurrent.futures
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from agents.anomaly_stats_agent import AnomalyStatAgent, AnomalyTable
+
+logger = logging.getLogger(__name__)
+
+EXECUTORS = ("thread", "process")
+
+
+@dataclass(frozen=True)
+class DetectorSpec:
+    """
+    name: Registry key used in configs.
+    run: Callable(agent, **params) that records into agent.anomalies.
+    defaults: Parameter defaults (taken from run's signature, then overridden).
+    group_param / target_param: Parameters naming the aggregate to prebuild;
+        group_param=None means the global series, aggregate=False means the
+        detector builds its own (e.g. hierarchy levels).
+    """
+
+    name: str
+    run: Callable[..., Any]
+    defaults: Dict[str, Any] = field(default_factory=dict)
+    group_param: Optional[str] = "group_col"
+    target_param: str = "target_col"
+    aggregate: bool = True
+
+    def params(self, overrides: Dict[str, Any]) -> Dict[str, Any]:
+        unknown = set(overrides) - set(self.defaults)
+        if unknown:
+            raise ValueError(f"Unknown parameters for {self.name}: {sorted(unknown)}")
+        return {**self.defaults, **overrides}
+
+    def aggregate_key(self, params: Dict[str, Any]) -> Optional[Tuple]:
+        """(group_col, target_col) this run reads, or None if not prebuildable."""
+        target = params.get(self.target_param)
+        if not self.aggregate or not isinstance(target, str):
+            return None
+        group = params.get(self.group_param) if self.group_param else None
+        return (group, target)
+
+
+DETECTORS: Dict[str, DetectorSpec] = {}
+
+
+def register_detector(
+    name: str,
+    run: Union[str, Callable[..., Any]],
+    group_param: Optional[str] = "group_col",
+    target_param: str = "target_col",
+    aggregate: bool = True,
+    **defaults,
+) -> DetectorSpec:
+    """
+    Adds a detector to the registry. `run` is an AnomalyStatAgent method name
+    or any callable(agent, **params); keyword defaults override its signature.
+    """
+    fn = getattr(AnomalyStatAgent, run) if isinstance(run, str) else run
+    signature = inspect.signature(fn)
+    params = {
+        p.name: p.default
+        for p in list(signature.parameters.values())[1:]
+        if p.default is not inspect.Parameter.empty
+    }
+    spec = DetectorSpec(
+        name=name,
+        run=fn,
+        defaults={**params, **defaults},
+        group_param=group_param if group_param in params else None,
+        target_param=target_param,
+        aggregate=aggregate,
+    )
+    DETECTORS[name] = spec
+    return spec
+
+
+register_detector("zscore", "detect_global_zscore")
+register_detector("robust_zscore", "detect_robust_zscore")
+register_detector("iqr", "detect_grouped_iqr")
+register_detector("pct_change", "detect_percentage_change")
+register_detector("pct_drop", "detect_percentage_drop")
+register_detector("pct_spike", "detect_percentage_spike")
+register_detector("seasonal", "detect_seasonal")
+register_detector("level_shift", "detect_level_shifts")
+register_detector("forecast", "detect_forecast")
+register_detector("hierarchical", "detect_hierarchical", aggregate=False)
+
+# The pipeline's standard detection pass
+DEFAULT_DETECTORS = [
+    {"detector": "zscore"},
+    {"detector": "iqr", "group_col": "Region"},
+]
+
+
+def _resolve(config: List[Union[str, Dict[str, Any]]]) -> List[Tuple[str, Dict]]:
+    resolved = []
+    for entry in config:
+        entry = {"detector": entry} if isinstance(entry, str) else dict(entry)
+        name = entry.pop("detector")
+        if name not in DETECTORS:
+            raise ValueError(f"Unknown detector {name!r}; known: {sorted(DETECTORS)}")
+        resolved.append((name, DETECTORS[name].params(entry)))
+    return resolved
+
+
+def _task_view(agent: AnomalyStatAgent) -> AnomalyStatAgent:
+    """Agent sharing df and aggregate cache, recording into a fresh table."""
+    view = copy.copy(agent)
+    view.anomalies = AnomalyTable()
+    return view
+
+
+def _run_task(agent: AnomalyStatAgent, name: str, params: Dict[str, Any]):
+    view = _task_view(agent)
+    result = DETECTORS[name].run(view, **params)
+    return view.anomalies, result
+
+
+_WORKER_AGENT: Optional[AnomalyStatAgent] = None
+
+
+def _init_worker(agent: AnomalyStatAgent, registry: Dict[str, DetectorSpec]):
+    global _WORKER_AGENT
+    _WORKER_AGENT = agent
+    DETECTORS.update(registry)
+
+
+def _run_in_worker(name: str, params: Dict[str, Any]):
+    return _run_task(_WORKER_AGENT, name, params)
+
+
+class DetectorRunner:
+    """
+    Runs a detector config against one AnomalyStatAgent.
+
+    Detectors run on a thread pool by default. executor="process" is opt-in:
+    it forks, which can copy locks held by other threads, so only use it
+    from a single-threaded program (e.g. the CLI's --executor process).
+
+    Usage:
+        runner = DetectorRunner(agent, max_workers=8)
+        results = runner.run([{"detector": "iqr", "group_col": "Region"}])
+    """
+
+    def __init__(
+        self,
+        agent: AnomalyStatAgent,
+        max_workers: Optional[int] = None,
+        executor: str = "thread",
+    ):
+        if executor not in EXECUTORS:
+            raise ValueError(f"executor must be one of {EXECUTORS}, got {executor!r}")
+        self.agent = agent
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = executor
+
+    def prepare(self, tasks: List[Tuple[str, Dict]]):
+        """Builds every aggregate the tasks read, once each."""
+        for name, params in tasks:
+            key = DETECTORS[name].aggregate_key(params)
+            if key is not None:
+                self.agent.aggregate(*key)
+
+    def run(self, config: List[Union[str, Dict[str, Any]]]) -> List[pd.DataFrame]:
+        """
+        Runs every configured detector and records their anomalies on the
+        agent in config order. Returns each detector's hit frame, same order.
+        """
+        tasks = _resolve(config)
+        self.prepare(tasks)
+        workers = min(self.max_workers, len(tasks))
+        logger.info(
+            f"Running {len(tasks)} detectors ({self.executor}, workers={workers})"
+        )
+
+        if workers <= 1:
+            outputs = [_run_task(self.agent, name, params) for name, params in tasks]
+        elif self.executor == "thread":
+            with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+                futures = [
+                    pool.submit(_run_task, self.agent, name, params)
+                    for name, params in tasks
+                ]
+                outputs = [f.result() for f in futures]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(
+                workers,
+                initializer=_init_worker,
+                initargs=(_task_view(self.agent), DETECTORS),
+            ) as pool:
+                futures = [
+                    pool.submit(_run_in_worker, name, params) for name, params in tasks
+                ]
+                outputs = [f.result() for f in futures]
+
+        for table, _ in outputs:
+            self.agent.anomalies.extend(table)
+        return [result for _, result in outputs]
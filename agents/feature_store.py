@@ -0,0 +1,169 @@
+"""
+agents/feature_store.py
+Local persistent cache for engineered features.
+
+Features are keyed on (snapshot content hash, atomic feature spec hash).
+Each atomic feature is stored as its own Parquet file holding only the
+columns it adds, so a changed spec computes just the missing features and
+a read only touches the files that were requested.
+
+Layout:
+    <root>/<snapshot_hash>/manifest.json
+    <root>/<snapshot_hash>/<feature_hash>.parquet
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from agents.feature_transforms import FeatureEngineer, expand_spec, feature_columns
+
+logger = logging.getLogger(__name__)
+
+
+class FeatureStore:
+
+    # Bump when feature semantics change so stale files are not reused
+    STORE_VERSION = "1"
+
+    def __init__(self, root_dir: str = "../outputs/feature_store"):
+        self.root_dir = Path(root_dir).resolve()
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.stats = {"hits": 0, "misses": 0}
+
+    # --- Keys ---
+
+    @staticmethod
+    def snapshot_hash(df: pd.DataFrame) -> str:
+        """Content hash of the input frame (values, index, row order and schema)."""
+        h = hashlib.sha256()
+        schema = [(str(c), str(t)) for c, t in df.dtypes.items()]
+        h.update(json.dumps(schema).encode())
+        h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+        return h.hexdigest()[:20]
+
+    @classmethod
+    def feature_hash(cls, atom: Dict[str, Any]) -> str:
+        payload = json.dumps(
+            {"version": cls.STORE_VERSION, "feature": atom}, sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()[:20]
+
+    # --- Manifest ---
+
+    def _manifest_path(self, snap: str) -> Path:
+        return self.root_dir / snap / "manifest.json"
+
+    def _load_manifest(self, snap: str) -> Dict[str, Any]:
+        path = self._manifest_path(snap)
+        if not path.exists():
+            return {}
+        try:
+            with open(path) as f:
+                return json.load(f).get("features", {})
+        except Exception as e:
+            logger.warning(f"Unreadable feature manifest {path}: {e}")
+            return {}
+
+    def _write_atomic(self, path: Path, writer):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        os.close(fd)
+        try:
+            writer(tmp_name)
+            os.replace(tmp_name, path)
+        finally:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+
+    def _save_manifest(self, snap: str, features: Dict[str, Any]):
+        def write(tmp_name):
+            with open(tmp_name, "w") as f:
+                json.dump({"snapshot": snap, "features": features}, f, indent=2)
+
+        self._write_atomic(self._manifest_path(snap), write)
+
+    # --- Public API ---
+
+    def get_features(
+        self,
+        df: pd.DataFrame,
+        spec: List[Dict[str, Any]],
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        Returns the requested feature columns, aligned with FeatureEngineer(df).df.
+        Stored features are read from Parquet; only missing ones are computed
+        (in one FeatureEngineer batch) and persisted.
+        Args:
+            columns: Optional subset of feature columns to load.
+        """
+        return self._get(FeatureEngineer(df), df, spec, columns)
+
+    def _get(self, engineer: FeatureEngineer, df, spec, columns=None) -> pd.DataFrame:
+        snap = self.snapshot_hash(df)
+        snap_dir = self.root_dir / snap
+        manifest = self._load_manifest(snap)
+
+        atoms = expand_spec(spec)
+        keyed = [(self.feature_hash(atom), atom) for atom in atoms]
+
+        missing = [
+            (key, atom)
+            for key, atom in keyed
+            if key not in manifest or not (snap_dir / f"{key}.parquet").exists()
+        ]
+        self.stats["hits"] += len(keyed) - len(missing)
+        self.stats["misses"] += len(missing)
+
+        fresh = {}
+        if missing:
+            logger.info(
+                f"Feature store {snap}: computing {len(missing)} of {len(keyed)} features"
+            )
+            computed = engineer.compute_features([atom for _, atom in missing])
+            for key, atom in missing:
+                cols = feature_columns(atom)
+                part = computed[cols]
+                fresh[key] = part
+                self._write_atomic(
+                    snap_dir / f"{key}.parquet",
+                    lambda tmp, part=part: part.to_parquet(tmp, index=True),
+                )
+                manifest[key] = {
+                    "spec": atom,
+                    "columns": cols,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                }
+            self._save_manifest(snap, manifest)
+
+        frames = []
+        for key, atom in keyed:
+            cols = feature_columns(atom)
+            if columns is not None:
+                cols = [c for c in cols if c in columns]
+                if not cols:
+                    continue
+            if key in fresh:
+                frames.append(fresh[key][cols])
+                continue
+            part = pd.read_parquet(snap_dir / f"{key}.parquet", columns=cols)
+            frames.append(part.set_axis(engineer.df.index, axis=0))
+
+        if not frames:
+            return pd.DataFrame(index=engineer.df.index)
+        return pd.concat(frames, axis=1)
+
+    def build(self, df: pd.DataFrame, spec: List[Dict[str, Any]]) -> pd.DataFrame:
+        """Cached equivalent of FeatureEngineer(df).build(spec)."""
+        engineer = FeatureEngineer(df)
+        features = self._get(engineer, df, spec)
+        base = engineer.df.drop(columns=features.columns, errors="ignore")
+        return pd.concat([base, features], axis=1)
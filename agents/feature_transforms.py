@@ -1,5 +1,190 @@
 import pandas as pd
 import numpy as np
+from typing import Any, Dict, List
+
+FEATURE_KINDS = ("time", "rolling", "lag", "growth")
+ROLLING_STATS = ("mean", "sum", "std")
+
+
+def _check_stat(stat):
+    if stat not in ROLLING_STATS:
+        raise ValueError(f"Unsupported rolling stat: {stat}")
+
+
+def _group_segments(codes: np.ndarray):
+    """
+    Stable sort of row positions by group code.
+    Returns (order, offset): `order` lays every group out as one contiguous
+    segment (keeping the frame's existing row order inside each group) and
+    `offset` is each sorted row's position within its own segment.
+    """
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    n = len(sorted_codes)
+
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    lengths = np.diff(np.r_[starts, n])
+    offset = np.arange(n) - np.repeat(starts, lengths)
+    return order, offset
+
+
+def _segment_rolling(values: np.ndarray, offset: np.ndarray, window: int, stat="mean"):
+    """
+    Trailing-window statistic over contiguous segments (min_periods=1).
+    Sums and means use prefix sums (O(n) regardless of window or group count);
+    std gathers each window in fixed-size row blocks so it stays numerically
+    stable. NaNs are skipped, matching pandas rolling semantics.
+    """
+    _check_stat(stat)
+    n = len(values)
+    valid = ~np.isnan(values)
+    idx = np.arange(n)
+    lo = idx - np.minimum(offset, window - 1)
+
+    if stat == "std":
+        out = np.full(n, np.nan)
+        steps = np.arange(-window + 1, 1)
+        block = max(1, 2**20 // window)
+        for start in range(0, n, block):
+            rows = idx[start : start + block]
+            pos = rows[:, None] + steps
+            inside = pos >= lo[rows, None]
+            win = np.where(inside, values[np.maximum(pos, 0)], np.nan)
+            count = (inside & ~np.isnan(win)).sum(axis=1)
+            ok = count >= 2
+            if ok.any():
+                out[rows[ok]] = np.nanstd(win[ok], axis=1, ddof=1)
+        return out
+
+    # Shift each segment by its first value to limit cancellation in the sums
+    base = np.where(valid, values, 0.0)
+    shift = base[idx - offset]
+    x = np.where(valid, values - shift, 0.0)
+
+    csum = np.concatenate(([0.0], np.cumsum(x)))
+    ccnt = np.concatenate(([0], np.cumsum(valid)))
+    total = csum[idx + 1] - csum[lo]
+    count = ccnt[idx + 1] - ccnt[lo]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if stat == "sum":
+            out = total + shift * count
+        else:
+            out = total / count + shift
+
+    out[count < 1] = np.nan
+    return out
+
+
+def _group_codes(df: pd.DataFrame, group_by) -> np.ndarray:
+    """Dense integer code per row for `group_by`; -1 where the key is missing."""
+    # ngroup() marks rows whose key is missing with NaN
+    codes = df.groupby(group_by, sort=False).ngroup().fillna(-1)
+    return codes.to_numpy(dtype=np.int64)
+
+
+def grouped_rolling(
+    df: pd.DataFrame, target_col, window: int, group_by, stat="mean"
+) -> np.ndarray:
+    """
+    Vectorized equivalent of
+    `df.groupby(group_by)[target_col].transform(lambda x: x.rolling(window, min_periods=1).<stat>())`.
+    Sorts once by group and evaluates every window in NumPy, so the cost does
+    not grow with the number of groups. Rows with a missing group key get NaN.
+    """
+    _check_stat(stat)
+    codes = _group_codes(df, group_by)
+    values = df[target_col].to_numpy(dtype=float)
+
+    order, offset = _group_segments(codes)
+    rolled = _segment_rolling(values[order], offset, window, stat)
+
+    result = np.empty(len(values))
+    result[order] = rolled
+    result[codes < 0] = np.nan
+    return result
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _segment_shift(values: np.ndarray, offset: np.ndarray, lag: int) -> np.ndarray:
+    """
+    Shift by `lag` rows inside contiguous segments using plain array offsets
+    (NaN where the segment has no earlier row). One call per lag, no groupby.
+    """
+    out = np.full(len(values), np.nan)
+    if lag < len(values):
+        out[lag:] = values[: len(values) - lag]
+    out[offset < lag] = np.nan
+    return out
+
+
+def _growth_pct(values: np.ndarray, lagged: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        growth = (values - lagged) / lagged * 100
+    return np.where(np.isnan(growth), 0.0, growth)
+
+
+def rolling_col_name(target_col, window, stat="mean") -> str:
+    if stat == "mean":
+        return f"{target_col}_Rolling_{window}"
+    return f"{target_col}_Rolling_{stat.capitalize()}_{window}"
+
+
+def growth_col_name(target_col, lag=1) -> str:
+    if lag == 1:
+        return f"{target_col}_Growth_Pct"
+    return f"{target_col}_Growth_Pct_{lag}"
+
+
+def expand_spec(spec: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Splits spec items into atomic ones (a single target and window/lag each),
+    with group_by normalised to a list. Atomic items are what the feature
+    store keys and persists.
+    """
+    atoms = []
+    for item in spec:
+        kind = item.get("kind")
+        if kind not in FEATURE_KINDS:
+            raise ValueError(f"Unknown feature kind: {kind}")
+        if kind == "time":
+            atoms.append({"kind": "time"})
+            continue
+
+        group_by = _as_list(item.get("group_by"))
+        param = "window" if kind == "rolling" else "lag"
+        for target in _as_list(item.get("target", "Sales")):
+            for value in _as_list(item.get(param, 3 if kind == "rolling" else 1)):
+                atom = {
+                    "kind": kind,
+                    "target": target,
+                    param: value,
+                    "group_by": group_by,
+                }
+                if kind == "rolling":
+                    atom["stat"] = item.get("stat", "mean")
+                    _check_stat(atom["stat"])
+                atoms.append(atom)
+    return atoms
+
+
+def feature_columns(atom: Dict[str, Any]) -> List[str]:
+    """Output column names of an atomic spec item (see expand_spec)."""
+    kind = atom["kind"]
+    if kind == "time":
+        return ["Order Year", "Order Month", "Order Quarter", "Day of Week"]
+    if kind == "rolling":
+        return [
+            rolling_col_name(atom["target"], atom["window"], atom.get("stat", "mean"))
+        ]
+    if kind == "lag":
+        return [f"{atom['target']}_Lag_{atom['lag']}"]
+    return [growth_col_name(atom["target"], atom["lag"])]
 
 
 class FeatureEngineer:
@@ -37,9 +222,9 @@ class FeatureEngineer:
         col_name = f"{target_col}_Rolling_{window}"
 
         if group_by:
-            # Group by region/category first, then apply rolling
-            self.df[col_name] = self.df.groupby(group_by)[target_col].transform(
-                lambda x: x.rolling(window=window, min_periods=1).mean()
+            # One stable sort by group, then prefix-sum windows over each segment
+            self.df[col_name] = grouped_rolling(
+                self.df, target_col, window, group_by, stat="mean"
             )
         else:
             # Global rolling average
@@ -49,21 +234,143 @@ class FeatureEngineer:
 
         return self.df
 
-    def add_lag_features(self, target_col="Sales", lag=1):
-        """Adds previous period's value (Lag-1) to detect growth/decline."""
-        col_name = f"{target_col}_Lag_{lag}"
-        self.df[col_name] = self.df[target_col].shift(lag)
-
-        # Calculate Growth Rate
-        growth_col = f"{target_col}_Growth_Pct"
-        self.df[growth_col] = (
-            (self.df[target_col] - self.df[col_name]) / self.df[col_name] * 100
+    def add_lag_features(self, target_col="Sales", lag=1, group_by=None):
+        """
+        Adds previous period's value (Lag-N) and growth rate to detect growth/decline.
+        Args:
+            target_col: Column to lag (e.g., 'Sales')
+            lag: Offset in rows, or a list of offsets computed in one pass
+            group_by: If provided (e.g., 'Category'), lags are taken within each
+                group, so a Furniture row never lags onto a Technology row
+        """
+        lags = _as_list(lag)
+        features = self.compute_features(
+            [
+                {
+                    "kind": "lag",
+                    "target": target_col,
+                    "lag": lags,
+                    "group_by": group_by,
+                },
+                {
+                    "kind": "growth",
+                    "target": target_col,
+                    "lag": lags,
+                    "group_by": group_by,
+                },
+            ]
         )
 
-        # Fill NaN created by shifting with 0
-        self.df[col_name] = self.df[col_name].fillna(0)
-        self.df[growth_col] = self.df[growth_col].fillna(0)
+        # A single lag keeps the historical un-suffixed growth column name
+        if not isinstance(lag, (list, tuple)):
+            features = features.rename(
+                columns={growth_col_name(target_col, lag): f"{target_col}_Growth_Pct"}
+            )
+
+        for col in features.columns:
+            self.df[col] = features[col]
+
+        return self.df
+
+    def _segments(self, key: tuple):
+        """(codes, order, offset) for a grouping; the empty key is one segment."""
+        n = len(self.df)
+        if not key:
+            positions = np.arange(n)
+            return np.zeros(n, dtype=np.int64), positions, positions
+        codes = _group_codes(self.df, list(key) if len(key) > 1 else key[0])
+        order, offset = _group_segments(codes)
+        return codes, order, offset
+
+    def compute_features(self, spec: List[Dict[str, Any]]) -> pd.DataFrame:
+        """
+        Computes a batch of features without touching self.df.
+
+        Each spec item has a "kind" plus its parameters; list values fan out:
+            {"kind": "time"}
+            {"kind": "rolling", "target": ["Sales", "Profit"], "window": [3, 7],
+             "group_by": "Region", "stat": "mean"}
+            {"kind": "lag", "target": "Sales", "lag": [1, 7], "group_by": "Category"}
+            {"kind": "growth", "target": "Sales", "lag": 1, "group_by": "Category"}
+
+        All items sharing a group_by reuse one stable (group, date) sort and one
+        gather per target; lag and growth items on the same target and group
+        share the shifted arrays.
+        Returns a frame indexed like self.df holding only the new columns.
+        """
+        columns: Dict[str, Any] = {}
+
+        def put(name, values):
+            if name in columns:
+                raise ValueError(f"Feature spec produces duplicate column: {name}")
+            columns[name] = values
+
+        plan: Dict[tuple, list] = {}
+
+        for atom in expand_spec(spec):
+            kind = atom["kind"]
+            names = feature_columns(atom)
+
+            if kind == "time":
+                if "Order Date" not in self.df.columns:
+                    raise ValueError("Order Date column missing")
+                dates = self.df["Order Date"].dt
+                for name, values in zip(
+                    names,
+                    (dates.year, dates.month, dates.quarter, dates.day_name()),
+                ):
+                    put(name, values.to_numpy())
+                continue
+
+            put(names[0], None)
+            param = atom["window"] if kind == "rolling" else atom["lag"]
+            plan.setdefault(tuple(atom["group_by"]), []).append(
+                (names[0], kind, atom["target"], param, atom.get("stat"))
+            )
+
+        for key, jobs in plan.items():
+            codes, order, offset = self._segments(key)
+            missing = codes < 0
+            sorted_values, shifted = {}, {}
+
+            for name, kind, target, param, stat in jobs:
+                if kind == "rolling" and not key:
+                    # Global windows stay on pandas' single-pass rolling
+                    rolled = self.df[target].rolling(window=param, min_periods=1)
+                    columns[name] = getattr(rolled, stat)().to_numpy()
+                    continue
+
+                if target not in sorted_values:
+                    sorted_values[target] = self.df[target].to_numpy(dtype=float)[order]
+                values = sorted_values[target]
+
+                if kind == "rolling":
+                    result = _segment_rolling(values, offset, param, stat)
+                else:
+                    if (target, param) not in shifted:
+                        shifted[(target, param)] = _segment_shift(values, offset, param)
+                    lagged = shifted[(target, param)]
+                    if kind == "lag":
+                        result = np.where(np.isnan(lagged), 0.0, lagged)
+                    else:
+                        result = _growth_pct(values, lagged)
 
+                out = np.empty(len(order))
+                out[order] = result
+                out[missing] = np.nan
+                columns[name] = out
+
+        return pd.DataFrame(columns, index=self.df.index)
+
+    def build(self, spec: List[Dict[str, Any]]) -> pd.DataFrame:
+        """
+        Declarative alternative to chaining add_* calls.
+        Computes every feature in `spec` (see compute_features) and attaches
+        them to self.df in a single concat instead of one insert per column.
+        """
+        features = self.compute_features(spec)
+        base = self.df.drop(columns=features.columns, errors="ignore")
+        self.df = pd.concat([base, features], axis=1)
         return self.df
 
     def get_engineered_data(self):
@@ -0,0 +1,164 @@
+"""
+agents/forecast_baselines.py
+One-step-ahead exponential smoothing forecasts for a dates x entities matrix.
+
+Every entity (column) is fitted at once: the smoothing recurrences step down
+the time axis with whole-row array updates, so the Python loop runs once per
+day whatever the number of series. Models (additive):
+- "ses":          level only.
+- "holt":         level + linear trend.
+- "holt_winters": level + trend + `season`-day seasonal profile.
+
+Fitting picks, per entity, the level smoothing factor from `alphas` with the
+lowest sum of squared one-step errors; all candidates run side by side as
+extra columns. The prediction interval width comes from an exponentially
+weighted variance of the one-step errors seen so far.
+Missing cells (NaN) advance the forecast without updating the state.
+"""
+
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+
+FORECAST_MODELS = ("ses", "holt", "holt_winters")
+
+
+@dataclass
+class Forecast:
+    """
+    forecast: One-step-ahead forecast per cell (NaN before the first value).
+    sigma: Std of the one-step error known before the cell (NaN until
+        `min_periods` values have been seen).
+    alpha: Level smoothing factor chosen per entity.
+    """
+
+    forecast: np.ndarray
+    sigma: np.ndarray
+    alpha: np.ndarray
+
+    def interval(self, z: float):
+        """(lower, upper) prediction interval bounds at `z` sigmas."""
+        return self.forecast - z * self.sigma, self.forecast + z * self.sigma
+
+    def score(self, matrix: np.ndarray) -> np.ndarray:
+        """Signed forecast error in sigmas (NaN where sigma is unknown or 0)."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(
+                self.sigma > 0, (matrix - self.forecast) / self.sigma, np.nan
+            )
+
+
+def _smooth(matrix, alpha, beta, gamma, season, var_alpha, min_periods):
+    """
+    Runs the recurrences; `alpha` has one entry per column. Returns raw
+    forecasts and error stds for every row, plus each column's SSE.
+    """
+    n_rows, n_cols = matrix.shape
+    observed = ~np.isnan(matrix)
+    first = np.where(observed.any(axis=0), observed.argmax(axis=0), n_rows)
+    values = np.where(observed, matrix, 0.0)
+
+    forecast = np.empty((n_rows, n_cols))
+    sigma = np.empty((n_rows, n_cols))
+    sse = np.zeros(n_cols)
+
+    # The state starts at each column's first value (earlier rows are masked)
+    level = values[np.minimum(first, n_rows - 1), np.arange(n_cols)]
+    trend = np.zeros(n_cols)
+    seasonal = np.zeros((season, n_cols))
+    var = np.zeros(n_cols)
+    seen = np.zeros(n_cols)
+    # Running mean of squared errors until 1/var_alpha of them, then EWMA
+    max_weight = max(1.0, 1.0 / var_alpha)
+    started = np.empty(n_cols)
+    err = np.empty(n_cols)
+    sq = np.empty(n_cols)
+    step = np.empty(n_cols)
+
+    for t in range(n_rows):
+        s = seasonal[t % season]
+        base = level + trend
+        f = np.add(base, s, out=forecast[t])
+        sigma[t] = var
+
+        np.logical_and(observed[t], t > first, out=started, casting="unsafe")
+        np.subtract(values[t], f, out=err)
+        err *= started
+        np.multiply(err, err, out=sq)
+        np.greater_equal(seen, min_periods, out=step, casting="unsafe")
+        sse += sq * step
+        seen += started
+        # var += started / min(seen, max_weight) * (sq - var)
+        np.minimum(np.maximum(seen, 1.0, out=step), max_weight, out=step)
+        np.divide(started, step, out=step)
+        var += step * (sq - var)
+
+        new_level = base + alpha * err
+        if beta:
+            trend += (beta * started) * (new_level - level - trend)
+        if gamma:
+            s += (gamma * started) * (values[t] - new_level - s)
+        level = new_level
+
+    np.sqrt(sigma, out=sigma)
+    return forecast, sigma, sse
+
+
+def exponential_smoothing(
+    matrix: np.ndarray,
+    model: str = "holt_winters",
+    alphas: Sequence[float] = (0.1, 0.3, 0.6),
+    beta: float = 0.02,
+    gamma: float = 0.1,
+    season: int = 7,
+    var_alpha: float = 0.05,
+    min_periods: int = 14,
+) -> Forecast:
+    """
+    Fits `model` to every column of a dates x entities matrix.
+    Args:
+        matrix: Float values, NaN for missing cells.
+        alphas: Candidate level smoothing factors (best per column by SSE).
+        beta / gamma: Trend and seasonal smoothing (unused by simpler models).
+        season: Season length in rows (7 = weekly on a daily calendar).
+        var_alpha: Smoothing of the one-step error variance.
+        min_periods: Values needed before sigma (and scores) are reported.
+    """
+    if model not in FORECAST_MODELS:
+        raise ValueError(f"Unknown forecast model: {model}")
+    matrix = np.asarray(matrix, dtype=float)
+    alphas = np.asarray(alphas, dtype=float)
+    n_rows, n_cols = matrix.shape
+    if n_rows == 0:
+        # No days to fit: empty forecasts, first candidate alpha (as for
+        # columns without values)
+        empty = np.empty((0, n_cols))
+        return Forecast(empty, empty.copy(), np.full(n_cols, alphas[0]))
+    if model == "ses":
+        beta = 0.0
+    if model != "holt_winters":
+        gamma, season = 0.0, 1
+
+    # Candidate alphas side by side: column block j uses alphas[j]
+    tiled = np.tile(matrix, (1, len(alphas)))
+    forecast, sigma, sse = _smooth(
+        tiled,
+        np.repeat(alphas, n_cols),
+        beta,
+        gamma,
+        season,
+        var_alpha,
+        min_periods,
+    )
+    best = np.argmin(sse.reshape(len(alphas), n_cols), axis=0)
+    pick = best * n_cols + np.arange(n_cols)
+    forecast, sigma = forecast[:, pick], sigma[:, pick]
+
+    # Mask rows before each column's first value, and sigma until min_periods
+    # one-step errors (every value after the first) have been seen
+    observed = ~np.isnan(matrix)
+    before = np.cumsum(observed, axis=0, dtype=np.int32) - observed
+    forecast[before == 0] = np.nan
+    sigma[before <= min_periods] = np.nan
+    return Forecast(forecast, sigma, alphas[best])
@@ -0,0 +1,111 @@
+"""
+agents/llm_response_cache.py
+On-disk cache of validated LLM responses.
+
+Entries are keyed by a hash of (model, explanation version, request content),
+so a content change, a model switch or a version bump each miss the cache
+(the explainer passes an anomaly's raw facts as the content). One JSON file
+per entry; entries older than `ttl_seconds` are dropped on read, and once
+more than `max_entries` are stored the least recently used ones (file mtime,
+refreshed on every hit) are evicted.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Usage:
+        cache = ResponseCache("outputs/observability/response_cache")
+        key = cache.key(content, model, version)
+        data = cache.get(key)  # None on a miss
+        cache.put(key, data)
+    """
+
+    def __init__(
+        self,
+        cache_dir,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 5000,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> last use (epoch seconds), rebuilt from the files on start
+        self._index: Dict[str, float] = {
+            entry.name[: -len(".json")]: entry.stat().st_mtime
+            for entry in os.scandir(self.cache_dir)
+            if entry.name.endswith(".json")
+        }
+
+    @staticmethod
+    def key(content: str, model: str, version: str) -> str:
+        return hashlib.sha256(f"{model}\0{version}\0{content}".encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached response for `key`, or None if absent or expired."""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        now = time.time()
+        if now - entry.get("created", 0) > self.ttl_seconds:
+            self._delete(key)
+            return None
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            self._index[key] = now
+        return entry["response"]
+
+    def put(self, key: str, response: Dict[str, Any], **meta):
+        """Stores `response` (plus `meta`, e.g. model) and evicts if over size."""
+        now = time.time()
+        path = self._path(key)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"created": now, **meta, "response": response}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.error(f"Response cache write failed: {e}")
+            return
+
+        with self._lock:
+            self._index[key] = now
+            excess = len(self._index) - self.max_entries
+            stale = (
+                sorted(self._index, key=self._index.get)[:excess] if excess > 0 else []
+            )
+        for old in stale:
+            self._delete(old)
+
+    def _delete(self, key: str):
+        with self._lock:
+            self._index.pop(key, None)
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def __len__(self) -> int:
+        return len(self._index)
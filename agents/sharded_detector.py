@@ -0,0 +1,263 @@
+"""
+agents/sharded_detector.py
+Process-parallel detection for high-cardinality entities.
+
+The daily aggregate is built once in the parent and its arrays (values,
+dates, segment bounds) are placed in shared memory. Entities are
+hash-partitioned into shards; each worker attaches to the shared arrays,
+runs the AnomalyStatAgent kernels on its shard's segments and returns only
+the hit positions plus their statistics. The parent reassembles the hits in
+aggregate order and emits one batch per detector, so the anomaly table is
+identical to a single-process run regardless of worker count or scheduling.
+"""
+
+import os
+import zlib
+import logging
+import concurrent.futures
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from agents.anomaly_stats_agent import AnomalyStatAgent, DailyAggregate
+
+logger = logging.getLogger(__name__)
+
+# Extra columns each kernel adds to the aggregate frame, in kernel order
+_IQR_COLUMNS = ["Q1", "Q3", "IQR", "lower", "upper"]
+_PCT_COLUMNS = ["prev_value", "pct_change"]
+
+
+def shard_of(entities, n_shards: int) -> np.ndarray:
+    """Stable (process-independent) hash partition of entity labels."""
+    return np.array(
+        [zlib.crc32(str(e).encode()) % n_shards for e in entities], dtype=np.int64
+    )
+
+
+class SharedArrays:
+    """Named numpy arrays copied into shared memory blocks, owned by the parent."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.blocks: List[shared_memory.SharedMemory] = []
+        self.spec: Dict[str, Tuple[str, tuple, str]] = {}
+        try:
+            for key, arr in arrays.items():
+                arr = np.ascontiguousarray(arr)
+                shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+                self.blocks.append(shm)
+                np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+                self.spec[key] = (shm.name, arr.shape, arr.dtype.str)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _run_shard(
+    spec, segments: np.ndarray, job: Dict[str, Any]
+) -> Dict[str, np.ndarray]:
+    """Worker: runs one detector kernel over the given aggregate segments."""
+    blocks = {
+        key: shared_memory.SharedMemory(name=name) for key, (name, _, _) in spec.items()
+    }
+    try:
+        arrays = {
+            key: np.ndarray(shape, dtype=np.dtype(dtype), buffer=blocks[key].buf)
+            for key, (_, shape, dtype) in spec.items()
+        }
+        starts = arrays["starts"][segments]
+        lengths = arrays["ends"][segments] - starts
+        local_starts = np.r_[0, np.cumsum(lengths)[:-1]].astype(np.int64)
+        rows = np.arange(lengths.sum()) + np.repeat(starts - local_starts, lengths)
+
+        target_col = job["target_col"]
+        frame = pd.DataFrame(
+            {
+                "Order Date": pd.to_datetime(arrays["dates"][rows]),
+                target_col: arrays["values"][rows],
+            },
+            index=rows,
+        )
+    finally:
+        for shm in blocks.values():
+            shm.close()
+
+    agg = DailyAggregate(
+        group_col=None,
+        target_col=target_col,
+        frame=frame,
+        starts=local_starts,
+        entities=segments,
+        dates=pd.DatetimeIndex([]),
+    )
+    if job["kind"] == "iqr":
+        found = [
+            (
+                "iqr",
+                AnomalyStatAgent._iqr_hits(
+                    agg, job["window"], job["k"], job["quantile_method"]
+                ),
+            )
+        ]
+        columns = _IQR_COLUMNS
+    else:
+        found = AnomalyStatAgent._pct_hits(
+            agg, job["drop_threshold"], job["spike_threshold"]
+        )
+        columns = _PCT_COLUMNS
+
+    out = {}
+    for detector, detected in found:
+        out[detector] = np.column_stack(
+            [detected.index.to_numpy(dtype=float)]
+            + [detected[c].to_numpy(dtype=float) for c in columns]
+        )
+    return out
+
+
+class ShardedDetector:
+    """
+    Runs AnomalyStatAgent detectors across a process pool.
+    Results are emitted into `agent.anomalies` exactly as the agent's own
+    detectors would, so sharded and single-process runs can be mixed.
+
+    Usage:
+        with ShardedDetector(agent, n_workers=8) as sharded:
+            sharded.detect_grouped_iqr("Product ID")
+            sharded.detect_percentage_change(group_col="Customer ID")
+    """
+
+    def __init__(
+        self,
+        agent: AnomalyStatAgent,
+        n_workers: Optional[int] = None,
+        shards_per_worker: int = 4,
+    ):
+        self.agent = agent
+        self.n_workers = n_workers or os.cpu_count() or 1
+        # Several shards per worker smooths out uneven entity sizes
+        self.n_shards = self.n_workers * shards_per_worker
+        self._pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _executor(self):
+        if self._pool is None and self.n_workers > 1:
+            self._pool = concurrent.futures.ProcessPoolExecutor(self.n_workers)
+        return self._pool
+
+    def _run(self, agg: DailyAggregate, job: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        """Fans one job out over the entity shards and merges in aggregate order."""
+        n = len(agg.frame)
+        ends = np.r_[agg.starts[1:], n]
+        shards = shard_of(agg.entities, self.n_shards)
+        tasks = [np.flatnonzero(shards == s) for s in range(self.n_shards)]
+        tasks = [t for t in tasks if len(t)]
+
+        arrays = {
+            "values": agg.values,
+            "dates": agg.frame["Order Date"].to_numpy(dtype="datetime64[ns]"),
+            "starts": agg.starts.astype(np.int64),
+            "ends": ends.astype(np.int64),
+        }
+        with SharedArrays(arrays) as shared:
+            pool = self._executor()
+            if pool is None:
+                results = [_run_shard(shared.spec, t, job) for t in tasks]
+            else:
+                futures = [pool.submit(_run_shard, shared.spec, t, job) for t in tasks]
+                results = [f.result() for f in futures]
+
+        merged = {}
+        for detector in sorted({d for r in results for d in r}):
+            parts = np.concatenate([r[detector] for r in results if detector in r])
+            merged[detector] = parts[np.argsort(parts[:, 0], kind="stable")]
+        return merged
+
+    @staticmethod
+    def _hits_frame(agg, block: np.ndarray, columns: List[str]) -> pd.DataFrame:
+        detected = agg.frame.iloc[block[:, 0].astype(np.int64)].copy()
+        for j, col in enumerate(columns, 1):
+            detected[col] = block[:, j]
+        return detected
+
+    def detect_grouped_iqr(
+        self,
+        group_col="Region",
+        target_col="Sales",
+        window=14,
+        k=1.5,
+        quantile_method="exact",
+    ) -> pd.DataFrame:
+        """Sharded AnomalyStatAgent.detect_grouped_iqr (same records and frame)."""
+        logger.info(
+            f"Running Sharded IQR Detector on {group_col} "
+            f"(w={window}, k={k}, workers={self.n_workers})"
+        )
+        agg = self.agent.aggregate(group_col, target_col)
+        job = {
+            "kind": "iqr",
+            "target_col": target_col,
+            "window": window,
+            "k": k,
+            "quantile_method": quantile_method,
+        }
+        merged = self._run(agg, job)
+        if "iqr" not in merged:
+            return pd.DataFrame()
+        detected = self._hits_frame(agg, merged["iqr"], _IQR_COLUMNS)
+        self.agent._emit_iqr_batch(detected, group_col, target_col)
+        return detected
+
+    def detect_percentage_change(
+        self,
+        target_col="Sales",
+        group_col="Category",
+        drop_threshold: Optional[float] = 0.5,
+        spike_threshold: Optional[float] = 0.5,
+    ) -> pd.DataFrame:
+        """Sharded AnomalyStatAgent.detect_percentage_change."""
+        logger.info(
+            f"Running Sharded Percentage Change Detector on {group_col} "
+            f"(drop={drop_threshold}, spike={spike_threshold}, workers={self.n_workers})"
+        )
+        agg = self.agent.aggregate(group_col, target_col)
+        job = {
+            "kind": "pct",
+            "target_col": target_col,
+            "drop_threshold": drop_threshold,
+            "spike_threshold": spike_threshold,
+        }
+        merged = self._run(agg, job)
+
+        outputs = []
+        for detector in ("pct_drop", "pct_spike"):
+            if detector not in merged:
+                continue
+            detected = self._hits_frame(agg, merged[detector], _PCT_COLUMNS)
+            self.agent._emit_pct_batch(detected, group_col, target_col, detector)
+            outputs.append(detected.assign(detector=detector))
+        return pd.concat(outputs) if outputs else pd.DataFrame()
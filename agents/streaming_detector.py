@@ -0,0 +1,312 @@
+"""
+agents/streaming_detector.py
+Online / incremental anomaly detection.
+
+Keeps the rolling state of the AnomalyStatAgent detectors per entity, so
+scoring a new day costs O(new points) instead of a full-history recompute:
+- Global z-score: trailing window buffer + Welford mean/M2 (add & remove), O(1)
+- Grouped IQR:    SortedWindow (binary search + O(w) shift per insert/evict),
+                  so iqr_window is capped at SortedWindow.MAX_WINDOW
+- Pct change:     last value per entity
+
+Window semantics match the batch detectors (window includes the current
+point, min_periods=1, pandas linear quantile interpolation), so scores agree
+with AnomalyStatAgent on the same history. State checkpoints to JSON.
+"""
+
+import os
+import json
+import logging
+import tempfile
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from agents.anomaly_stats_agent import AnomalyRecord, AnomalyStatAgent, AnomalyTable
+from agents.rolling_quantiles import SortedWindow
+
+logger = logging.getLogger(__name__)
+
+
+class WindowMoments:
+    """Trailing window with O(1) Welford mean/M2 (add and remove) for the z-score."""
+
+    def __init__(self, window: int, values: Optional[List[float]] = None):
+        self.window = window
+        self.buffer: deque = deque()
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        for v in values or []:
+            self.push(v)
+
+    def push(self, x: float) -> Optional[float]:
+        """Adds `x`; returns the value evicted from the window, if any."""
+        self.buffer.append(x)
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        if len(self.buffer) <= self.window:
+            return None
+
+        old = self.buffer.popleft()
+        self.n -= 1
+        delta = old - self.mean
+        self.mean -= delta / self.n
+        self.m2 -= delta * (old - self.mean)
+        return old
+
+    def std(self) -> float:
+        if self.n < 2:
+            return float("nan")
+        return float(np.sqrt(max(self.m2, 0.0) / (self.n - 1)))
+
+
+class StreamingAnomalyDetector:
+
+    STATE_VERSION = "2"
+    # Version 1 also stored unused mean/M2 for the entity windows
+    READABLE_STATE_VERSIONS = ("1", "2")
+
+    def __init__(
+        self,
+        group_col: str = "Region",
+        target_col: str = "Sales",
+        zscore_window: int = 30,
+        zscore_threshold: float = 3.0,
+        iqr_window: int = 14,
+        iqr_k: float = 1.5,
+        drop_threshold: Optional[float] = 0.5,
+        spike_threshold: Optional[float] = 0.5,
+    ):
+        if not 1 <= iqr_window <= SortedWindow.MAX_WINDOW:
+            raise ValueError(
+                f"iqr_window must be in [1, {SortedWindow.MAX_WINDOW}]; "
+                "score longer windows with AnomalyStatAgent.detect_grouped_iqr"
+            )
+        self.params = {
+            "group_col": group_col,
+            "target_col": target_col,
+            "zscore_window": zscore_window,
+            "zscore_threshold": zscore_threshold,
+            "iqr_window": iqr_window,
+            "iqr_k": iqr_k,
+            "drop_threshold": drop_threshold,
+            "spike_threshold": spike_threshold,
+        }
+        self.global_state = WindowMoments(zscore_window)
+        self.entity_state: Dict[str, SortedWindow] = {}
+        self.last_value: Dict[str, float] = {}
+        self.last_date: Optional[pd.Timestamp] = None
+
+    # --- Scoring ---
+
+    def update(self, new_rows: pd.DataFrame, emit: bool = True) -> pd.DataFrame:
+        """
+        Feeds raw order rows for days after the last processed date and returns
+        the anomalies found on those days (same columns as
+        AnomalyStatAgent.get_anomalies_df). emit=False only primes the state.
+        """
+        p = self.params
+        group_col, target_col = p["group_col"], p["target_col"]
+
+        rows = new_rows.copy()
+        rows["Order Date"] = pd.to_datetime(rows["Order Date"])
+        if self.last_date is not None:
+            stale = rows["Order Date"] <= self.last_date
+            if stale.any():
+                logger.warning(
+                    f"Ignoring {int(stale.sum())} rows at or before {self.last_date.date()}"
+                )
+                rows = rows[~stale]
+        if rows.empty:
+            return pd.DataFrame()
+
+        table = AnomalyTable()
+        daily = rows.groupby("Order Date")[target_col].sum()
+        by_entity = rows.groupby(["Order Date", group_col])[target_col].sum()
+        # Days whose rows all lack a group key still score globally
+        by_date = {
+            date: values.droplevel(0)
+            for date, values in by_entity.groupby(level=0, sort=False)
+        }
+
+        for date, total in daily.items():
+            date_str = date.strftime("%Y-%m-%d")
+            self.global_state.push(float(total))
+            if emit:
+                self._score_global(table, date_str, float(total))
+
+            for entity, value in by_date.get(date, {}).items():
+                value = float(value)
+                key = str(entity)  # checkpoint keys are strings
+                state = self.entity_state.get(key)
+                if state is None:
+                    state = self.entity_state[key] = SortedWindow(p["iqr_window"])
+                state.push(value)
+                prev = self.last_value.get(key)
+                self.last_value[key] = value
+                if emit:
+                    self._score_iqr(table, date_str, entity, value, state)
+                    self._score_pct(table, date_str, entity, value, prev)
+
+            self.last_date = date
+
+        return table.to_frame()
+
+    def _anomaly_id(self, date_str, entity, detector, score):
+        prefix = AnomalyStatAgent._id_prefix(detector, self.params["target_col"])
+        clean_entity = str(entity).replace(" ", "_")
+        return f"{prefix}_{clean_entity}_{date_str}_s{int(score)}"
+
+    def _score_global(self, table, date_str, value):
+        p = self.params
+        state = self.global_state
+        std = state.std()
+        z = (value - state.mean) / (1.0 if std == 0 else std)
+        if not abs(z) > p["zscore_threshold"]:
+            return
+        score = round(abs(z), 2)
+        mean = float(round(state.mean, 2))
+        table.append(
+            AnomalyRecord(
+                anomaly_id=self._anomaly_id(date_str, "Global", "zscore", score),
+                level="global",
+                entity_id="All_Regions",
+                period_start=date_str,
+                period_end=date_str,
+                metric=p["target_col"],
+                value=value,
+                expected=mean,
+                score=score,
+                detector="zscore",
+                reason=f"Spike detected (Z={score})",
+                context={
+                    "window_mean": mean,
+                    "window_std": float(round(std, 2)),
+                    "threshold": p["zscore_threshold"],
+                },
+            ),
+        )
+
+    def _score_iqr(self, table, date_str, entity, value, state):
+        p = self.params
+        q1, q3 = state.quantiles((0.25, 0.75))
+        iqr = q3 - q1
+        lower = max(q1 - p["iqr_k"] * iqr, q1 * 0.25)
+        upper = q3 + p["iqr_k"] * iqr
+        if not ((value < lower or value > upper) and value >= 0):
+            return
+        dist = value - q3 if value > q3 else q1 - value
+        score = round(abs(dist) / (iqr if iqr > 0 else 1.0), 2)
+        table.append(
+            AnomalyRecord(
+                anomaly_id=self._anomaly_id(date_str, entity, "iqr", score),
+                level=p["group_col"].lower(),
+                entity_id=str(entity),
+                period_start=date_str,
+                period_end=date_str,
+                metric=p["target_col"],
+                value=value,
+                expected=float(round(q3 if value > q3 else q1, 2)),
+                score=score,
+                detector="iqr",
+                reason=f"Outside Tukey Fence (Score={score})",
+                context={
+                    "Q1": float(round(q1, 2)),
+                    "Q3": float(round(q3, 2)),
+                    "IQR": float(round(iqr, 2)),
+                },
+            ),
+        )
+
+    def _score_pct(self, table, date_str, entity, value, prev):
+        p = self.params
+        if prev is None:
+            return
+        # numpy division keeps the batch detector's +/-inf behaviour for prev == 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pct = float(np.float64(value - prev) / np.float64(prev))
+        if p["drop_threshold"] is not None and pct < -p["drop_threshold"]:
+            detector, move = "pct_drop", abs(pct) * 100
+            score = min(10.0, move / 10)
+            reason = f"Extreme drop: {move:.1f}% from {prev:.0f} to {value:.0f}"
+        elif p["spike_threshold"] is not None and pct > p["spike_threshold"]:
+            detector, move = "pct_spike", pct * 100
+            score = min(10.0, move / 20)
+            reason = f"Extreme spike: +{move:.1f}% from {prev:.0f} to {value:.0f}"
+        else:
+            return
+        table.append(
+            AnomalyRecord(
+                anomaly_id=self._anomaly_id(date_str, entity, detector, score),
+                level="category",
+                entity_id=entity,
+                period_start=date_str,
+                period_end=date_str,
+                metric=p["target_col"],
+                value=value,
+                expected=prev,
+                score=score,
+                detector=detector,
+                reason=reason,
+                context={"pct_change": pct},
+            ),
+        )
+
+    # --- Checkpointing ---
+
+    def state_dict(self) -> Dict[str, Any]:
+        state = self.global_state
+        return {
+            "__state_version": self.STATE_VERSION,
+            "params": self.params,
+            "last_date": self.last_date.isoformat() if self.last_date else None,
+            "global": {
+                "values": list(state.buffer),
+                "mean": state.mean,
+                "m2": state.m2,
+            },
+            "entities": {
+                str(k): {
+                    "window": {"values": list(v.buffer)},
+                    "last_value": self.last_value.get(k),
+                }
+                for k, v in self.entity_state.items()
+            },
+        }
+
+    def save_checkpoint(self, path: str):
+        """Atomically writes the rolling state to a JSON checkpoint."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=path.parent, delete=False) as tmp:
+            json.dump(self.state_dict(), tmp)
+            tmp_name = tmp.name
+        os.replace(tmp_name, path)
+
+    @classmethod
+    def load_checkpoint(cls, path: str) -> "StreamingAnomalyDetector":
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("__state_version") not in cls.READABLE_STATE_VERSIONS:
+            raise ValueError(f"Unsupported checkpoint version in {path}")
+
+        det = cls(**data["params"])
+
+        saved = data["global"]
+        det.global_state = WindowMoments(det.params["zscore_window"], saved["values"])
+        # Restore the exact accumulators rather than the rebuilt ones
+        det.global_state.mean, det.global_state.m2 = saved["mean"], saved["m2"]
+        for entity, saved in data["entities"].items():
+            values = saved["window"]["values"]
+            det.entity_state[entity] = SortedWindow(det.params["iqr_window"], values)
+            if saved["last_value"] is not None:
+                det.last_value[entity] = saved["last_value"]
+        if data["last_date"]:
+            det.last_date = pd.Timestamp(data["last_date"])
+        return det
@@ -53,13 +53,19 @@ def load_snapshot() -> pd.DataFrame:
 # ---------------------------------------------------------
 @st.cache_data(ttl=60)
 def load_anomalies() -> pd.DataFrame:
-    """Loads detected anomalies."""
-    path = DATA_DIR / "anomalies.json"
-    if not path.exists():
-        return pd.DataFrame()
+    """Loads detected anomalies (typed Parquet, legacy JSON as fallback)."""
+    path = DATA_DIR / "anomalies.parquet"
+    legacy = DATA_DIR / "anomalies.json"
 
     try:
-        with open(path, "r") as f:
+        if path.exists():
+            df = pd.read_parquet(path)
+            df["context"] = df["context"].apply(lambda c: json.loads(c) if c else {})
+            return df
+        if not legacy.exists():
+            return pd.DataFrame()
+
+        with open(legacy, "r") as f:
             data = json.load(f)
 
         rows = data.get("all_anomalies", []) if isinstance(data, dict) else data
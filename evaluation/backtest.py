@@ -0,0 +1,209 @@
+"""
+evaluation/backtest.py
+Parameter-sweep backtesting for the statistical detectors.
+
+Each (detector, group_col, window) job computes its rolling statistics once
+on the shared daily aggregate; every threshold in the grid is then scored
+with one broadcast comparison (rows x thresholds) using the same decision
+rule as AnomalyStatAgent. Jobs run in a process pool. Every grid point gets
+precision / recall / F1 against the gold labels, matched on "date|entity"
+keys exactly like eval_detector.
+"""
+
+import os
+import sys
+import json
+import argparse
+import concurrent.futures
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parents[1]))
+from agents.anomaly_stats_agent import AnomalyStatAgent, DailyAggregate
+from agents.rolling_quantiles import rolling_quantiles, segment_offsets
+from evaluation.eval_detector import load_gold_keys, normalize_entity
+
+# detector -> parameter lists; "threshold" is k for iqr and the fraction for pct_*
+DEFAULT_GRID = {
+    "zscore": {
+        "window": [7, 14, 21, 30, 45, 60, 90],
+        "threshold": np.round(np.arange(1.5, 5.01, 0.25), 2).tolist(),
+    },
+    "iqr": {
+        "group_col": ["Region", "Category"],
+        "window": [7, 14, 21, 30, 45, 60],
+        "threshold": np.round(np.arange(0.5, 5.01, 0.25), 2).tolist(),
+    },
+    "pct_drop": {
+        "group_col": ["Region", "Category"],
+        "threshold": np.round(np.arange(0.05, 1.0, 0.05), 2).tolist(),
+    },
+    "pct_spike": {
+        "group_col": ["Region", "Category"],
+        "threshold": np.round(np.arange(0.25, 5.01, 0.25), 2).tolist(),
+    },
+}
+
+
+def _hit_matrix(agg: DailyAggregate, job: Dict) -> np.ndarray:
+    """Rows x thresholds boolean hits, same rules as the agent's detectors."""
+    x = agg.values
+    thresholds = np.asarray(job["thresholds"], dtype=float)
+    detector = job["detector"]
+
+    if detector == "zscore":
+        series = pd.Series(x)
+        rolling = series.rolling(window=job["window"], min_periods=1)
+        mean, std = rolling.mean(), rolling.std()
+        z = ((series - mean) / std.replace(0, 1)).to_numpy()
+        return np.abs(z)[:, None] > thresholds
+
+    if detector == "iqr":
+        offset = segment_offsets(agg.starts, len(x))
+        q = rolling_quantiles(x, offset, job["window"], (0.25, 0.75))
+        q1, q3 = q[:, :1], q[:, 1:]
+        iqr = q3 - q1
+        lower = np.maximum(q1 - thresholds * iqr, q1 * 0.25)
+        upper = q3 + thresholds * iqr
+        return ((x[:, None] < lower) | (x[:, None] > upper)) & (x[:, None] >= 0)
+
+    prev = np.empty(len(x))
+    prev[1:] = x[:-1]
+    prev[agg.starts] = np.nan
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = (x - prev) / prev
+    if detector == "pct_drop":
+        return pct[:, None] < -thresholds
+    return pct[:, None] > thresholds
+
+
+def _run_job(agg: DailyAggregate, is_gold: np.ndarray, job: Dict) -> List[Dict]:
+    hits = _hit_matrix(agg, job)
+    detected = hits.sum(axis=0)
+    tp = hits[is_gold].sum(axis=0)
+    return [
+        {
+            "detector": job["detector"],
+            "group_col": job["group_col"],
+            "window": job["window"],
+            "threshold": t,
+            "detected": int(d),
+            "true_positives": int(p),
+        }
+        for t, d, p in zip(job["thresholds"], detected.tolist(), tp.tolist())
+    ]
+
+
+def _row_keys(agg: DailyAggregate) -> np.ndarray:
+    dates = agg.frame["Order Date"].dt.strftime("%Y-%m-%d")
+    if agg.group_col is None:
+        entities = pd.Series("All_Regions", index=dates.index)
+    else:
+        entities = agg.frame[agg.group_col].astype(str).map(normalize_entity)
+    return (dates + "|" + entities).to_numpy()
+
+
+def backtest(
+    df: pd.DataFrame,
+    gold_keys: Set[str],
+    grid: Optional[Dict[str, Dict[str, list]]] = None,
+    target_col: str = "Sales",
+    n_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Scores every point of `grid` (see DEFAULT_GRID) against `gold_keys`.
+    Returns one row per point with detected / true_positives / precision /
+    recall / f1, best F1 first.
+    """
+    grid = grid or DEFAULT_GRID
+    agent = AnomalyStatAgent(df)
+
+    jobs = []
+    for detector, params in grid.items():
+        group_cols = [None] if detector == "zscore" else params["group_col"]
+        windows = params.get("window", [None])
+        for group_col in group_cols:
+            for window in windows:
+                jobs.append(
+                    {
+                        "detector": detector,
+                        "group_col": group_col,
+                        "window": window,
+                        "thresholds": list(params["threshold"]),
+                    }
+                )
+
+    # Aggregates (and their gold masks) are built once per group column
+    inputs = {}
+    for group_col in {job["group_col"] for job in jobs}:
+        agg = agent.aggregate(group_col, target_col)
+        inputs[group_col] = (agg, np.isin(_row_keys(agg), list(gold_keys)))
+
+    n_workers = n_workers or min(len(jobs), os.cpu_count() or 1)
+    if n_workers <= 1:
+        results = [_run_job(*inputs[job["group_col"]], job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(n_workers) as pool:
+            futures = [
+                pool.submit(_run_job, *inputs[job["group_col"]], job) for job in jobs
+            ]
+            results = [f.result() for f in futures]
+
+    points = pd.DataFrame([row for rows in results for row in rows])
+    detected = points["detected"].to_numpy()
+    tp = points["true_positives"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(detected > 0, tp / detected, 0.0)
+    recall = tp / len(gold_keys) if gold_keys else np.zeros(len(points))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f1 = np.where(
+            precision + recall > 0,
+            2 * precision * recall / (precision + recall),
+            0.0,
+        )
+    points["precision"] = np.round(precision, 4)
+    points["recall"] = np.round(recall, 4)
+    points["f1_score"] = np.round(f1, 4)
+    return points.sort_values(
+        ["f1_score", "recall", "detected"],
+        ascending=[False, False, True],
+        kind="stable",
+        ignore_index=True,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default="../data/test_labels/synthetic_sales.parquet")
+    parser.add_argument("--gold", default="../data/test_labels/anomalies_gold.jsonl")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default="./results_backtest.json")
+    args = parser.parse_args()
+
+    try:
+        points = backtest(
+            pd.read_parquet(args.data),
+            load_gold_keys(args.gold),
+            n_workers=args.workers,
+        )
+        best = points.groupby("detector", sort=False).head(5)
+        print(f"Backtested {len(points)} grid points. Best per detector:")
+        print(best.to_string(index=False))
+
+        with open(args.out, "w") as f:
+            json.dump(
+                {
+                    "points": len(points),
+                    "best": best.astype(object)
+                    .where(best.notna(), None)
+                    .to_dict("records"),
+                },
+                f,
+                indent=2,
+            )
+
+    except Exception as e:
+        print(f"Backtest Failed: {e}")
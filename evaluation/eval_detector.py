@@ -13,6 +13,21 @@ from typing import Dict, List, Set
 # Import our Agent
 sys.path.append(str(Path(__file__).parents[1]))
 from agents.anomaly_stats_agent import AnomalyStatAgent
+from agents.detector_registry import DetectorRunner
+
+EVAL_DETECTORS = [
+    {"detector": "zscore", "threshold": 2.0},
+    {"detector": "iqr", "group_col": "Region", "k": 1.5},
+    {"detector": "iqr", "group_col": "Category", "k": 1.5},
+    # Percentage change: 5% drops and 50% spikes (to catch the 177% spike)
+    # in a single fused pass over the Category series
+    {
+        "detector": "pct_change",
+        "group_col": "Category",
+        "drop_threshold": 0.05,
+        "spike_threshold": 0.5,
+    },
+]
 
 
 def normalize_date(d):
@@ -32,6 +47,22 @@ def normalize_entity(e):
     return mapping.get(e_str, e_str)
 
 
+def gold_key(label: Dict) -> str:
+    """Match key "YYYY-MM-DD|Entity" of one gold label."""
+    return f"{normalize_date(label['date'])}|{normalize_entity(label['entity'])}"
+
+
+def load_gold_labels(gold_labels_path: str) -> List[Dict]:
+    """Gold label records from a JSONL file (blank lines skipped)."""
+    with open(gold_labels_path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_gold_keys(gold_labels_path: str) -> Set[str]:
+    """Gold labels as "YYYY-MM-DD|Entity" match keys."""
+    return {gold_key(label) for label in load_gold_labels(gold_labels_path)}
+
+
 def evaluate_detector(synthetic_data_path: str, gold_labels_path: str) -> Dict:
     print(f"Evaluation: Loading data from {synthetic_data_path}")
 
@@ -40,28 +71,15 @@ def evaluate_detector(synthetic_data_path: str, gold_labels_path: str) -> Dict:
 
     df = pd.read_parquet(synthetic_data_path)
 
-    # 1. Run Agent
+    # 1. Run Agent (all detectors, concurrently on shared aggregates)
     agent = AnomalyStatAgent(df)
-
-    # Run all detectors
-    agent.detect_global_zscore(threshold=2.0)
-    agent.detect_grouped_iqr(group_col="Region", k=1.5)
-    agent.detect_grouped_iqr(group_col="Category", k=1.5)
-
-    # Add percentage change detectors for both drops and spikes
-    agent.detect_percentage_drop(group_col="Category", threshold=0.05)  # 5% drop
-
-    # Also detect significant jumps (to catch the 177% spike)
-    agent.detect_percentage_spike(group_col="Category", threshold=0.5)  # 50% spike
+    DetectorRunner(agent).run(EVAL_DETECTORS)
 
     all_detected = agent.get_anomalies_df()
     print(f"Agent found {len(all_detected)} anomalies.")
 
     # 2. Load Ground Truth
-    gold_labels = []
-    with open(gold_labels_path, "r") as f:
-        for line in f:
-            gold_labels.append(json.loads(line))
+    gold_labels = load_gold_labels(gold_labels_path)
     print(f"Gold dataset has {len(gold_labels)} labeled anomalies.")
 
     # 3. Match Logic
@@ -77,10 +95,7 @@ def evaluate_detector(synthetic_data_path: str, gold_labels_path: str) -> Dict:
 
     # Check Recall
     for label in gold_labels:
-        l_date = normalize_date(label["date"])
-        l_entity = normalize_entity(label["entity"])
-
-        target_key = f"{l_date}|{l_entity}"
+        target_key = gold_key(label)
 
         if target_key in detected_keys:
             true_positives += 1
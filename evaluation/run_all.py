@@ -34,6 +34,7 @@ TEST_LABELS_DIR = Path("data/test_labels")
 # Scripts (Relative)
 SCRIPT_GEN = Path("evaluation/create_synthetic_anomalies.py")
 SCRIPT_DET = Path("evaluation/eval_detector.py")
+SCRIPT_SWEEP = Path("evaluation/backtest.py")
 SCRIPT_SCHEMA = Path("evaluation/eval_schema_compliance.py")
 SCRIPT_IMPACT = Path("evaluation/impact_simulator.py")
 
@@ -67,6 +68,9 @@ run(f"python {SCRIPT_GEN} --input {DATA_CLEAN} --out {TEST_LABELS_DIR}")
 # Step 2: Detector Eval
 run(f"python {SCRIPT_DET} --data {DATA_TEST} --gold {LABELS_GOLD}")
 
+# Step 2b: Detector Parameter Sweep
+run(f"python {SCRIPT_SWEEP} --data {DATA_TEST} --gold {LABELS_GOLD}")
+
 # Step 3: Schema Eval
 # Find latest run for enriched anomalies
 runs_dir = Path("outputs/runs")
@@ -46,9 +46,11 @@ class MemoryBank:
         self.store_pii = store_pii
         self.max_memories = max_memories
 
-        self.audit_file = (
-            self.persistence_path.parent.parent / "observability" / "memory_runs.jsonl"
+        # Next to the bank's outputs/ unless OBSERVABILITY_DIR says otherwise
+        audit_dir = os.getenv(
+            "OBSERVABILITY_DIR", self.persistence_path.parent.parent / "observability"
         )
+        self.audit_file = Path(audit_dir) / "memory_runs.jsonl"
         self.audit_file.parent.mkdir(parents=True, exist_ok=True)
 
         self.stats = {"upserts": 0, "queries": 0, "evictions": 0, "errors": 0}
@@ -26,6 +26,10 @@ LLM_CALLS = Counter(
     "salesops_llm_calls_total", "Total LLM API calls", ["model", "status"]
 )
 
+LLM_CACHE = Counter(
+    "salesops_llm_cache_total", "LLM response cache lookups", ["model", "result"]
+)
+
 LLM_LATENCY = Histogram(
     "salesops_llm_latency_ms",
     "Latency of LLM calls",
@@ -153,6 +153,7 @@ def run_integration_demo(
 
         safe_copy("snapshot", "snapshot.parquet")
         safe_copy("anomalies", "anomalies.json")
+        safe_copy("anomalies_parquet", "anomalies.parquet")
         safe_copy("explanations", "enriched.json")
         safe_copy("actions_log", "actions.jsonl")
 
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# Agent modules open their JSON logs, traces and audit files when imported.
+# Point them at a scratch directory before any test imports them, so test
+# runs never write into the repo's outputs/
+os.environ.setdefault(
+    "OBSERVABILITY_DIR", tempfile.mkdtemp(prefix="salesops-observability-")
+)
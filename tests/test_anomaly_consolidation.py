@@ -0,0 +1,82 @@
+import sys
+import os
+import pytest
+import pandas as pd
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from agents.anomaly_stats_agent import AnomalyStatAgent
+from agents.anomaly_consolidation import assign_episodes, detector_percentiles
+
+
+def _hits(rows):
+    frame = pd.DataFrame(
+        rows, columns=["entity_id", "period_start", "detector", "score"]
+    )
+    frame["period_end"] = frame["period_start"]
+    frame["level"] = "region"
+    frame["metric"] = "Sales"
+    return frame
+
+
+def test_episodes_join_overlapping_and_adjacent_days():
+    hits = _hits(
+        [
+            ("East", "2024-01-05", "zscore", 4.0),
+            ("East", "2024-01-05", "iqr", 9.0),
+            ("East", "2024-01-06", "pct_spike", 2.0),
+            ("East", "2024-01-09", "iqr", 3.0),  # 3 days later: new episode
+            ("West", "2024-01-05", "iqr", 5.0),  # other entity
+        ]
+    )
+    assert assign_episodes(hits).tolist() == [0, 0, 0, 1, 2]
+    assert assign_episodes(hits, gap_days=3).tolist() == [0, 0, 0, 0, 1]
+
+    # A long period (e.g. a level shift) absorbs the hits inside it
+    hits.loc[0, "period_end"] = "2024-01-20"
+    assert assign_episodes(hits).tolist() == [0, 0, 0, 0, 1]
+
+
+def test_percentiles_are_per_detector():
+    hits = _hits(
+        [
+            ("East", "2024-01-01", "zscore", 3.0),
+            ("East", "2024-01-02", "zscore", 6.0),
+            ("East", "2024-01-03", "iqr", 60.0),
+        ]
+    )
+    np.testing.assert_allclose(detector_percentiles(hits), [1 / 3, 2 / 3, 1 / 2])
+
+
+@pytest.fixture
+def spiky_regions():
+    """90 days for two regions; East has a two-day spike on days 40-41."""
+    np.random.seed(4)
+    dates = pd.date_range(start="2024-01-01", periods=90)
+    frames = []
+    for region in ("East", "West"):
+        sales = np.random.normal(800, 30, len(dates))
+        if region == "East":
+            sales[40:42] *= 6
+        frames.append(
+            pd.DataFrame({"Order Date": dates, "Sales": sales, "Region": region})
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_consolidated_episode_combines_detectors(spiky_regions):
+    agent = AnomalyStatAgent(spiky_regions)
+    agent.detect_grouped_iqr(group_col="Region")
+    agent.detect_percentage_change(group_col="Region")
+    raw = agent.get_anomalies_df()
+    spike = raw[(raw["entity_id"] == "East") & (raw["period_start"] == "2024-02-10")]
+    assert spike["detector"].nunique() >= 2
+
+    episodes = agent.consolidate_anomalies().to_frame()
+    assert len(episodes) < len(raw)
+    top = episodes.sort_values("score", ascending=False).iloc[0]
+    assert top["entity_id"] == "East" and top["period_start"] <= "2024-02-10"
+    assert top["period_end"] >= "2024-02-11"
+    assert "+" in top["detector"] and 0 < top["score"] <= 100
+    assert set(spike["anomaly_id"]) <= set(top["context"]["anomaly_ids"])
+    assert sum(len(c["anomaly_ids"]) for c in episodes["context"]) == len(raw)
@@ -1,10 +1,15 @@
 import sys
 import os
+import json
+import threading
+import time
+import asyncio
 import pytest
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from agents.anomaly_llm_agent import AnomalyExplainerAgent
+from agents.anomaly_llm_agent import AnomalyExplainerAgent, AsyncRateLimiter
 
 
 @pytest.fixture
@@ -45,6 +50,205 @@ def test_circuit_breaker_skipped_flags(agent):
         assert results[1]["skipped_reason"] == "Circuit Breaker Tripped"
 
 
+class FakeAsyncModels:
+    """Async generate_content stand-in that records how many calls overlap."""
+
+    def __init__(self, delay=0.01, hang_first=0):
+        self.delay = delay
+        self.hang_first = hang_first
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_content(self, model, contents, config):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(60 if self.calls <= self.hang_first else self.delay)
+            payload = {k: "ok" for k in AnomalyExplainerAgent.REQUIRED_KEYS}
+            return SimpleNamespace(text=json.dumps(payload))
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def async_agent(tmp_path):
+    agent = AnomalyExplainerAgent(dry_run=False, cache_dir=str(tmp_path / "cache"))
+    agent.audit_file = tmp_path / "llm_calls.jsonl"
+    agent.response_dir = tmp_path
+    agent.memory = None
+    agent.REQUESTS_PER_SECOND = 1000.0
+    agent.BASE_DELAY = 0.0
+    models = FakeAsyncModels()
+    agent.model = SimpleNamespace(
+        api_client=SimpleNamespace(aio=SimpleNamespace(models=models))
+    )
+    return agent, models
+
+
+def test_async_explain_bounds_concurrency(async_agent):
+    agent, models = async_agent
+    batch = [{"anomaly_id": f"a{i}", "value": i} for i in range(60)]
+
+    results = agent.explain_concurrently(batch, max_concurrency=8)
+
+    assert [r["anomaly_id"] for r in results] == [a["anomaly_id"] for a in batch]
+    assert all(r["explanation_short"] == "ok" for r in results)
+    assert models.calls == 60
+    assert 1 < models.max_in_flight <= 8
+
+
+def test_async_explain_times_out_and_retries(async_agent):
+    agent, models = async_agent
+    agent.REQUEST_TIMEOUT = 0.05
+    models.hang_first = 1  # the first request never answers
+
+    results = agent.explain_concurrently([{"anomaly_id": "slow"}])
+
+    assert results[0]["explanation_short"] == "ok"
+    assert models.calls == 2
+
+
+def test_async_circuit_breaker_skips_the_rest(async_agent):
+    agent, _ = async_agent
+    agent.CIRCUIT_BREAKER_THRESHOLD = 2
+
+    with patch.object(agent, "_call_llm_async", side_effect=Exception("Fail")):
+        results = agent.explain_concurrently(
+            [{"id": i} for i in range(5)], max_concurrency=1
+        )
+
+    assert ["skipped" in r for r in results] == [False, False, True, True, True]
+
+
+def test_rate_limiter_spaces_requests():
+    async def burst():
+        limiter = AsyncRateLimiter(50.0)
+        start = time.monotonic()
+        await asyncio.gather(*(limiter.acquire() for _ in range(6)))
+        return time.monotonic() - start
+
+    assert asyncio.run(burst()) >= 5 / 50.0 * 0.9
+
+
+def test_rerun_is_served_from_cache(async_agent):
+    agent, models = async_agent
+    batch = [{"anomaly_id": f"a{i}", "value": i} for i in range(10)]
+
+    first = agent.explain_concurrently(batch)
+    second = agent.explain_concurrently(batch)
+    sequential = agent.batch_explain(batch[:3])
+
+    assert models.calls == 10
+    assert not any(r["meta"]["cached"] for r in first)
+    assert all(r["meta"]["cached"] for r in second + sequential)
+    assert [r["explanation_short"] for r in second] == ["ok"] * 10
+
+    with open(agent.audit_file) as f:
+        statuses = [json.loads(line)["status"] for line in f]
+    assert statuses.count("SUCCESS") == 10 and statuses.count("CACHE_HIT") == 13
+
+    # A new explanation version must not replay old answers
+    agent.EXPLANATION_VERSION = "9.9"
+    agent.explain_concurrently(batch[:2])
+    assert models.calls == 12
+
+
+def test_cache_ignores_calibrated_score_and_severity(async_agent):
+    agent, models = async_agent
+    episodes = [
+        {
+            "anomaly_id": f"episode_East_2024-02-0{i}_2024-02-0{i}",
+            "entity_id": "East",
+            "period_start": f"2024-02-0{i}",
+            "period_end": f"2024-02-0{i}",
+            "value": 900.0 + i,
+            "expected": 300.0,
+            "score": 91.5,
+            "context": {"severity": 0.915, "hits": 2, "detector_scores": {"iqr": 4.0}},
+        }
+        for i in range(1, 5)
+    ]
+    agent.explain_concurrently(episodes)
+
+    # A later run rates the same episodes against a longer score history
+    drifted = [
+        {**e, "score": 87.0, "context": {**e["context"], "severity": 0.87}}
+        for e in episodes
+    ]
+    second = agent.explain_concurrently(drifted)
+    assert models.calls == 4
+    assert all(r["meta"]["cached"] for r in second)
+
+    # Different raw facts are a different question
+    agent.explain_concurrently([{**episodes[0], "value": 1500.0}])
+    assert models.calls == 5
+
+
+def test_cache_keys_on_memory_history_and_template(async_agent):
+    agent, models = async_agent
+    batch = [{"anomaly_id": "a0", "entity_id": "East", "value": 900.0}]
+    history = {"text": "No relevant past events found."}
+    agent.memory = SimpleNamespace(
+        retrieve_relevant_history=lambda record: history["text"]
+    )
+
+    agent.explain_concurrently(batch)
+    assert agent.explain_concurrently(batch)[0]["meta"]["cached"]
+    assert models.calls == 1
+
+    # The memory bank learned about East since: answer with that in view
+    history["text"] = "- [2024-01-05] (Sim: 0.91) East sales spiked after a promo"
+    assert not agent.explain_concurrently(batch)[0]["meta"]["cached"]
+    assert agent.batch_explain(batch)[0]["meta"]["cached"]
+    assert models.calls == 2
+
+    agent.PROMPT_TEMPLATE = agent.PROMPT_TEMPLATE + "- Answer in English.\n"
+    agent.explain_concurrently(batch)
+    assert models.calls == 3
+
+
+def test_async_cache_hit_resets_circuit_breaker(async_agent):
+    agent, _ = async_agent
+    agent.CIRCUIT_BREAKER_THRESHOLD = 2
+    agent.explain_concurrently([{"anomaly_id": "seen", "value": 1}])
+
+    # fail, hit, fail, fail: only the last two failures are consecutive
+    batch = [{"anomaly_id": f"new{i}", "value": 10 + i} for i in range(4)]
+    batch[1] = {"anomaly_id": "seen", "value": 1}
+    with patch.object(agent, "_call_llm_async", side_effect=Exception("Fail")):
+        results = agent.explain_concurrently(batch, max_concurrency=1)
+
+    assert results[1]["meta"]["cached"]
+    assert ["error" in r for r in results] == [True, False, True, True]
+    assert not any(r.get("skipped") for r in results)
+
+
+def test_cache_and_audit_io_stay_off_the_event_loop(async_agent):
+    agent, models = async_agent
+    batch = [{"anomaly_id": f"a{i}", "value": i} for i in range(6)]
+    io_threads = []
+
+    def on_thread(func):
+        def wrapper(*args, **kwargs):
+            io_threads.append(threading.get_ident())
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    agent.cache.get = on_thread(agent.cache.get)
+    agent.cache.put = on_thread(agent.cache.put)
+    agent._write_audit = on_thread(agent._write_audit)
+
+    agent.explain_concurrently(batch)  # misses: get, audit, put
+    agent.explain_concurrently(batch)  # hits: get, audit
+
+    assert len(io_threads) == 5 * len(batch)
+    # explain_concurrently runs the event loop on the calling thread
+    assert threading.get_ident() not in io_threads
+
+
 if __name__ == "__main__":
     # Quick sanity check
     a = AnomalyExplainerAgent(dry_run=True)
@@ -7,7 +7,7 @@ import numpy as np
 # Add project root
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from agents.anomaly_stats_agent import AnomalyStatAgent
+from agents.anomaly_stats_agent import AnomalyStatAgent, AnomalyTable, AnomalyRecord
 
 
 @pytest.fixture
@@ -63,6 +63,401 @@ def test_grouped_iqr(synthetic_data):
     assert iqr_records.iloc[0]["entity_id"] == "North"
 
 
+@pytest.fixture
+def multi_entity_data():
+    """120 days of sales for 30 products with scattered spikes and drops."""
+    np.random.seed(3)
+    dates = pd.date_range(start="2024-01-01", periods=120)
+    frames = []
+    for i in range(30):
+        keep = np.sort(np.random.choice(120, 90, replace=False))  # gappy series
+        sales = np.random.normal(100 + i, 10, len(keep))
+        sales[np.random.choice(len(keep), 3, replace=False)] *= [5.0, 0.05, 3.0]
+        frames.append(
+            pd.DataFrame(
+                {"Order Date": dates[keep], "Sales": sales, "Product ID": f"P{i:02d}"}
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_grouped_iqr_matches_per_entity_runs(multi_entity_data):
+    agent = AnomalyStatAgent(multi_entity_data)
+    agent.detect_grouped_iqr(group_col="Product ID", window=14, k=1.5)
+    combined = agent.get_anomalies_df()
+
+    expected = []
+    for _, part in multi_entity_data.groupby("Product ID"):
+        single = AnomalyStatAgent(part)
+        single.detect_grouped_iqr(group_col="Product ID", window=14, k=1.5)
+        expected.append(single.get_anomalies_df())
+    expected = pd.concat(expected, ignore_index=True)
+
+    assert len(combined) > 0
+    pd.testing.assert_frame_equal(combined, expected)
+
+
+def test_detectors_share_daily_aggregates(multi_entity_data):
+    agent = AnomalyStatAgent(multi_entity_data)
+    agent.detect_grouped_iqr(group_col="Product ID")
+    agent.detect_percentage_drop(group_col="Product ID")
+    agent.detect_percentage_spike(group_col="Product ID")
+    agent.detect_global_zscore()
+
+    assert set(agent._aggregates) == {("Product ID", "Sales"), (None, "Sales")}
+
+    agg = agent.aggregate("Product ID", "Sales")
+    dense = agg.dense()
+    assert dense.shape == (len(agg.dates), 30)
+    assert np.nansum(dense) == pytest.approx(multi_entity_data["Sales"].sum())
+    assert np.isnan(dense).sum() == dense.size - len(multi_entity_data)
+
+
+def test_fused_pct_change_matches_wrappers(multi_entity_data):
+    fused = AnomalyStatAgent(multi_entity_data)
+    hits = fused.detect_percentage_change(
+        group_col="Product ID", drop_threshold=0.5, spike_threshold=1.0
+    )
+
+    separate = AnomalyStatAgent(multi_entity_data)
+    drops = separate.detect_percentage_drop(group_col="Product ID", threshold=0.5)
+    spikes = separate.detect_percentage_spike(group_col="Product ID", threshold=1.0)
+
+    assert len(hits) == len(drops) + len(spikes)
+    assert (hits["detector"] == "pct_drop").sum() == len(drops)
+    assert (drops["pct_change"] < -0.5).all() and (spikes["pct_change"] > 1.0).all()
+    pd.testing.assert_frame_equal(fused.get_anomalies_df(), separate.get_anomalies_df())
+
+
+def test_anomaly_table_batches_and_records():
+    table = AnomalyTable()
+    table.append_batch(
+        {
+            "anomaly_id": ["a", "b"],
+            "level": "region",
+            "entity_id": ["East", "West"],
+            "period_start": ["2024-01-01", "2024-01-02"],
+            "period_end": ["2024-01-01", "2024-01-02"],
+            "metric": "Sales",
+            "value": np.array([1.0, 9.0]),
+            "expected": np.array([2.0, 3.0]),
+            "score": np.array([1.5, 4.0]),
+            "detector": "iqr",
+            "reason": ["r1", "r2"],
+        },
+        context={"Q1": np.array([0.5, 1.0]), "threshold": 3.0},
+    )
+    table.append(
+        AnomalyRecord("c", "global", "All", "d", "d", "Sales", 1, 1, 2.0, "z", "r", {})
+    )
+
+    assert len(table) == 3
+    frame = table.to_frame(with_context=False)
+    assert "context" not in frame.columns
+    assert frame["score"].dtype == float
+
+    records = table.to_records(sort_by_score=True)
+    assert [r["anomaly_id"] for r in records] == ["b", "c", "a"]
+    assert records[0]["context"] == {"Q1": 1.0, "threshold": 3.0}
+    assert isinstance(records[0]["value"], float)
+    assert all(isinstance(r, AnomalyRecord) for r in table)
+
+
+@pytest.fixture
+def hierarchy_data():
+    """90 days of steady sales for 2 regions x 2 categories x 2 sub-categories."""
+    np.random.seed(11)
+    dates = pd.date_range(start="2024-01-01", periods=90)
+    frames = []
+    for region in ("East", "West"):
+        for category, subs in (
+            ("Tech", ("Phones", "Copiers")),
+            ("Office", ("Paper", "Binders")),
+        ):
+            for sub in subs:
+                frames.append(
+                    pd.DataFrame(
+                        {
+                            "Order Date": dates,
+                            "Region": region,
+                            "Category": category,
+                            "Sub-Category": sub,
+                            "Sales": np.random.normal(100, 5, len(dates)),
+                        }
+                    )
+                )
+    df = pd.concat(frames, ignore_index=True)
+    # One leaf spikes hard enough to move its category and region too
+    spike = (df["Order Date"] == dates[70]) & (df["Sub-Category"] == "Phones")
+    df.loc[spike & (df["Region"] == "East"), "Sales"] = 2000
+    return df
+
+
+def test_hierarchical_levels_roll_up_from_leaves(hierarchy_data):
+    agent = AnomalyStatAgent(hierarchy_data)
+    region, category, leaf = agent.aggregate_hierarchy(
+        ["Region", "Category", "Sub-Category"], "Sales"
+    )
+
+    assert list(region.entities) == ["East", "West"]
+    assert list(category.parent) == ["East", "East", "West", "West"]
+    assert leaf.entities[0] == "East/Office/Binders"
+    assert leaf.values.sum() == pytest.approx(hierarchy_data["Sales"].sum())
+
+    # The top level is the same series the single-level detectors use
+    direct = AnomalyStatAgent(hierarchy_data).aggregate("Region", "Sales")
+    np.testing.assert_allclose(region.values, direct.values)
+
+
+def test_hierarchical_attributes_parent_to_leaf(hierarchy_data):
+    agent = AnomalyStatAgent(hierarchy_data)
+    hits = agent.detect_hierarchical(detectors=("iqr",), window=30)
+
+    spike_day = hits[hits["Order Date"] == pd.Timestamp("2024-03-11")]
+    assert set(spike_day["depth"]) == {1, 2, 3}
+    region_hit = spike_day[spike_day["depth"] == 1].iloc[0]
+    assert region_hit["entity_id"] == "East"
+    assert region_hit["explained_by"] == "Region/Category/Sub-Category"
+    assert region_hit["driver"] == "East/Tech/Phones"
+
+    records = agent.get_anomalies_df()
+    assert len(records) == len(hits)
+    assert set(records["level"]) >= {"region", "region/category/sub-category"}
+    leaf_ctx = records[records["entity_id"] == "East/Tech/Phones"]["context"]
+    assert any(c["parent"] == "East/Tech" for c in leaf_ctx)
+
+    with pytest.raises(ValueError):
+        agent.detect_hierarchical(detectors=("bogus",))
+
+
+def test_multi_metric_matches_single_metric_runs(multi_entity_data):
+    data = multi_entity_data.assign(Profit=multi_entity_data["Sales"] * 0.2 - 5)
+    metrics = ["Sales", "Profit"]
+
+    single = AnomalyStatAgent(data)
+    for metric in metrics:
+        single.detect_grouped_iqr("Product ID", metric)
+    for metric in metrics:
+        single.detect_percentage_change(metric, "Product ID")
+
+    multi = AnomalyStatAgent(data)
+    iqr = multi.detect_grouped_iqr("Product ID", metrics)
+    multi.detect_percentage_change(metrics, "Product ID")
+    zscores = multi.detect_global_zscore(metrics, threshold=2.0)
+
+    assert set(iqr["metric"]) == set(metrics)
+    assert ("Product ID", ("Sales", "Profit")) in multi._aggregates
+
+    records = multi.get_anomalies_df()
+    records = records[records["detector"] != "zscore"]
+    expected = single.get_anomalies_df()
+    key = ["detector", "metric", "anomaly_id"]
+    pd.testing.assert_frame_equal(
+        records.sort_values(key).reset_index(drop=True),
+        expected.sort_values(key).reset_index(drop=True),
+    )
+    assert records["anomaly_id"].is_unique
+    assert (
+        records[records["metric"] == "Profit"]["anomaly_id"]
+        .str.contains("_Profit_")
+        .all()
+    )
+
+    for metric in metrics:
+        alone = AnomalyStatAgent(data).detect_global_zscore(metric, threshold=2.0)
+        hits = zscores[zscores["metric"] == metric]
+        np.testing.assert_array_equal(hits["value"], alone[metric])
+        np.testing.assert_allclose(hits["zscore"], alone["zscore"])
+
+
+@pytest.mark.parametrize("fill", ["zero", "nan"])
+def test_calendar_iqr_uses_day_windows(multi_entity_data, fill):
+    data = multi_entity_data[multi_entity_data["Product ID"] < "P05"]
+    agent = AnomalyStatAgent(data)
+    hits = agent.detect_grouped_iqr("Product ID", window=7, calendar_fill=fill)
+
+    days = agent.aggregate("Product ID", "Sales").calendar()
+    expected = []
+    for product, part in data.sort_values("Order Date").groupby("Product ID"):
+        series = part.set_index("Order Date")["Sales"]
+        series = series.reindex(days[days >= series.index.min()])
+        if fill == "zero":
+            series = series.fillna(0.0)
+        rolling = series.rolling(7, min_periods=1)
+        q1, q3 = rolling.quantile(0.25), rolling.quantile(0.75)
+        iqr = q3 - q1
+        lower = np.maximum(q1 - 1.5 * iqr, q1 * 0.25)
+        flagged = ((series < lower) | (series > q3 + 1.5 * iqr)) & (series >= 0)
+        expected.append(series[flagged])
+    expected = pd.concat(expected)
+
+    assert len(hits) == len(expected) > 0
+    np.testing.assert_array_equal(hits["Sales"], expected.to_numpy())
+    np.testing.assert_array_equal(hits["Order Date"], expected.index)
+    assert len(agent.get_anomalies_df()) == len(hits)
+
+
+def test_calendar_dense_matrix_and_pct(multi_entity_data):
+    agent = AnomalyStatAgent(multi_entity_data)
+    agg = agent.aggregate("Product ID", "Sales")
+    dense = agg.dense(0.0, calendar=True)
+
+    assert dense.shape == (len(agg.calendar()), 30)
+    first = dense[:, 0]
+    assert np.isnan(first[: np.argmax(~np.isnan(first))]).all()
+    assert (dense == 0).sum() > 0
+
+    # Previous calendar day: a missing day never counts as "yesterday"
+    hits = agent.detect_percentage_change(group_col="Product ID", calendar_fill="nan")
+    gap = pd.Timedelta(days=1)
+    daily = agg.frame.set_index(["Product ID", "Order Date"])["Sales"]
+    for _, row in hits.head(20).iterrows():
+        assert daily[(row["Product ID"], row["Order Date"] - gap)] == row["prev_value"]
+
+    with pytest.raises(ValueError):
+        agent.detect_grouped_iqr("Product ID", calendar_fill="ffill")
+
+
+@pytest.fixture
+def seasonal_data():
+    """Two years of daily sales with weekend peaks, a 4x December and one spike."""
+    np.random.seed(21)
+    dates = pd.date_range(start="2022-01-01", end="2023-12-31")
+    sales = np.random.normal(100, 5, len(dates))
+    sales[dates.dayofweek >= 5] *= 2.5
+    sales[dates.month == 12] *= 4.0
+    df = pd.DataFrame({"Order Date": dates, "Sales": sales, "Region": "North"})
+    df.loc[dates == "2023-07-12", "Sales"] = 600
+    return df
+
+
+def test_seasonal_baseline_ignores_regular_patterns(seasonal_data):
+    agent = AnomalyStatAgent(seasonal_data)
+    hits = agent.detect_seasonal()
+    assert list(hits["Order Date"].dt.strftime("%Y-%m-%d")) == ["2023-07-12"]
+
+    # The trailing z-score fires on the seasonal step into December
+    zscores = AnomalyStatAgent(seasonal_data).detect_global_zscore(threshold=3.0)
+    assert (zscores["Order Date"].dt.month == 12).any()
+
+    record = agent.get_anomalies_df().iloc[0]
+    assert record["detector"] == "seasonal" and record["entity_id"] == "All_Regions"
+    assert set(record["context"]) == {"trend", "month_effect", "weekday_effect"}
+
+    grouped = agent.detect_seasonal(group_col="Region")
+    assert list(grouped["Region"]) == ["North"]
+
+
+@pytest.mark.parametrize("days", [0, 6])
+def test_seasonal_needs_one_full_week(seasonal_data, days):
+    agent = AnomalyStatAgent(seasonal_data.iloc[:days])
+    assert agent.detect_seasonal().empty
+    assert agent.detect_seasonal(group_col="Region").empty
+    assert len(agent.anomalies) == 0
+
+
+@pytest.fixture
+def shift_data():
+    """Three regions over 300 days: East steps down, North steps up, West is flat."""
+    np.random.seed(8)
+    dates = pd.date_range(start="2023-01-01", periods=300)
+    frames = []
+    for region, step in (("East", (120, 0.7)), ("West", None), ("North", (200, 1.4))):
+        sales = np.random.normal(1000, 80, len(dates))
+        if step:
+            sales[step[0] :] *= step[1]
+        sales[50] *= 4  # one-day spike, not a level shift
+        frames.append(
+            pd.DataFrame({"Order Date": dates, "Sales": sales, "Region": region})
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_level_shifts_one_record_per_segment(shift_data):
+    agent = AnomalyStatAgent(shift_data)
+    shifts = agent.detect_level_shifts(group_col="Region")
+
+    assert list(shifts["Region"]) == ["East", "North"]
+    east, north = shifts.itertuples()
+    assert abs((east.period_start - pd.Timestamp("2023-05-01")).days) <= 3
+    assert abs((north.period_start - pd.Timestamp("2023-07-20")).days) <= 3
+    assert east.shift_sigma < 0 < north.shift_sigma
+    assert (shifts["period_end"] == pd.Timestamp("2023-10-27")).all()
+
+    records = agent.get_anomalies_df()
+    assert set(records["detector"]) == {"level_shift"}
+    assert records.iloc[0]["period_end"] == "2023-10-27"
+    assert records.iloc[0]["value"] < records.iloc[0]["expected"]
+
+
+@pytest.mark.parametrize("days", [0, 5, 7])
+def test_level_shifts_on_short_history(shift_data, days):
+    dates = shift_data["Order Date"]
+    agent = AnomalyStatAgent(shift_data[dates < dates.min() + pd.Timedelta(days=days)])
+    assert agent.detect_level_shifts().empty
+    assert agent.detect_level_shifts(group_col="Region").empty
+    assert len(agent.anomalies) == 0
+
+
+@pytest.mark.parametrize("window", [10, 60])
+def test_robust_zscore_matches_rolling_apply(multi_entity_data, window):
+    agent = AnomalyStatAgent(multi_entity_data)
+    hits = agent.detect_robust_zscore(group_col="Product ID", window=window)
+
+    # Reference: per-entity pandas rolling .apply (slow, but obviously right)
+    daily = agent.aggregate("Product ID", "Sales").frame
+    rolling = daily.groupby("Product ID")["Sales"].rolling(window, min_periods=1)
+    median = rolling.apply(np.median, raw=True).to_numpy()
+    deviation = pd.Series(np.abs(daily["Sales"].to_numpy() - median), daily.index)
+    mad = (
+        deviation.groupby(daily["Product ID"])
+        .rolling(window, min_periods=1)
+        .apply(np.median, raw=True)
+        .to_numpy()
+    )
+    np.testing.assert_allclose(
+        hits["median"], pd.Series(median, daily.index)[hits.index]
+    )
+    np.testing.assert_allclose(hits["mad"], pd.Series(mad, daily.index)[hits.index])
+
+    # Every injected 5x spike and 95% drop is flagged
+    assert len(hits) >= 60
+    records = agent.get_anomalies_df()
+    assert set(records["detector"]) == {"robust_zscore"}
+    assert (records["level"] == "product id").all()
+
+
+def test_robust_zscore_not_masked_by_clustered_spikes(synthetic_data):
+    df = synthetic_data.copy()
+    df.loc[[84, 86, 88], "Sales"] = 450  # spikes ahead of the one on day 90
+
+    plain = AnomalyStatAgent(df).detect_global_zscore(window=30, threshold=3.5)
+    robust = AnomalyStatAgent(df).detect_robust_zscore(window=30, threshold=3.5)
+
+    assert 500 not in plain["Sales"].values
+    assert {450, 500} <= set(robust["Sales"].round())
+    assert robust["Sales"].min() > 300
+
+
+@pytest.mark.parametrize("case", ["empty", "no_group_keys"])
+def test_grouped_detectors_without_entities(synthetic_data, case):
+    if case == "empty":
+        df = synthetic_data.iloc[:0]
+    else:
+        df = synthetic_data.assign(Region=np.nan)
+    agent = AnomalyStatAgent(df)
+
+    results = [
+        agent.detect_grouped_iqr(group_col="Region"),
+        agent.detect_grouped_iqr(group_col="Region", calendar_fill="zero"),
+        agent.detect_percentage_change(group_col="Region"),
+        agent.detect_percentage_drop(group_col="Region"),
+        agent.detect_percentage_spike(group_col="Region"),
+    ]
+    assert all(r.empty for r in results)
+    assert len(agent.anomalies) == 0
+
+
 if __name__ == "__main__":
     # Allow manual run
     try:
@@ -0,0 +1,139 @@
+import sys
+import os
+import json
+import pytest
+import pandas as pd
+import numpy as np
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from agents.anomaly_stats_agent import AnomalyStatAgent
+from agents.anomaly_writer import AnomalyArtifactWriter, read_anomalies
+
+
+@pytest.fixture
+def region_sales():
+    """120 days of sales for three regions with a handful of spikes."""
+    np.random.seed(11)
+    dates = pd.date_range(start="2024-01-01", periods=120)
+    frames = []
+    for region in ("East", "West", "South"):
+        sales = np.random.normal(500, 40, len(dates))
+        sales[np.random.choice(len(dates), 4, replace=False)] *= 5
+        frames.append(
+            pd.DataFrame({"Order Date": dates, "Sales": sales, "Region": region})
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def _detect(agent):
+    agent.detect_global_zscore(threshold=2.0)
+    agent.detect_grouped_iqr(group_col="Region")
+
+
+def test_streamed_artifacts_match_in_memory_records(region_sales, tmp_path):
+    agent = AnomalyStatAgent(region_sales)
+    out = tmp_path / "anomalies.json"
+    agent.stream_to(str(out), top_n=5)
+    _detect(agent)
+    summary = agent.save_payload(str(out), top_n=5)
+
+    records = agent.anomalies.to_records()
+    assert len(records) > 5
+    with open(tmp_path / "anomalies.jsonl") as f:
+        assert [json.loads(line) for line in f] == records
+
+    ranked = agent.anomalies.to_records(sort_by_score=True)
+    assert summary["top_anomalies"] == ranked[:5]
+    assert summary["count"] == len(records)
+    assert sum(summary["by_detector"].values()) == len(records)
+    with open(out) as f:
+        assert json.load(f) == summary
+
+    frame = read_anomalies(str(tmp_path / "anomalies.parquet"))
+    assert frame["score"].dtype == np.float64
+    assert str(frame["period_start"].iloc[0]) == records[0]["period_start"]
+    assert frame["context"].tolist() == [r["context"] for r in records]
+
+
+def test_save_without_streaming_writes_everything(region_sales, tmp_path):
+    streamed = AnomalyStatAgent(region_sales)
+    streamed.stream_to(str(tmp_path / "a.json"))
+    _detect(streamed)
+
+    batch = AnomalyStatAgent(region_sales)
+    _detect(batch)
+
+    streamed_summary = streamed.save_payload(str(tmp_path / "a.json"))
+    batch_summary = batch.save_payload(str(tmp_path / "b.json"))
+    assert streamed_summary.pop("files") != batch_summary.pop("files")
+    assert streamed_summary == batch_summary
+    assert (tmp_path / "a.jsonl").read_text() == (tmp_path / "b.jsonl").read_text()
+
+
+def test_top_n_heap_keeps_detection_order_on_ties(tmp_path):
+    frame = pd.DataFrame(
+        {
+            "anomaly_id": [f"a{i}" for i in range(6)],
+            "level": "region",
+            "entity_id": "East",
+            "period_start": "2024-01-01",
+            "period_end": "2024-01-01",
+            "metric": "Sales",
+            "value": 1.0,
+            "expected": 1.0,
+            "score": [1.0, 3.0, 3.0, np.nan, 2.0, 3.0],
+            "detector": "iqr",
+            "reason": "",
+        }
+    )
+    with AnomalyArtifactWriter(str(tmp_path / "x.json"), top_n=3) as writer:
+        writer.write_batch(frame.iloc[:3], [{}] * 3)
+        writer.write_batch(frame.iloc[3:], [{}] * 3)
+    assert [r["anomaly_id"] for r in writer.summary["top_anomalies"]] == [
+        "a1",
+        "a2",
+        "a5",
+    ]
+
+
+def test_non_finite_values_are_written_as_null(tmp_path):
+    frame = pd.DataFrame(
+        {
+            "anomaly_id": ["a0", "a1"],
+            "level": "region",
+            "entity_id": "East",
+            "period_start": "2024-01-01",
+            "period_end": "2024-01-01",
+            "metric": "Sales",
+            "value": [np.inf, 5.0],
+            "expected": [np.nan, 1.0],
+            "score": [2.0, -np.inf],
+            "detector": "pct_change",
+            "reason": "",
+        }
+    )
+    contexts = [{"prev": np.nan, "bounds": [1.0, np.float64(np.inf)]}, {}]
+    with AnomalyArtifactWriter(str(tmp_path / "x.json")) as writer:
+        writer.write_batch(frame, contexts)
+
+    # Strict parsing: NaN/Infinity literals are not valid JSON
+    def strict(text):
+        return json.loads(text, parse_constant=pytest.fail)
+
+    with open(tmp_path / "x.jsonl") as f:
+        lines = [strict(line) for line in f]
+    assert [(r["value"], r["expected"], r["score"]) for r in lines] == [
+        (None, None, 2.0),
+        (5.0, 1.0, None),
+    ]
+    assert lines[0]["context"] == {"prev": None, "bounds": [1.0, None]}
+    with open(tmp_path / "x.json") as f:
+        strict(f.read())
+
+    parquet = pq.read_table(tmp_path / "x.parquet")
+    assert parquet.column("value").null_count == 1
+    assert parquet.column("score").null_count == 1
+    assert (
+        read_anomalies(str(tmp_path / "x.parquet"))["context"][0] == lines[0]["context"]
+    )
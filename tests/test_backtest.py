@@ -0,0 +1,75 @@
+import sys
+import os
+import pytest
+import pandas as pd
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from agents.anomaly_stats_agent import AnomalyStatAgent
+from evaluation.backtest import backtest
+
+
+@pytest.fixture
+def labelled_sales():
+    """Daily sales for four regions with one labelled spike and one labelled dip."""
+    np.random.seed(9)
+    dates = pd.date_range(start="2024-01-01", periods=150)
+    frames = []
+    for region in ("East", "West", "South", "Central"):
+        sales = np.random.gamma(20.0, 10.0, len(dates))
+        frames.append(
+            pd.DataFrame({"Order Date": dates, "Sales": sales, "Region": region})
+        )
+    df = pd.concat(frames, ignore_index=True)
+    df.loc[(df["Region"] == "East") & (df["Order Date"] == "2024-03-01"), "Sales"] *= 8
+    df.loc[
+        (df["Region"] == "West") & (df["Order Date"] == "2024-04-10"), "Sales"
+    ] *= 0.05
+    gold = {"2024-03-01|East", "2024-04-10|West"}
+    return df, gold
+
+
+GRID = {
+    "zscore": {"window": [7, 30], "threshold": [2.0, 3.0]},
+    "iqr": {"group_col": ["Region"], "window": [7, 14], "threshold": [1.5, 3.0]},
+    "pct_drop": {"group_col": ["Region"], "threshold": [0.5, 0.9]},
+    "pct_spike": {"group_col": ["Region"], "threshold": [1.0, 3.0]},
+}
+
+
+def _agent_keys(df, detector, group_col, window, threshold):
+    agent = AnomalyStatAgent(df)
+    if detector == "zscore":
+        agent.detect_global_zscore(window=window, threshold=threshold)
+    elif detector == "iqr":
+        agent.detect_grouped_iqr(group_col=group_col, window=window, k=threshold)
+    elif detector == "pct_drop":
+        agent.detect_percentage_drop(group_col=group_col, threshold=threshold)
+    else:
+        agent.detect_percentage_spike(group_col=group_col, threshold=threshold)
+    found = agent.get_anomalies_df()
+    if found.empty:
+        return set()
+    return set(found["period_start"] + "|" + found["entity_id"])
+
+
+def test_sweep_matches_agent_runs(labelled_sales):
+    df, gold = labelled_sales
+    points = backtest(df, gold, grid=GRID, n_workers=1)
+    assert len(points) == 12
+
+    for point in points.itertuples():
+        window = None if pd.isna(point.window) else int(point.window)
+        keys = _agent_keys(df, point.detector, point.group_col, window, point.threshold)
+        assert point.detected == len(keys), point
+        assert point.true_positives == len(keys & gold), point
+
+    best = points.iloc[0]
+    assert best["f1_score"] == points["f1_score"].max() > 0
+
+
+def test_parallel_windows_match_serial(labelled_sales):
+    df, gold = labelled_sales
+    serial = backtest(df, gold, grid=GRID, n_workers=1)
+    parallel = backtest(df, gold, grid=GRID, n_workers=2)
+    pd.testing.assert_frame_equal(serial, parallel)
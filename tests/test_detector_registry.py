@@ -0,0 +1,123 @@
+import sys
+import os
+import concurrent.futures
+import pytest
+import pandas as pd
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from agents.anomaly_stats_agent import AnomalyStatAgent
+from agents.detector_registry import DETECTORS, DetectorRunner, register_detector
+
+
+@pytest.fixture
+def store_sales():
+    """200 days of orders over regions and categories with a few spikes."""
+    np.random.seed(12)
+    n = 4000
+    df = pd.DataFrame(
+        {
+            "Order Date": pd.Timestamp("2024-01-01")
+            + pd.to_timedelta(np.random.randint(0, 200, n), unit="D"),
+            "Region": np.random.choice(["East", "West", "South"], n),
+            "Category": np.random.choice(["Furniture", "Technology"], n),
+            "Sales": np.random.gamma(3.0, 40.0, n),
+        }
+    )
+    df.loc[df.sample(15, random_state=1).index, "Sales"] *= 30
+    return df
+
+
+CONFIG = [
+    {"detector": "zscore", "threshold": 2.0},
+    {"detector": "iqr", "group_col": "Region", "k": 1.5},
+    {"detector": "iqr", "group_col": "Category", "window": 7},
+    {"detector": "pct_change", "group_col": "Category", "drop_threshold": 0.2},
+    "seasonal",
+]
+
+
+def _sequential(df):
+    agent = AnomalyStatAgent(df)
+    agent.detect_global_zscore(threshold=2.0)
+    agent.detect_grouped_iqr(group_col="Region", k=1.5)
+    agent.detect_grouped_iqr(group_col="Category", window=7)
+    agent.detect_percentage_change(group_col="Category", drop_threshold=0.2)
+    agent.detect_seasonal()
+    return agent.get_anomalies_df()
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_runner_matches_sequential_calls(store_sales, executor):
+    agent = AnomalyStatAgent(store_sales)
+    results = DetectorRunner(agent, max_workers=2, executor=executor).run(CONFIG)
+
+    assert len(results) == len(CONFIG)
+    pd.testing.assert_frame_equal(agent.get_anomalies_df(), _sequential(store_sales))
+    # Aggregates were built once, up front, in the parent
+    assert {(None, "Sales"), ("Region", "Sales"), ("Category", "Sales")} <= set(
+        agent._aggregates
+    )
+
+
+def test_default_executor_never_forks(store_sales, monkeypatch):
+    def no_fork(*args, **kwargs):
+        raise AssertionError("process pool used without executor='process'")
+
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", no_fork)
+    agent = AnomalyStatAgent(store_sales)
+    runner = DetectorRunner(agent, max_workers=2)
+    assert runner.executor == "thread"
+
+    runner.run(CONFIG)
+    pd.testing.assert_frame_equal(agent.get_anomalies_df(), _sequential(store_sales))
+
+
+def _large_orders(agent, target_col="Sales", min_value=1000.0):
+    """Plugin detector: flags days whose global total exceeds `min_value`."""
+    daily = agent.aggregate(None, target_col).frame
+    hits = daily[daily[target_col] > min_value]
+    dates = hits["Order Date"].dt.strftime("%Y-%m-%d").tolist()
+    agent.anomalies.append_batch(
+        {
+            "anomaly_id": [f"large_{d}" for d in dates],
+            "level": "global",
+            "entity_id": "All_Regions",
+            "period_start": dates,
+            "period_end": dates,
+            "metric": target_col,
+            "value": hits[target_col].to_numpy(),
+            "expected": min_value,
+            "score": hits[target_col].to_numpy() / min_value,
+            "detector": "large_orders",
+            "reason": "Daily total above limit",
+        }
+    )
+    return hits
+
+
+def test_registered_plugin_runs_from_config(store_sales):
+    register_detector("large_orders", _large_orders)
+    try:
+        spec = DETECTORS["large_orders"]
+        assert spec.defaults == {"target_col": "Sales", "min_value": 1000.0}
+        assert spec.aggregate_key(spec.defaults) == (None, "Sales")
+
+        agent = AnomalyStatAgent(store_sales)
+        (hits,) = DetectorRunner(agent, max_workers=1).run(
+            [{"detector": "large_orders", "min_value": 3000.0}]
+        )
+        assert len(agent.anomalies) == len(hits) > 0
+        assert (hits["Sales"] > 3000.0).all()
+    finally:
+        del DETECTORS["large_orders"]
+
+
+def test_config_errors(store_sales):
+    runner = DetectorRunner(AnomalyStatAgent(store_sales))
+    with pytest.raises(ValueError, match="Unknown detector"):
+        runner.run([{"detector": "nope"}])
+    with pytest.raises(ValueError, match="Unknown parameters"):
+        runner.run([{"detector": "iqr", "treshold": 2}])
+    with pytest.raises(ValueError):
+        DetectorRunner(AnomalyStatAgent(store_sales), executor="gpu")
@@ -0,0 +1,149 @@
+import sys
+import os
+import pytest
+import pandas as pd
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from agents.feature_transforms import FeatureEngineer
+
+
+@pytest.fixture
+def sales_data():
+    """60 days of orders spread over many products, with a few gaps."""
+    np.random.seed(7)
+    n = 600
+    df = pd.DataFrame(
+        {
+            "Order Date": pd.Timestamp("2024-01-01")
+            + pd.to_timedelta(np.random.randint(0, 60, n), unit="D"),
+            "Product ID": np.random.choice([f"P{i}" for i in range(40)], n),
+            "Region": np.random.choice(["East", "West", "South"], n),
+            "Sales": np.random.gamma(2.0, 50.0, n),
+        }
+    )
+    df.loc[df.sample(20, random_state=1).index, "Sales"] = np.nan
+    return df
+
+
+@pytest.mark.parametrize("group_by", ["Region", "Product ID", ["Region", "Product ID"]])
+@pytest.mark.parametrize("window", [1, 3, 14])
+def test_grouped_rolling_matches_pandas(sales_data, group_by, window):
+    fe = FeatureEngineer(sales_data)
+    expected = fe.df.groupby(group_by)["Sales"].transform(
+        lambda x: x.rolling(window=window, min_periods=1).mean()
+    )
+
+    out = fe.add_rolling_metrics("Sales", window=window, group_by=group_by)
+
+    np.testing.assert_allclose(
+        out[f"Sales_Rolling_{window}"], expected, rtol=1e-9, equal_nan=True
+    )
+
+
+def test_grouped_rolling_missing_group_is_nan(sales_data):
+    missing = [0, 1, 2, 3, 4]
+    sales_data.loc[missing, "Region"] = None
+    out = FeatureEngineer(sales_data).add_rolling_metrics("Sales", 3, "Region")
+
+    assert out.loc[missing, "Sales_Rolling_3"].isna().all()
+    assert out.drop(index=missing)["Sales_Rolling_3"].notna().any()
+
+
+def test_build_matches_chained_calls(sales_data):
+    chained = FeatureEngineer(sales_data)
+    chained.add_time_features()
+    chained.add_rolling_metrics("Sales", window=3, group_by="Region")
+    chained.add_rolling_metrics("Sales", window=7)
+    chained.add_lag_features("Sales", lag=1)
+
+    built = FeatureEngineer(sales_data).build(
+        [
+            {"kind": "time"},
+            {"kind": "rolling", "target": "Sales", "window": 3, "group_by": "Region"},
+            {"kind": "rolling", "target": "Sales", "window": 7},
+            {"kind": "lag", "target": "Sales", "lag": 1},
+            {"kind": "growth", "target": "Sales", "lag": 1},
+        ]
+    )
+
+    expected = chained.get_engineered_data()
+    assert list(built.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(built, expected, check_exact=False, rtol=1e-9)
+
+
+def test_build_fans_out_and_rejects_duplicates(sales_data):
+    fe = FeatureEngineer(sales_data)
+    features = fe.compute_features(
+        [
+            {
+                "kind": "rolling",
+                "target": ["Sales"],
+                "window": [3, 7],
+                "group_by": "Product ID",
+                "stat": "std",
+            }
+        ]
+    )
+    assert list(features.columns) == ["Sales_Rolling_Std_3", "Sales_Rolling_Std_7"]
+    assert fe.df.shape[1] == sales_data.shape[1]
+
+    with pytest.raises(ValueError):
+        fe.compute_features(
+            [
+                {"kind": "lag", "target": "Sales", "lag": 1},
+                {"kind": "lag", "target": "Sales", "lag": [1, 2]},
+            ]
+        )
+
+    # An unsupported stat is rejected the same way with or without group_by
+    for group_by in (None, "Region"):
+        with pytest.raises(ValueError, match="rolling stat"):
+            fe.compute_features(
+                [{"kind": "rolling", "window": 3, "group_by": group_by, "stat": "max"}]
+            )
+
+
+def test_grouped_lags_stay_within_group(sales_data):
+    fe = FeatureEngineer(sales_data)
+    out = fe.add_lag_features("Sales", lag=[1, 3], group_by="Region")
+
+    for lag in (1, 3):
+        expected = fe.df.groupby("Region")["Sales"].shift(lag)
+        np.testing.assert_allclose(out[f"Sales_Lag_{lag}"], expected.fillna(0))
+
+    growth = (fe.df["Sales"] - expected) / expected * 100
+    np.testing.assert_allclose(out["Sales_Growth_Pct_3"], growth.fillna(0))
+
+
+def test_single_lag_keeps_legacy_columns(sales_data):
+    out = FeatureEngineer(sales_data).add_lag_features("Sales", lag=2)
+
+    assert "Sales_Lag_2" in out.columns
+    assert "Sales_Growth_Pct" in out.columns
+    np.testing.assert_allclose(out["Sales_Lag_2"], out["Sales"].shift(2).fillna(0))
+
+
+def test_feature_store_reuses_and_extends(sales_data, tmp_path):
+    from agents.feature_store import FeatureStore
+
+    store = FeatureStore(root_dir=str(tmp_path))
+    spec = [
+        {"kind": "rolling", "target": "Sales", "window": [3, 7], "group_by": "Region"}
+    ]
+
+    first = store.build(sales_data, spec)
+    expected = FeatureEngineer(sales_data).build(spec)
+    pd.testing.assert_frame_equal(first, expected)
+    assert store.stats == {"hits": 0, "misses": 2}
+
+    # Same snapshot, one extra feature: only the new one is computed
+    spec.append({"kind": "lag", "target": "Sales", "lag": 1, "group_by": "Region"})
+    second = store.get_features(sales_data, spec)
+    assert store.stats == {"hits": 2, "misses": 3}
+    assert list(second.columns) == ["Sales_Rolling_3", "Sales_Rolling_7", "Sales_Lag_1"]
+
+    # A changed snapshot gets its own key
+    changed = sales_data.copy()
+    changed.loc[0, "Sales"] = 1e6
+    assert store.snapshot_hash(changed) != store.snapshot_hash(sales_data)
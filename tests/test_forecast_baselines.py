@@ -0,0 +1,125 @@
+import sys
+import os
+import math
+import pytest
+import pandas as pd
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from agents.anomaly_stats_agent import AnomalyStatAgent
+from agents.forecast_baselines import exponential_smoothing
+
+
+def _scalar_holt_winters(series, alpha, beta, gamma, season, var_alpha, min_periods):
+    """Textbook one-series loop: forecasts and error stds before each value."""
+    level, trend, seasonal = None, 0.0, [0.0] * season
+    var, seen = 0.0, 0
+    forecast, sigma = [], []
+    for t, x in enumerate(series):
+        s = seasonal[t % season]
+        f = math.nan if level is None else level + trend + s
+        forecast.append(f)
+        sigma.append(math.sqrt(var) if seen >= min_periods else math.nan)
+        if math.isnan(x):
+            if level is not None:
+                level += trend
+            continue
+        if level is None:
+            level = x
+            continue
+        err = x - f
+        seen += 1
+        var += (err * err - var) / min(seen, 1 / var_alpha)
+        new_level = alpha * (x - s) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        seasonal[t % season] = gamma * (x - new_level) + (1 - gamma) * s
+        level = new_level
+    return np.array(forecast), np.array(sigma)
+
+
+@pytest.fixture
+def weekly_matrix():
+    """200 days x 5 series with a weekly cycle, late starts and missing days."""
+    np.random.seed(21)
+    t = np.arange(200)[:, None]
+    matrix = 500 + 80 * np.sin(2 * np.pi * t / 7) + np.random.normal(0, 20, (200, 5))
+    matrix[:40, 1] = np.nan
+    matrix[np.random.rand(200, 5) < 0.1] = np.nan
+    return matrix
+
+
+def test_matches_scalar_recurrence(weekly_matrix):
+    fit = exponential_smoothing(weekly_matrix, alphas=(0.2, 0.5), min_periods=10)
+    assert fit.forecast.shape == fit.sigma.shape == weekly_matrix.shape
+
+    for col, alpha in enumerate(fit.alpha):
+        forecast, sigma = _scalar_holt_winters(
+            weekly_matrix[:, col], alpha, 0.02, 0.1, 7, 0.05, 10
+        )
+        np.testing.assert_allclose(fit.forecast[:, col], forecast)
+        np.testing.assert_allclose(fit.sigma[:, col], sigma)
+
+
+def test_season_tightens_intervals(weekly_matrix):
+    ses = exponential_smoothing(weekly_matrix, model="ses")
+    hw = exponential_smoothing(weekly_matrix, model="holt_winters")
+    # Holt-Winters learns the weekly cycle, so its one-step errors approach
+    # the noise (std 20) while SES keeps paying for the season
+    assert np.nanmedian(hw.sigma[-20:]) < 30 < np.nanmedian(ses.sigma[-20:])
+    with pytest.raises(ValueError):
+        exponential_smoothing(weekly_matrix, model="arima")
+
+
+@pytest.fixture
+def regional_sales():
+    """150 days of sales for two regions with a weekend lift."""
+    np.random.seed(5)
+    dates = pd.date_range(start="2024-01-01", periods=150)
+    frames = []
+    for region in ("East", "West"):
+        sales = 1000 + 200 * (dates.dayofweek >= 5) + np.random.normal(0, 30, 150)
+        frames.append(
+            pd.DataFrame({"Order Date": dates, "Sales": sales, "Region": region})
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_forecast_detector_uses_forecast_as_expected(regional_sales):
+    df = regional_sales.copy()
+    df.loc[(df["Region"] == "West") & (df["Order Date"] == "2024-04-20"), "Sales"] *= 3
+
+    agent = AnomalyStatAgent(df)
+    hits = agent.detect_forecast(group_col="Region")
+    records = agent.get_anomalies_df()
+
+    spike = records[records["period_start"] == "2024-04-20"]
+    assert list(spike["entity_id"]) == ["West"]
+    # 2024-04-20 is a Saturday: the expected value includes the weekend lift
+    assert 1100 < spike.iloc[0]["expected"] < 1300
+    assert spike.iloc[0]["context"]["upper"] < spike.iloc[0]["value"]
+    assert len(hits) <= 3
+
+
+def test_empty_input(regional_sales):
+    fit = exponential_smoothing(np.empty((0, 3)))
+    assert fit.forecast.shape == fit.sigma.shape == (0, 3)
+    assert fit.alpha.shape == (3,)
+
+    agent = AnomalyStatAgent(regional_sales.iloc[:0])
+    assert agent.detect_forecast().empty
+    assert agent.detect_forecast(group_col="Region").empty
+    assert len(agent.anomalies) == 0
+
+
+def test_series_shorter_than_warm_up(regional_sales):
+    # 10 days: past one weekly season, short of min_periods (28) error history
+    df = regional_sales[regional_sales["Order Date"] < "2024-01-11"].copy()
+    df.loc[df["Order Date"] == "2024-01-10", "Sales"] *= 10
+
+    fit = exponential_smoothing(np.ones((10, 2)), min_periods=14)
+    assert np.isnan(fit.sigma).all()
+
+    agent = AnomalyStatAgent(df)
+    assert agent.detect_forecast().empty
+    assert agent.detect_forecast(group_col="Region").empty
+    assert len(agent.anomalies) == 0
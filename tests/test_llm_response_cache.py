@@ -0,0 +1,44 @@
+import sys
+import os
+import time
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from agents.llm_response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(tmp_path, ttl_seconds=60, max_entries=3)
+
+
+def test_keys_cover_model_and_version():
+    base = ResponseCache.key("prompt", "gemini", "1.1")
+    assert base == ResponseCache.key("prompt", "gemini", "1.1")
+    assert base != ResponseCache.key("prompt", "gemini", "1.2")
+    assert base != ResponseCache.key("prompt", "other", "1.1")
+    assert base != ResponseCache.key("prompt!", "gemini", "1.1")
+
+
+def test_expired_entries_miss(cache):
+    cache.put("k", {"explanation_short": "ok"})
+    assert cache.get("k") == {"explanation_short": "ok"}
+
+    cache.ttl_seconds = 0
+    time.sleep(0.01)
+    assert cache.get("k") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted(cache, tmp_path):
+    for i in range(3):
+        cache.put(f"k{i}", {"n": i})
+        time.sleep(0.01)
+    cache.get("k0")  # k1 is now the least recently used
+    cache.put("k3", {"n": 3})
+
+    assert cache.get("k1") is None
+    assert [cache.get(k)["n"] for k in ("k0", "k2", "k3")] == [0, 2, 3]
+
+    # The index is rebuilt from disk
+    assert len(ResponseCache(tmp_path, max_entries=3)) == 3
@@ -0,0 +1,80 @@
+import sys
+import os
+import pytest
+import pandas as pd
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from agents.rolling_quantiles import (
+    SORT_KERNEL_MAX_WINDOW,
+    SortedWindow,
+    rolling_quantiles,
+    segment_offsets,
+)
+
+
+@pytest.fixture
+def segmented():
+    """200 series of uneven length laid out back to back, a few NaNs."""
+    rng = np.random.default_rng(3)
+    lengths = rng.integers(1, 90, 200)
+    n = int(lengths.sum())
+    starts = np.r_[0, np.cumsum(lengths)[:-1]]
+    values = rng.gamma(2.0, 50.0, n)
+    values[rng.random(n) < 0.05] = np.nan
+    return values, segment_offsets(starts, n)
+
+
+QUANTILES = (0.0, 0.25, 0.5, 0.75, 1.0)
+
+
+@pytest.mark.parametrize("window", [1, 3, 14, SORT_KERNEL_MAX_WINDOW + 1, 120])
+def test_exact_matches_pandas(segmented, window):
+    values, offset = segmented
+    rolling = (
+        pd.Series(values)
+        .groupby(np.cumsum(offset == 0))
+        .rolling(window=window, min_periods=1)
+    )
+    expected = np.column_stack([rolling.quantile(q).to_numpy() for q in QUANTILES])
+
+    out = rolling_quantiles(values, offset, window, QUANTILES)
+
+    np.testing.assert_array_equal(out, expected)
+
+
+def test_approx_is_exact_for_short_windows_and_in_range_otherwise(segmented):
+    values, offset = segmented
+    exact = rolling_quantiles(values, offset, 10, (0.25, 0.75))
+    approx = rolling_quantiles(values, offset, 10, (0.25, 0.75), method="approx")
+    np.testing.assert_array_equal(approx, exact)
+
+    # Thinned windows still pick values from inside the true window range
+    lo, hi = rolling_quantiles(values, offset, 90, (0.0, 1.0)).T
+    approx = rolling_quantiles(values, offset, 90, (0.25, 0.75), method="approx")
+    ok = ~np.isnan(approx).any(axis=1)
+    assert ok.mean() > 0.95
+    assert (approx[ok] >= lo[ok, None]).all() and (approx[ok] <= hi[ok, None]).all()
+
+    with pytest.raises(ValueError):
+        rolling_quantiles(values, offset, 10, (0.5,), method="tdigest")
+
+
+def test_sorted_window_tracks_trailing_values():
+    rng = np.random.default_rng(0)
+    stream = rng.normal(size=60)
+    window = SortedWindow(7)
+    expected = pd.Series(stream).rolling(7, min_periods=1).quantile(0.25)
+
+    for i, x in enumerate(stream):
+        evicted = window.push(x)
+        assert evicted == (stream[i - 7] if i >= 7 else None)
+        assert window.sorted == sorted(stream[max(0, i - 6) : i + 1])
+        assert window.quantile(0.25) == pytest.approx(expected[i], abs=1e-12)
+
+
+def test_sorted_window_rejects_windows_past_the_cap():
+    SortedWindow(SortedWindow.MAX_WINDOW)
+    for size in (0, SortedWindow.MAX_WINDOW + 1):
+        with pytest.raises(ValueError):
+            SortedWindow(size)
@@ -0,0 +1,51 @@
+import sys
+import os
+import pytest
+import pandas as pd
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from agents.anomaly_stats_agent import AnomalyStatAgent
+from agents.sharded_detector import ShardedDetector, shard_of
+
+
+@pytest.fixture
+def many_products():
+    """80 days of gappy sales for 200 products with injected spikes and drops."""
+    np.random.seed(5)
+    n = 12000
+    df = pd.DataFrame(
+        {
+            "Order Date": pd.Timestamp("2024-01-01")
+            + pd.to_timedelta(np.random.randint(0, 80, n), unit="D"),
+            "Product ID": np.random.choice([f"P{i:03d}" for i in range(200)], n),
+            "Sales": np.random.gamma(4.0, 25.0, n),
+        }
+    )
+    df.loc[df.sample(60, random_state=2).index, "Sales"] *= 20
+    return df
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_sharded_matches_single_process(many_products, n_workers):
+    single = AnomalyStatAgent(many_products)
+    iqr = single.detect_grouped_iqr("Product ID", window=14)
+    pct = single.detect_percentage_change(group_col="Product ID")
+
+    agent = AnomalyStatAgent(many_products)
+    with ShardedDetector(agent, n_workers=n_workers) as sharded:
+        sharded_iqr = sharded.detect_grouped_iqr("Product ID", window=14)
+        sharded_pct = sharded.detect_percentage_change(group_col="Product ID")
+
+    assert len(iqr) > 0 and len(pct) > 0
+    pd.testing.assert_frame_equal(sharded_iqr, iqr)
+    pd.testing.assert_frame_equal(sharded_pct, pct)
+    pd.testing.assert_frame_equal(agent.get_anomalies_df(), single.get_anomalies_df())
+
+
+def test_shard_assignment_is_stable():
+    entities = [f"P{i}" for i in range(50)]
+    first = shard_of(entities, 8)
+    assert (first == shard_of(entities, 8)).all()
+    assert first.min() >= 0 and first.max() < 8
+    assert len(set(first)) > 1
@@ -0,0 +1,111 @@
+import sys
+import os
+import json
+import pytest
+import pandas as pd
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from agents.anomaly_stats_agent import AnomalyStatAgent
+from agents.streaming_detector import StreamingAnomalyDetector, WindowMoments
+
+
+@pytest.fixture
+def orders():
+    """150 days of orders for 4 regions with injected spikes and drops."""
+    np.random.seed(11)
+    dates = pd.date_range(start="2024-01-01", periods=150)
+    rows = []
+    for region in ["East", "West", "South", "Central"]:
+        sales = np.random.normal(200, 25, len(dates))
+        sales[np.random.choice(len(dates), 4, replace=False)] *= [4.0, 0.1, 3.0, 0.2]
+        rows.append(
+            pd.DataFrame({"Order Date": dates, "Region": region, "Sales": sales})
+        )
+    return pd.concat(rows, ignore_index=True)
+
+
+def batch_ids(df):
+    agent = AnomalyStatAgent(df)
+    agent.detect_global_zscore(window=30, threshold=3.0)
+    agent.detect_grouped_iqr(group_col="Region", window=14, k=1.5)
+    agent.detect_percentage_change(group_col="Region")
+    return set(agent.get_anomalies_df()["anomaly_id"])
+
+
+def test_streaming_matches_batch_detectors(orders):
+    stream = StreamingAnomalyDetector(group_col="Region")
+    found = stream.update(orders)
+
+    assert len(found) > 0
+    assert set(found["anomaly_id"]) == batch_ids(orders)
+
+
+def test_checkpoint_resume_scores_only_new_days(orders, tmp_path):
+    dates = sorted(orders["Order Date"].unique())
+    history = orders[orders["Order Date"] < dates[120]]
+    recent = orders[orders["Order Date"] >= dates[120]]
+
+    stream = StreamingAnomalyDetector(group_col="Region")
+    stream.update(history, emit=False)
+    ckpt = tmp_path / "stream_state.json"
+    stream.save_checkpoint(str(ckpt))
+
+    resumed = StreamingAnomalyDetector.load_checkpoint(str(ckpt))
+    found = pd.concat(
+        [resumed.update(recent[recent["Order Date"] == d]) for d in dates[120:]]
+    )
+
+    expected = {i for i in batch_ids(orders) if i.split("_")[-2] >= "2024-04-30"}
+    assert set(found["anomaly_id"]) == expected
+
+    # Replaying an already processed day is ignored
+    assert resumed.update(recent[recent["Order Date"] == dates[-1]]).empty
+
+
+def test_day_without_group_keys_still_scores_globally(orders):
+    stream = StreamingAnomalyDetector(group_col="Region")
+    stream.update(orders, emit=False)
+
+    day = orders[orders["Order Date"] == orders["Order Date"].max()].copy()
+    day["Order Date"] += pd.Timedelta(days=1)
+    day["Region"] = None
+    day["Sales"] *= 5
+    found = stream.update(day)
+
+    assert list(found["detector"]) == ["zscore"]
+    assert stream.last_date == day["Order Date"].iloc[0]
+    assert set(stream.entity_state) == {"East", "West", "South", "Central"}
+
+
+def test_window_moments_match_pandas_rolling():
+    stream = np.random.default_rng(3).normal(100, 10, 400)
+    moments = WindowMoments(365)
+    rolling = pd.Series(stream).rolling(365, min_periods=1)
+    mean, std = rolling.mean(), rolling.std()
+
+    for i, x in enumerate(stream):
+        moments.push(x)
+        assert moments.mean == pytest.approx(mean[i], rel=1e-9)
+        if i:
+            assert moments.std() == pytest.approx(std[i], rel=1e-9)
+    assert not hasattr(moments, "sorted")
+
+    with pytest.raises(ValueError):
+        StreamingAnomalyDetector(iqr_window=10**6)
+
+
+def test_loads_version_1_checkpoint(orders, tmp_path):
+    stream = StreamingAnomalyDetector(group_col="Region")
+    stream.update(orders, emit=False)
+    state = stream.state_dict()
+    # Version 1 stored Welford accumulators for every entity window too
+    state["__state_version"] = "1"
+    for saved in state["entities"].values():
+        saved["window"].update(mean=0.0, m2=0.0)
+    ckpt = tmp_path / "v1.json"
+    ckpt.write_text(json.dumps(state))
+
+    resumed = StreamingAnomalyDetector.load_checkpoint(str(ckpt))
+    assert resumed.state_dict()["entities"] == stream.state_dict()["entities"]
+    assert resumed.global_state.mean == stream.global_state.mean